@@ -5,15 +5,17 @@ Implementa JWT, verificação de usuários e controle de acesso por perfis com P
 
 import os
 import jwt
+import asyncio
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
 
-from database import get_db
+from database import get_async_db
 from models import User
 
 # Configurações
@@ -92,21 +94,22 @@ def verify_token(token: str) -> Dict[str, Any]:
         )
 
 # Funções de usuário
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     """Buscar usuário por email"""
-    return db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
 
-def create_user(db: Session, user: UserCreate) -> User:
+async def create_user(db: AsyncSession, user: UserCreate) -> User:
     """Criar novo usuário"""
     # Verificar se usuário já existe
-    if get_user_by_email(db, user.email):
+    if await get_user_by_email(db, user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email já cadastrado"
         )
     
-    # Criar usuário
-    hashed_password = get_password_hash(user.password)
+    # Criar usuário (bcrypt é custoso em CPU, executar fora do event loop)
+    hashed_password = await asyncio.to_thread(get_password_hash, user.password)
     db_user = User(
         email=user.email,
         name=user.name,
@@ -115,23 +118,23 @@ def create_user(db: Session, user: UserCreate) -> User:
         is_active=True
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
     """Autenticar usuário"""
-    user = get_user_by_email(db, email)
+    user = await get_user_by_email(db, email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await asyncio.to_thread(verify_password, password, user.hashed_password):
         return None
     return user
 
 # Dependencies
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """Dependency para obter usuário atual do token"""
     token = credentials.credentials
@@ -144,7 +147,7 @@ def get_current_user(
             detail="Token inválido"
         )
     
-    user = get_user_by_email(db, email)
+    user = await get_user_by_email(db, email)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -155,7 +158,7 @@ def get_current_user(
 
 def verify_role(required_role: str):
     """Dependency para verificar role do usuário"""
-    def role_checker(current_user: User = Depends(get_current_user)) -> User:
+    async def role_checker(current_user: User = Depends(get_current_user)) -> User:
         if current_user.role != required_role:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -164,7 +167,7 @@ def verify_role(required_role: str):
         return current_user
     return role_checker
 
-def verify_admin(current_user: User = Depends(get_current_user)) -> User:
+async def verify_admin(current_user: User = Depends(get_current_user)) -> User:
     """Dependency para verificar se usuário é admin"""
     if current_user.role != "admin":
         raise HTTPException(
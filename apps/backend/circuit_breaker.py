@@ -0,0 +1,203 @@
+"""
+Circuit breaker para chamadas a serviços externos
+Estados closed → open → half_open, com limiares de taxa de erro e de chamadas lentas
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, Callable, List, Set
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Chamada recusada porque o circuito está aberto"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuito '{name}' aberto. Nova tentativa em {retry_after:.0f}s")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker com janela deslizante das últimas chamadas
+
+    O circuito abre quando, com pelo menos min_calls na janela, a taxa de falhas
+    ou a taxa de chamadas lentas ultrapassa o limiar. Aberto, recusa chamadas
+    imediatamente (CircuitOpenError) por open_seconds; depois passa a half_open e
+    permite até half_open_max_calls chamadas de teste: sucesso fecha, falha reabre.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 20.0,
+        slow_call_rate_threshold: float = 0.8,
+        min_calls: int = 5,
+        window_size: int = 20,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = CLOSED
+        self._calls: deque = deque(maxlen=window_size)  # (falhou, lenta)
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self._listeners: List[Callable[[str, str], Any]] = []
+        # Listeners assíncronos em andamento (referência mantida até terminarem)
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {"rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        """Estado atual (open passa a half_open quando o tempo de espera termina)"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    @property
+    def awaiting_probe(self) -> bool:
+        """half_open sem chamada de teste em andamento (nada decidiu o estado ainda)"""
+        return self.state == HALF_OPEN and self._half_open_in_flight == 0
+
+    @property
+    def retry_after(self) -> float:
+        """Segundos até o circuito aceitar chamadas de teste"""
+        if self._state != OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def add_listener(self, callback: Callable[[str, str], Any]):
+        """Registra callback(estado_anterior, novo_estado); corrotinas são agendadas no loop"""
+        self._listeners.append(callback)
+
+    def before_call(self):
+        """
+        Verifica se a chamada pode ser feita
+
+        Raises:
+            CircuitOpenError: Se o circuito estiver aberto (ou sem vagas de teste)
+        """
+        state = self.state
+
+        if state == OPEN:
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(self.name, self.retry_after)
+
+        if state == HALF_OPEN:
+            if self._half_open_in_flight >= self.half_open_max_calls:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._half_open_in_flight += 1
+
+    def record_success(self, duration_seconds: float):
+        """Registra chamada bem-sucedida (lenta se passar de slow_call_seconds)"""
+        slow = duration_seconds >= self.slow_call_seconds
+
+        if self._state == HALF_OPEN:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            if slow:
+                self._open()
+                return
+            self._half_open_successes += 1
+            if self._half_open_successes >= self.half_open_max_calls:
+                self._transition(CLOSED)
+            return
+
+        self._calls.append((False, slow))
+        self._evaluate()
+
+    def record_failure(self):
+        """Registra chamada com falha"""
+        if self._state == HALF_OPEN:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            self._open()
+            return
+
+        self._calls.append((True, False))
+        self._evaluate()
+
+    def release(self):
+        """Libera vaga de teste de uma chamada que não chegou a ser avaliada"""
+        if self._state == HALF_OPEN:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def _evaluate(self):
+        if self._state != CLOSED or len(self._calls) < self.min_calls:
+            return
+
+        total = len(self._calls)
+        failure_rate = sum(1 for failed, _ in self._calls if failed) / total
+        slow_rate = sum(1 for _, slow in self._calls if slow) / total
+
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            logger.warning(
+                f"Circuito '{self.name}' aberto: taxa de falhas {failure_rate:.0%}, "
+                f"chamadas lentas {slow_rate:.0%}"
+            )
+            self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        self._transition(OPEN)
+
+    def _transition(self, new_state: str):
+        old_state = self._state
+        if old_state == new_state and new_state != OPEN:
+            return
+
+        self._state = new_state
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        if new_state == CLOSED:
+            self._calls.clear()
+
+        logger.info(f"Circuito '{self.name}': {old_state} → {new_state}")
+
+        for callback in self._listeners:
+            try:
+                result = callback(old_state, new_state)
+                if asyncio.iscoroutine(result):
+                    task = asyncio.get_running_loop().create_task(result)
+                    self._tasks.add(task)
+                    task.add_done_callback(self._listener_done)
+            except Exception as e:
+                logger.error(f"Erro no listener do circuito '{self.name}': {str(e)}")
+
+    def _listener_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Erro no listener do circuito '{self.name}': {str(task.exception())}")
+
+    def get_status(self) -> Dict[str, Any]:
+        total = len(self._calls)
+        return {
+            "state": self.state,
+            "retry_after_seconds": round(self.retry_after, 1),
+            "window_calls": total,
+            "failure_rate": round(sum(1 for failed, _ in self._calls if failed) / total, 3) if total else 0.0,
+            "slow_call_rate": round(sum(1 for _, slow in self._calls if slow) / total, 3) if total else 0.0,
+            "failure_rate_threshold": self.failure_rate_threshold,
+            "slow_call_seconds": self.slow_call_seconds,
+            "slow_call_rate_threshold": self.slow_call_rate_threshold,
+            "open_seconds": self.open_seconds,
+            **self.stats
+        }
@@ -0,0 +1,85 @@
+"""
+Campos selecionáveis dos documentos nas respostas da API (fields= / include=)
+Cada campo público mapeia para uma coluna: só as colunas pedidas são lidas do banco
+(load_only) e serializadas na resposta
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import load_only, selectinload
+
+from models import Document, DocumentPayload
+
+# Campo público -> coluna de documents
+DOCUMENT_FIELDS = {
+    "id": Document.id,
+    "document_type": Document.document_type,
+    "original_filename": Document.original_filename,
+    "status": Document.status,
+    "confidence_score": Document.confidence_score,
+    "created_at": Document.created_at,
+    "updated_at": Document.updated_at,
+    "error_message": Document.error_message,
+    "file_size": Document.file_size,
+    "insights_status": Document.insights_status,
+    "gpt_generated_at": Document.gpt_generated_at,
+}
+
+# Campos em document_payloads: a tabela só é lida quando algum deles é pedido
+PAYLOAD_FIELDS = {
+    "extracted_data": DocumentPayload.extracted_data,
+    "gpt_summary": DocumentPayload.gpt_summary,
+    "gpt_insights": DocumentPayload.gpt_insights,
+}
+
+# Colunas largas (JSON): fora da listagem a menos que pedidas em include=
+HEAVY_FIELDS = tuple(PAYLOAD_FIELDS)
+
+LIST_FIELDS = ("id", "document_type", "original_filename", "status", "confidence_score", "created_at")
+DETAIL_FIELDS = LIST_FIELDS + ("extracted_data",)
+
+
+def _parse(value: Optional[str]) -> Tuple[str, ...]:
+    names = tuple(name.strip() for name in (value or "").split(",") if name.strip())
+    unknown = [name for name in names if name not in DOCUMENT_FIELDS and name not in PAYLOAD_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos desconhecidos: {', '.join(unknown)}")
+    return names
+
+
+def resolve_fields(fields: Optional[str], include: Optional[str], default: Sequence[str]) -> Tuple[str, ...]:
+    """
+    Campos da resposta: fields substitui o conjunto padrão, include acrescenta a ele
+
+    Raises:
+        ValueError: Se algum campo não existe
+    """
+    selected = _parse(fields) or tuple(default)
+    selected += tuple(name for name in _parse(include) if name not in selected)
+    return ("id",) + tuple(name for name in selected if name != "id")
+
+
+def fields_options(selected: Sequence[str], *required) -> List:
+    """
+    load_only das colunas dos campos (mais as exigidas pela consulta, ex.: cursor) e,
+    se algum campo de document_payloads foi pedido, selectinload só dessas colunas
+    """
+    options = [load_only(*(DOCUMENT_FIELDS[name] for name in selected if name in DOCUMENT_FIELDS), *required)]
+
+    payload_columns = [PAYLOAD_FIELDS[name] for name in selected if name in PAYLOAD_FIELDS]
+    if payload_columns:
+        options.append(selectinload(Document.payload).load_only(*payload_columns))
+
+    return options
+
+
+def serialize_document(document: Document, selected: Sequence[str]) -> Dict[str, Any]:
+    """Documento com apenas os campos selecionados (colunas não carregadas não são acessadas)"""
+    result = {}
+    for name in selected:
+        value = getattr(document, name)
+        if name == "extracted_data":
+            value = value or {}
+        elif name in ("created_at", "updated_at", "gpt_generated_at"):
+            value = value.isoformat() if value else None
+        result[name] = value
+    return result
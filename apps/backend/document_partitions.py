@@ -0,0 +1,298 @@
+"""
+Particionamento mensal da tabela documents (RANGE em created_at)
+Cria as partições dos próximos meses com antecedência e arquiva partições frias
+(DETACH para um schema separado, junto com os payloads dos documentos)
+"""
+import os
+import random
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações
+DOCUMENT_PARTITIONS_ENABLED = os.getenv("DOCUMENT_PARTITIONS_ENABLED", "true").lower() == "true"
+DOCUMENT_PARTITIONS_MONTHS_AHEAD = int(os.getenv("DOCUMENT_PARTITIONS_MONTHS_AHEAD", "3"))
+DOCUMENT_PARTITIONS_CHECK_INTERVAL_SECONDS = float(os.getenv("DOCUMENT_PARTITIONS_CHECK_INTERVAL_SECONDS", "21600"))
+# Partições com mais de N meses vão para o schema de arquivo (0 = não arquiva automaticamente)
+DOCUMENT_ARCHIVE_AFTER_MONTHS = int(os.getenv("DOCUMENT_ARCHIVE_AFTER_MONTHS", "0"))
+DOCUMENT_ARCHIVE_SCHEMA = os.getenv("DOCUMENT_ARCHIVE_SCHEMA", "archive")
+# Espaço livre por página: updates de status cabem na mesma página (HOT)
+DOCUMENTS_FILLFACTOR = 80
+
+PARTITION_PREFIX = "documents_p"
+
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y_%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Mês de uma partição pelo nome (None se não segue a convenção)"""
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX):], "%Y_%m").date() if name.startswith(PARTITION_PREFIX) else None
+    except ValueError:
+        return None
+
+
+def partition_bounds(month: date) -> Tuple[datetime, datetime]:
+    """Intervalo [início, fim) da partição, em UTC"""
+    start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    end_month = add_months(month, 1)
+    return start, datetime(end_month.year, end_month.month, 1, tzinfo=timezone.utc)
+
+
+def create_partition_sql(month: date) -> str:
+    start, end = partition_bounds(month)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF documents "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}') "
+        f"WITH (fillfactor = {DOCUMENTS_FILLFACTOR})"
+    )
+
+
+class DocumentPartitionManager:
+    """
+    Manutenção das partições mensais de documents
+
+    - ensure_partitions: cria a partição do mês atual e dos próximos meses (inserções
+      nunca caem fora de uma partição).
+    - archive_partitions: desanexa as partições mais antigas que o limite (DETACH
+      CONCURRENTLY, sem bloquear leituras e escritas na tabela) e as move, com os
+      payloads dos seus documentos, para o schema de arquivo. As estatísticas por
+      usuário são recalculadas em seguida. Arquivamentos interrompidos (DETACH
+      pendente ou partição desanexada que não chegou ao schema de arquivo) são
+      retomados na execução seguinte.
+
+    Só atua no PostgreSQL quando documents é de fato particionada.
+    """
+
+    def __init__(
+        self,
+        engine=None,
+        months_ahead: int = DOCUMENT_PARTITIONS_MONTHS_AHEAD,
+        archive_after_months: int = DOCUMENT_ARCHIVE_AFTER_MONTHS,
+        archive_schema: str = DOCUMENT_ARCHIVE_SCHEMA,
+        interval: float = DOCUMENT_PARTITIONS_CHECK_INTERVAL_SECONDS
+    ):
+        self._engine = engine
+        self.months_ahead = months_ahead
+        self.archive_after_months = archive_after_months
+        self.archive_schema = archive_schema
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"created": 0, "archived": 0, "errors": 0}
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from database import async_engine
+            self._engine = async_engine
+        return self._engine
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def is_partitioned(self) -> bool:
+        if self.engine.dialect.name != "postgresql":
+            return False
+        async with self.engine.connect() as conn:
+            return bool(await conn.scalar(text("""
+                SELECT 1 FROM pg_partitioned_table
+                WHERE partrelid = to_regclass('documents')
+            """)))
+
+    async def list_partitions(self) -> List[str]:
+        async with self.engine.connect() as conn:
+            rows = await conn.execute(text("""
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = to_regclass('documents')
+                ORDER BY child.relname
+            """))
+            return [row[0] for row in rows]
+
+    async def pending_detach_partitions(self) -> List[str]:
+        """Partições com DETACH CONCURRENTLY interrompido (precisam de FINALIZE)"""
+        async with self.engine.connect() as conn:
+            rows = await conn.execute(text("""
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = to_regclass('documents')
+                  AND pg_inherits.inhdetachpending
+                ORDER BY child.relname
+            """))
+            return [row[0] for row in rows]
+
+    async def detached_partitions(self) -> List[str]:
+        """Partições já desanexadas que ainda não foram movidas para o schema de arquivo"""
+        async with self.engine.connect() as conn:
+            rows = await conn.execute(text("""
+                SELECT child.relname FROM pg_class child
+                WHERE child.relnamespace = (SELECT relnamespace FROM pg_class WHERE oid = to_regclass('documents'))
+                  AND child.relkind = 'r'
+                  AND child.relname LIKE :prefix
+                  AND NOT EXISTS (SELECT 1 FROM pg_inherits WHERE pg_inherits.inhrelid = child.oid)
+                ORDER BY child.relname
+            """), {"prefix": PARTITION_PREFIX.replace("_", "\\_") + "%"})
+            return [row[0] for row in rows if partition_month(row[0]) is not None]
+
+    async def ensure_partitions(self, now: Optional[datetime] = None) -> List[str]:
+        """Cria as partições que faltam do mês atual até months_ahead meses à frente"""
+        if not await self.is_partitioned():
+            return []
+
+        current = month_start(now or datetime.now(timezone.utc))
+        existing = set(await self.list_partitions())
+        missing = [
+            month for month in (add_months(current, offset) for offset in range(self.months_ahead + 1))
+            if partition_name(month) not in existing
+        ]
+
+        async with self.engine.begin() as conn:
+            for month in missing:
+                await conn.execute(text(create_partition_sql(month)))
+
+        if missing:
+            self.stats["created"] += len(missing)
+            logger.info(f"Partições de documents criadas: {', '.join(partition_name(month) for month in missing)}")
+        return [partition_name(month) for month in missing]
+
+    async def archive_partitions(self, older_than_months: Optional[int] = None, now: Optional[datetime] = None) -> List[str]:
+        """
+        Move para o schema de arquivo as partições anteriores ao limite
+
+        Returns:
+            Nomes das partições arquivadas
+        """
+        older_than_months = self.archive_after_months if older_than_months is None else older_than_months
+        if not await self.is_partitioned():
+            return []
+
+        # Arquivamentos interrompidos são concluídos mesmo com o arquivamento automático desligado
+        pending = set(await self.pending_detach_partitions())
+        detached = await self.detached_partitions()
+
+        cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -older_than_months)
+        attached = [
+            name for name in await self.list_partitions()
+            if name in pending or (
+                older_than_months > 0 and (month := partition_month(name)) is not None and month < cutoff
+            )
+        ]
+
+        for name in detached:
+            await self._archive_partition(name, attached=False)
+        for name in attached:
+            await self._archive_partition(name, finalize=name in pending)
+
+        cold = sorted(detached + attached)
+        if cold:
+            self.stats["archived"] += len(cold)
+            logger.info(f"Partições de documents arquivadas em {self.archive_schema}: {', '.join(cold)}")
+
+            # Documentos arquivados saem dos contadores por usuário
+            from document_stats import repair_document_stats
+            await repair_document_stats(async_sessionmaker(self.engine, expire_on_commit=False))
+
+        return cold
+
+    async def _archive_partition(self, name: str, attached: bool = True, finalize: bool = False):
+        schema = self.archive_schema
+        payloads = name.replace(PARTITION_PREFIX, "document_payloads_p", 1)
+
+        # DETACH CONCURRENTLY não roda dentro de transação; interrompido, fica pendente e
+        # só pode ser concluído com FINALIZE
+        if attached:
+            async with self.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                mode = "FINALIZE" if finalize else "CONCURRENTLY"
+                await conn.execute(text(f"ALTER TABLE documents DETACH PARTITION {name} {mode}"))
+
+        # Uma única transação: se falhar, a partição desanexada é encontrada e retomada depois
+
+        async with self.engine.begin() as conn:
+            await conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
+            await conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {schema}"))
+            await conn.execute(text(f"""
+                CREATE TABLE {schema}.{payloads} AS
+                SELECT p.* FROM document_payloads p
+                WHERE p.document_id IN (SELECT id FROM {schema}.{name})
+            """))
+            await conn.execute(text(f"""
+                DELETE FROM document_payloads
+                WHERE document_id IN (SELECT id FROM {schema}.{name})
+            """))
+
+    async def run_once(self):
+        await self.ensure_partitions()
+        await self.archive_partitions()
+
+    def start(self):
+        """Inicia a manutenção periódica das partições no event loop atual"""
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info("Manutenção de partições de documents iniciada")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval * random.uniform(0.8, 1.2))
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Erro na manutenção de partições de documents: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "months_ahead": self.months_ahead,
+            "archive_after_months": self.archive_after_months,
+            "archive_schema": self.archive_schema,
+            **self.stats
+        }
+
+
+# Instância global do gerenciador de partições
+partition_manager = DocumentPartitionManager()
+
+
+if __name__ == "__main__":
+    import sys
+
+    async def _main():
+        if len(sys.argv) > 2 and sys.argv[1] == "archive":
+            print(await partition_manager.archive_partitions(int(sys.argv[2])))
+        else:
+            print(await partition_manager.ensure_partitions())
+        from database import dispose_engines
+        await dispose_engines()
+
+    asyncio.run(_main())
@@ -0,0 +1,717 @@
+"""
+Pipeline assíncrono de processamento de documentos
+Workers consomem a fila de jobs e executam as etapas Wu3 → insights GPT → notificação WebSocket
+"""
+import os
+import uuid
+import random
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+
+from database import AsyncSessionLocal
+from models import Document, InsightsBatch
+from job_queue import JobQueue, job_queue
+from circuit_breaker import CircuitOpenError, CLOSED, OPEN
+from single_flight import single_flight, flight_key
+from document_stats import record_transitions, INSIGHTS
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações
+DOCUMENT_WORKERS = int(os.getenv("DOCUMENT_WORKERS", "4"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1.0"))
+JOB_RETRY_DELAY_SECONDS = float(os.getenv("JOB_RETRY_DELAY_SECONDS", "5"))
+# Jobs estacionados liberados por vez quando o circuito da Wu3 fecha (evita rajada na recuperação)
+CIRCUIT_RELEASE_BATCH = int(os.getenv("CIRCUIT_RELEASE_BATCH", "50"))
+# Lotes de insights: concorrência por processo, limite por usuário e intervalo mínimo entre eventos WS
+INSIGHTS_BATCH_CONCURRENCY = int(os.getenv("INSIGHTS_BATCH_CONCURRENCY", "4"))
+INSIGHTS_BATCH_MAX_PER_USER = int(os.getenv("INSIGHTS_BATCH_MAX_PER_USER", "2"))
+INSIGHTS_BATCH_EVENT_INTERVAL_SECONDS = float(os.getenv("INSIGHTS_BATCH_EVENT_INTERVAL_SECONDS", "1.0"))
+
+# Último evento de progresso enviado por lote (limita a frequência de mensagens WS)
+_batch_last_event: Dict[str, float] = {}
+
+
+class InsightsGenerationError(Exception):
+    """Falha na geração de insights de um documento"""
+    pass
+
+
+async def find_reusable_document(db, content_hash: Optional[str], document_type: str, exclude_id: str) -> Optional[Document]:
+    """
+    Busca um documento já processado com o mesmo conteúdo, tipo e versão atual da Wu3
+
+    Returns:
+        Documento doador cujo resultado pode ser reaproveitado, ou None
+    """
+    from wu3_client import wu3_client
+
+    wu3_version = wu3_client.current_version
+    if not content_hash or not wu3_version:
+        return None
+
+    return await db.scalar(
+        select(Document).options(joinedload(Document.payload)).where(
+            Document.content_hash == content_hash,
+            Document.document_type == document_type,
+            Document.status == 'complete',
+            Document.wu3_version == wu3_version,
+            Document.id != exclude_id
+        ).order_by(Document.created_at.desc()).limit(1)
+    )
+
+
+def load_extraction(document: Document) -> Tuple[Dict[str, Any], Optional[float]]:
+    """Dados extraídos e score de confiança do documento"""
+    return document.extracted_data or {}, document.confidence_score
+
+
+def _reused_wu3_result(donor: Document) -> Dict[str, Any]:
+    """Monta o resultado Wu3 a partir de um documento com o mesmo conteúdo"""
+    extracted_data, confidence_score = load_extraction(donor)
+
+    return {
+        "status": "complete",
+        "extracted_data": extracted_data,
+        "confidence_score": confidence_score or 0.0,
+        "wu3_version": donor.wu3_version,
+        "processing_time_seconds": 0.0,
+        "reused_from": donor.id
+    }
+
+
+def _reusable_insights(donor: Document) -> Optional[Dict[str, Any]]:
+    """Insights do doador, se gerados por um modelo GPT atualmente configurado"""
+    from gpt_client import gpt_client
+
+    if donor.insights_status != 'complete' or not donor.gpt_insights:
+        return None
+    if donor.gpt_model_used not in gpt_client.models:
+        return None
+
+    return donor.gpt_insights
+
+
+def _insights_notification(document: Document, insights: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'type': 'insights_generated',
+        'data': {
+            'document_id': document.id,
+            'original_filename': document.original_filename,
+            'insights_summary': insights.get('resumo', '')[:100] + '...',
+            'nivel_atencao': insights.get('nivel_atencao', 'medio')
+        },
+        'message': f'🧠 Insights gerados para {document.original_filename}',
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+
+def insights_progress_callback(document_id: str, original_filename: str, user_id: int):
+    """Callback que envia cada campo de insight recebido em streaming como frame insights_progress"""
+    from websocket_manager import websocket_manager
+
+    fields_received = 0
+
+    async def on_progress(field: str, value: Any):
+        nonlocal fields_received
+        fields_received += 1
+        await websocket_manager.send_personal_message({
+            'type': 'insights_progress',
+            'data': {
+                'document_id': document_id,
+                'original_filename': original_filename,
+                'field': field,
+                'value': value,
+                'fields_received': fields_received
+            },
+            'timestamp': datetime.utcnow().isoformat()
+        }, str(user_id))
+
+    return on_progress
+
+
+async def process_document_job(document_id: str):
+    """
+    Executa o processamento completo de um documento (uma execução por vez por documento)
+
+    Etapas:
+        1. Extração de dados pela IA Wu3 (ou reaproveitamento de upload idêntico)
+        2. Persistência do resultado e notificação WebSocket
+        3. Geração de insights GPT (se habilitada e não reaproveitada)
+    """
+    await single_flight.do(flight_key(document_id, "process_document"), lambda: _process_document(document_id))
+
+
+async def _process_document(document_id: str):
+    from wu3_client import wu3_client
+    from websocket_manager import websocket_manager
+
+    wu3_result = None
+    reused_insights = None
+
+    async with AsyncSessionLocal() as db:
+        # Verificação de status e transição para 'processing' serializadas entre processos
+        # (lock liberado no commit abaixo, antes da chamada à Wu3)
+        await single_flight.lock_claim(db, flight_key(document_id, "process_document"))
+        document = await db.scalar(select(Document).where(Document.id == document_id))
+
+        if not document:
+            logger.warning(f"Documento {document_id} não encontrado para processamento")
+            return
+
+        if document.status not in ('processing', 'queued'):
+            logger.info(f"Documento {document_id} já processado (status={document.status}), ignorando job")
+            return
+
+        if document.status == 'processing' and document.wu3_document_id:
+            # Já enviado à Wu3 (aguardando webhook/reconciliador): não reenviar
+            logger.info(f"Documento {document_id} já enviado à Wu3, ignorando job duplicado")
+            return
+
+        file_path = document.file_path
+        document_type = document.document_type
+
+        # Conteúdo idêntico já processado: reaproveitar sem chamar Wu3/GPT
+        donor = await find_reusable_document(db, document.content_hash, document_type, document_id)
+        if donor:
+            wu3_result = _reused_wu3_result(donor)
+            reused_insights = _reusable_insights(donor)
+            logger.info(f"Documento {document_id} reaproveita o resultado de {donor.id} (mesmo conteúdo)")
+
+        if document.status == 'queued':
+            document.status = 'processing'
+            document.error_message = None
+            await db.commit()
+
+    # Etapa 1: Wu3 (sem manter conexão do banco aberta durante a chamada externa)
+    if wu3_result is None:
+        wu3_result = await wu3_client.process_document(file_path, document_type, document_id)
+
+    # Etapa 2: persistir resultado
+    async with AsyncSessionLocal() as db:
+        document = await db.scalar(select(Document).options(joinedload(Document.payload)).where(Document.id == document_id))
+        if not document:
+            return
+
+        document.extracted_data = wu3_result.get('extracted_data', {})
+        document.confidence_score = float(wu3_result.get('confidence_score') or 0.0)
+        document.status = wu3_result.get('status', 'complete')
+        document.wu3_document_id = wu3_result.get('wu3_document_id')
+        document.wu3_request_id = wu3_result.get('wu3_request_id')
+        document.error_message = wu3_result.get('error_message')
+        document.processing_time_seconds = float(wu3_result.get('processing_time_seconds') or 0.0)
+        document.wu3_version = wu3_result.get('wu3_version')
+
+        if document.status == 'processing' and document.wu3_document_id:
+            # Processamento assíncrono na Wu3: aguarda webhook, com consulta ativa de reserva
+            from wu3_reconciler import first_poll_at
+            document.webhook_received = False
+            document.wu3_poll_attempts = 0
+            document.wu3_next_poll_at = first_poll_at()
+
+        start_insights = False
+        if document.status == 'complete' and reused_insights is not None:
+            document.gpt_insights = reused_insights
+            document.gpt_summary = reused_insights.get('resumo', 'Resumo não disponível')
+            document.gpt_generated_at = datetime.utcnow()
+            document.gpt_model_used = reused_insights.get('modelo_usado', 'unknown')
+            document.insights_status = 'complete'
+        elif document.status == 'complete':
+            from gpt_client import gpt_client
+            if gpt_client.enabled:
+                document.insights_status = 'generating'
+                start_insights = True
+
+        await db.commit()
+
+    await websocket_manager.send_document_notification({
+        'document_id': document_id,
+        'user_id': document.user_id,
+        'original_filename': document.original_filename,
+        'status': document.status,
+        'confidence_score': wu3_result.get('confidence_score'),
+        'processing_time': wu3_result.get('processing_time_seconds'),
+        'reused': 'reused_from' in wu3_result,
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+    if reused_insights is not None and document.insights_status == 'complete':
+        await websocket_manager.send_personal_message(
+            _insights_notification(document, reused_insights), str(document.user_id)
+        )
+
+    # Etapa 3: insights GPT
+    if start_insights:
+        await generate_insights_background(
+            document_id=document_id,
+            extracted_data=wu3_result.get('extracted_data', {}),
+            document_type=document_type,
+            original_filename=document.original_filename,
+            confidence_score=wu3_result.get('confidence_score'),
+            user_id=document.user_id
+        )
+
+
+async def mark_document_queued(document_id: str, retry_after: float):
+    """Marca documento como aguardando a Wu3 voltar (circuito aberto) e avisa o usuário"""
+    from websocket_manager import websocket_manager
+
+    async with AsyncSessionLocal() as db:
+        document = await db.scalar(select(Document).where(Document.id == document_id))
+        if not document:
+            return
+
+        notify = document.status != 'queued'
+        document.status = 'queued'
+        document.error_message = 'Serviço Wu3 indisponível no momento. O documento será processado automaticamente.'
+        await db.commit()
+
+    if notify:
+        await websocket_manager.send_personal_message({
+            'type': 'document_queued',
+            'data': {
+                'document_id': document_id,
+                'original_filename': document.original_filename,
+                'status': 'queued',
+                'retry_after_seconds': round(retry_after)
+            },
+            'message': f'⏳ {document.original_filename} aguardando o serviço de extração',
+            'timestamp': datetime.utcnow().isoformat()
+        }, str(document.user_id))
+
+
+async def mark_document_failed(document_id: str, error_message: str):
+    """Marca documento como falho após esgotar as tentativas do job"""
+    async with AsyncSessionLocal() as db:
+        document = await db.scalar(select(Document).where(Document.id == document_id))
+        if document:
+            document.status = 'failed'
+            document.error_message = error_message
+            await db.commit()
+
+
+async def claim_insights_generation(document_id: str, allow_regenerate: bool = True) -> bool:
+    """
+    Marca os insights do documento como 'generating' com um UPDATE condicional
+
+    Só uma chamada concorrente vence (inclusive entre processos); as demais
+    recebem False. Sem allow_regenerate, insights já completos também bloqueiam.
+    """
+    blocked = ('generating',) if allow_regenerate else ('generating', 'complete')
+
+    async with AsyncSessionLocal() as db:
+        await single_flight.lock_claim(db, flight_key(document_id, "generate_insights"))
+        current = (await db.execute(
+            select(Document.user_id, Document.insights_status).where(Document.id == document_id)
+        )).first()
+        if current is None or current.insights_status in blocked:
+            return False
+
+        # Compare-and-swap sobre o valor lido: o contador de estatísticas sai da
+        # transição exata que este UPDATE aplicou
+        previous = (
+            Document.insights_status.is_(None) if current.insights_status is None
+            else Document.insights_status == current.insights_status
+        )
+        result = await db.execute(
+            update(Document).where(
+                Document.id == document_id,
+                Document.status == 'complete',
+                previous
+            ).values(insights_status='generating', updated_at=datetime.utcnow())
+        )
+        claimed = result.rowcount == 1
+        if claimed:
+            await record_transitions(db, current.user_id, INSIGHTS, [(current.insights_status, 'generating')])
+        await db.commit()
+
+    return claimed
+
+
+async def generate_insights_background(
+    document_id: str,
+    extracted_data: dict,
+    document_type: str,
+    original_filename: str,
+    confidence_score: float,
+    user_id: int,
+    priority: str = 'post_upload'
+) -> Optional[Dict[str, Any]]:
+    """
+    Gera insights em background após o processamento do documento
+
+    priority é a fila no agendador de chamadas à OpenAI (lotes usam 'batch').
+
+    Returns:
+        Insights gerados e salvos, ou None em caso de erro
+    """
+    from gpt_client import generate_document_insights
+    from websocket_manager import websocket_manager
+
+    try:
+        # Gerar insights (campos enviados ao navegador conforme chegam)
+        insights = await generate_document_insights(
+            extracted_data=extracted_data,
+            document_type=document_type,
+            original_filename=original_filename,
+            confidence_score=confidence_score,
+            on_progress=insights_progress_callback(document_id, original_filename, user_id),
+            priority=priority,
+            document_id=document_id
+        )
+
+        # Atualizar banco de dados
+        async with AsyncSessionLocal() as db:
+            document = await db.scalar(select(Document).options(joinedload(Document.payload)).where(Document.id == document_id))
+
+            if document:
+                document.gpt_insights = insights
+                document.gpt_summary = insights.get('resumo', 'Resumo não disponível')
+                document.gpt_generated_at = datetime.utcnow()
+                document.gpt_model_used = insights.get('modelo_usado', 'unknown')
+                document.insights_status = 'complete'
+                document.updated_at = datetime.utcnow()
+
+                await db.commit()
+
+        if document:
+            # Enviar notificação WebSocket
+            await websocket_manager.send_personal_message(_insights_notification(document, insights), str(user_id))
+
+            logger.info(f"Insights gerados com sucesso para documento {document_id}")
+
+        return insights
+
+    except Exception as e:
+        logger.error(f"Erro ao gerar insights em background para documento {document_id}: {str(e)}")
+
+        # Marcar como erro no banco
+        try:
+            async with AsyncSessionLocal() as db:
+                document = await db.scalar(select(Document).where(Document.id == document_id))
+
+                if document:
+                    document.insights_status = 'error'
+                    document.error_message = f"Erro ao gerar insights: {str(e)}"
+                    await db.commit()
+
+        except Exception as db_error:
+            logger.error(f"Erro ao atualizar status de erro no banco: {str(db_error)}")
+
+        return None
+
+
+async def generate_insights_job(document_id: str):
+    """Gera insights de um documento enfileirado por um lote (batch-generate-insights)"""
+    async with AsyncSessionLocal() as db:
+        document = await db.scalar(select(Document).options(joinedload(Document.payload)).where(Document.id == document_id))
+
+        if not document or document.status != 'complete':
+            logger.info(f"Documento {document_id} indisponível para insights, ignorando job")
+            return
+
+        if document.insights_status == 'complete':
+            return
+
+        extracted_data, confidence_score = load_extraction(document)
+
+    if not await claim_insights_generation(document_id, allow_regenerate=False):
+        logger.info(f"Insights do documento {document_id} já em geração, ignorando job")
+        return
+
+    generated = await generate_insights_background(
+        document_id=document_id,
+        extracted_data=extracted_data,
+        document_type=document.document_type,
+        original_filename=document.original_filename,
+        confidence_score=confidence_score,
+        user_id=document.user_id,
+        priority='batch'
+    )
+
+    if generated is None:
+        raise InsightsGenerationError(f"Falha ao gerar insights do documento {document_id}")
+
+
+async def record_batch_progress(batch_id: str, succeeded: bool):
+    """Atualiza o progresso persistido do lote e envia evento WebSocket (com limite de frequência)"""
+    from websocket_manager import websocket_manager
+
+    counter = InsightsBatch.completed if succeeded else InsightsBatch.failed
+
+    async with AsyncSessionLocal() as db:
+        # Lotes encerrados ('complete', 'failed') não voltam a contar
+        result = await db.execute(
+            update(InsightsBatch).where(
+                InsightsBatch.id == batch_id,
+                InsightsBatch.status == 'running'
+            ).values(
+                {counter.key: counter + 1, 'updated_at': datetime.utcnow()}
+            )
+        )
+        if result.rowcount != 1:
+            await db.commit()
+            return
+        batch = await db.scalar(select(InsightsBatch).where(InsightsBatch.id == batch_id))
+
+        finished = False
+        if batch.completed + batch.failed >= batch.total:
+            # Update condicional: apenas um worker anuncia o fim do lote
+            result = await db.execute(
+                update(InsightsBatch).where(
+                    InsightsBatch.id == batch_id,
+                    InsightsBatch.status == 'running'
+                ).values(status='complete', finished_at=datetime.utcnow())
+            )
+            finished = result.rowcount == 1
+
+        await db.commit()
+
+    now = time.monotonic()
+    if not finished and now - _batch_last_event.get(batch_id, 0.0) < INSIGHTS_BATCH_EVENT_INTERVAL_SECONDS:
+        return
+
+    if finished:
+        _batch_last_event.pop(batch_id, None)
+    else:
+        _batch_last_event[batch_id] = now
+
+    await websocket_manager.send_personal_message({
+        'type': 'insights_batch_progress',
+        'data': batch_progress(batch, 'complete' if finished else batch.status),
+        'message': (
+            f'🧠 Lote de insights concluído: {batch.completed} gerados, {batch.failed} com erro'
+            if finished else f'🧠 Gerando insights: {batch.completed + batch.failed}/{batch.total}'
+        ),
+        'timestamp': datetime.utcnow().isoformat()
+    }, str(batch.user_id))
+
+
+def batch_progress(batch: InsightsBatch, status: Optional[str] = None) -> Dict[str, Any]:
+    """Representação do progresso de um lote de insights"""
+    status = status or batch.status
+    processed = batch.completed + batch.failed
+    return {
+        'batch_id': batch.id,
+        'status': status,
+        'total': batch.total,
+        'completed': batch.completed,
+        'failed': batch.failed,
+        # Lote 'failed' não chegou a enfileirar: nada fica pendente
+        'pending': 0 if status == 'failed' else max(0, batch.total - processed),
+        'progress': round(processed / batch.total * 100, 1) if batch.total else 100.0,
+        'created_at': batch.created_at.isoformat() if batch.created_at else None,
+        'finished_at': batch.finished_at.isoformat() if batch.finished_at else None
+    }
+
+
+async def on_job_finished(job: Dict[str, Any], succeeded: bool, error: Optional[str] = None):
+    """Efeitos de um job finalizado (concluído ou com tentativas esgotadas)"""
+    if not succeeded and job["job_type"] == 'process_document':
+        await mark_document_failed(job["document_id"], error)
+
+    if job.get("batch_id"):
+        await record_batch_progress(job["batch_id"], succeeded)
+
+
+# Handlers por tipo de job
+JOB_HANDLERS = {
+    'process_document': process_document_job,
+    'generate_insights': generate_insights_job
+}
+
+
+class DocumentWorkerPool:
+    """Pool de workers assíncronos que consomem a fila de jobs"""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        concurrency: int = DOCUMENT_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL_SECONDS,
+        job_types: Optional[List[str]] = None,
+        max_per_user: Optional[int] = None,
+        name: str = "documentos"
+    ):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.job_types = job_types
+        self.max_per_user = max_per_user
+        self.name = name
+        self.worker_prefix = f"{os.uname().nodename}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        self._probe_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self):
+        """Inicia os workers no event loop atual"""
+        if self.running:
+            return
+
+        self._stopping.clear()
+        if self.job_types is None or 'process_document' in self.job_types:
+            self._watch_circuit()
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(f"{self.worker_prefix}-{self.name}-{index}"))
+            for index in range(self.concurrency)
+        ]
+        logger.info(f"{self.concurrency} workers de {self.name} iniciados")
+
+    async def stop(self):
+        """Para os workers, aguardando os jobs em andamento terminarem"""
+        self._stopping.set()
+        self.queue._notify()
+
+        if self._probe_task and not self._probe_task.done():
+            self._probe_task.cancel()
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Workers de {self.name} finalizados")
+
+    async def run_once(self, worker_id: Optional[str] = None) -> bool:
+        """
+        Reserva e executa um único job
+
+        Returns:
+            True se um job foi executado, False se a fila estava vazia
+        """
+        worker_id = worker_id or f"{self.worker_prefix}-once"
+        job = await self.queue.claim(worker_id, self.job_types, self.max_per_user)
+        if job is None:
+            return False
+
+        await self._execute(job)
+        return True
+
+    async def _worker_loop(self, worker_id: str):
+        while not self._stopping.is_set():
+            try:
+                executed = await self.run_once(worker_id)
+            except Exception as e:
+                logger.error(f"Erro no worker {worker_id}: {str(e)}")
+                executed = False
+
+            if not executed:
+                await self.queue.wait_for_job(self.poll_interval)
+
+    async def _execute(self, job: Dict[str, Any]):
+        handler = JOB_HANDLERS.get(job["job_type"])
+        if handler is None:
+            logger.error(f"Tipo de job desconhecido: {job['job_type']}")
+            await self.queue.fail(job["id"], f"Tipo de job desconhecido: {job['job_type']}")
+            return
+
+        try:
+            await handler(job["document_id"])
+            await self.queue.complete(job["id"])
+            await on_job_finished(job, succeeded=True)
+        except CircuitOpenError as e:
+            # Wu3 indisponível: não consome tentativa, o job aguarda o circuito fechar
+            logger.info(f"Job {job['id']} estacionado: {str(e)}")
+            await self.queue.park(job["id"])
+            await mark_document_queued(job["document_id"], e.retry_after)
+        except Exception as e:
+            logger.error(f"Erro no job {job['id']} (documento {job['document_id']}): {str(e)}")
+
+            # Backoff exponencial com jitter entre tentativas
+            delay = JOB_RETRY_DELAY_SECONDS * (2 ** (job["attempts"] - 1)) * random.uniform(0.8, 1.2)
+            rescheduled = await self.queue.fail(job["id"], str(e), delay)
+
+            if not rescheduled:
+                await on_job_finished(job, succeeded=False, error=str(e))
+
+        if job["job_type"] == 'process_document':
+            await self._continue_probe()
+
+    def _watch_circuit(self):
+        """Registra (uma vez) o listener do circuit breaker da Wu3"""
+        from wu3_client import wu3_client
+
+        breaker = wu3_client.circuit_breaker
+        if self._on_circuit_change not in breaker._listeners:
+            breaker.add_listener(self._on_circuit_change)
+
+    async def _on_circuit_change(self, old_state: str, new_state: str):
+        if new_state == OPEN:
+            # Ao fim da espera, libera um único job para servir de chamada de teste (half_open)
+            from wu3_client import wu3_client
+
+            if self._probe_task and not self._probe_task.done():
+                self._probe_task.cancel()
+            self._probe_task = asyncio.create_task(
+                self._release_probe(wu3_client.circuit_breaker.retry_after)
+            )
+
+        elif new_state == CLOSED:
+            released = await self.queue.release_parked(CIRCUIT_RELEASE_BATCH)
+            while released == CIRCUIT_RELEASE_BATCH:
+                await asyncio.sleep(self.poll_interval)
+                released = await self.queue.release_parked(CIRCUIT_RELEASE_BATCH)
+            logger.info("Circuito da Wu3 fechado: jobs estacionados liberados")
+
+    async def _continue_probe(self):
+        """
+        Libera o próximo job estacionado se o circuito continua em teste sem chamada à Wu3
+
+        O job liberado como teste pode terminar sem chamar a Wu3 (resultado reaproveitado,
+        documento já processado); sem isso o circuito ficaria em half_open com os demais
+        jobs estacionados até chegar outro upload.
+        """
+        from wu3_client import wu3_client
+
+        if wu3_client.circuit_breaker.awaiting_probe and await self.queue.release_parked(1):
+            logger.info("Circuito da Wu3 ainda em teste: próximo job estacionado liberado")
+
+    async def _release_probe(self, delay: float):
+        await asyncio.sleep(delay)
+        released = await self.queue.release_parked(1)
+        if released:
+            logger.info("Circuito da Wu3 em teste: 1 job estacionado liberado")
+
+
+# Instâncias globais: processamento de documentos e lotes de insights (concorrência independente)
+worker_pool = DocumentWorkerPool(job_queue, job_types=['process_document'])
+insights_worker_pool = DocumentWorkerPool(
+    job_queue,
+    concurrency=INSIGHTS_BATCH_CONCURRENCY,
+    job_types=['generate_insights'],
+    max_per_user=INSIGHTS_BATCH_MAX_PER_USER,
+    name="insights"
+)
+
+
+async def run_workers_forever():
+    """Executa apenas os workers, sem a API (permite escalar workers separadamente)"""
+    from wu3_client import wu3_client
+    from wu3_reconciler import wu3_reconciler, WU3_POLL_ENABLED
+
+    worker_pool.start()
+    if INSIGHTS_BATCH_CONCURRENCY > 0:
+        insights_worker_pool.start()
+    if WU3_POLL_ENABLED and not wu3_client.is_fallback_mode:
+        wu3_reconciler.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await wu3_reconciler.stop()
+        await insights_worker_pool.stop()
+        await worker_pool.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_workers_forever())
@@ -0,0 +1,154 @@
+"""
+Consultas de documentos por usuário usadas pelos endpoints
+Centralizadas para que o teste de EXPLAIN verifique exatamente o que a API executa
+"""
+import os
+import json
+import base64
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import select, func, text, tuple_, literal
+
+from models import Document, DOCUMENTS_NEEDING_INSIGHTS
+
+# Paginação da listagem de documentos
+DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", "50"))
+DOCUMENTS_MAX_PAGE_SIZE = int(os.getenv("DOCUMENTS_MAX_PAGE_SIZE", "200"))
+
+
+def today_range(now: datetime = None) -> Tuple[datetime, datetime]:
+    """Início e fim do dia atual (fuso local), para filtrar created_at por intervalo"""
+    now = (now or datetime.now()).astimezone()
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+
+def encode_cursor(created_at: datetime, document_id: str) -> str:
+    """Cursor opaco com a posição (created_at, id) do último documento da página"""
+    raw = json.dumps([created_at.isoformat(), document_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    Raises:
+        ValueError: Se o cursor não foi gerado por encode_cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, document_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(document_id)
+    except Exception as e:
+        raise ValueError("Cursor inválido") from e
+
+
+def created_between(query, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    """
+    Intervalo de criação [created_from, created_to)
+
+    Comparações diretas com created_at: no PostgreSQL o planner descarta as
+    partições mensais fora do intervalo.
+    """
+    if created_from:
+        query = query.where(Document.created_at >= created_from)
+    if created_to:
+        query = query.where(Document.created_at < created_to)
+    return query
+
+
+def user_documents_query(
+    user_id: int,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    document_type: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
+    """
+    Documentos do usuário, mais recentes primeiro (created_at, id)
+
+    Paginação por keyset: o cursor continua logo após o último documento da página
+    anterior, percorrendo o índice (user_id, created_at, id) sem OFFSET, então o
+    custo de uma página não cresce com a profundidade.
+
+    O created_at <= do cursor repete a comparação de tuplas numa forma que o
+    planner usa para descartar partições mais novas que a página.
+    """
+    query = select(Document).where(Document.user_id == user_id)
+
+    if status:
+        query = query.where(Document.status == status)
+    if document_type:
+        query = query.where(Document.document_type == document_type)
+    query = created_between(query, created_from, created_to)
+    if cursor:
+        created_at, document_id = decode_cursor(cursor)
+        created_at = literal(created_at, Document.created_at.type)
+        query = query.where(
+            Document.created_at <= created_at,
+            tuple_(Document.created_at, Document.id) < tuple_(created_at, literal(document_id, Document.id.type))
+        )
+
+    return query.order_by(Document.created_at.desc(), Document.id.desc())
+
+
+def status_counts_query(user_id: int, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    return created_between(select(
+        Document.status,
+        func.count(Document.id).label('count')
+    ).where(
+        Document.user_id == user_id
+    ), created_from, created_to).group_by(Document.status)
+
+
+def type_counts_query(user_id: int, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    return created_between(select(
+        Document.document_type,
+        func.count(Document.id).label('count')
+    ).where(
+        Document.user_id == user_id
+    ), created_from, created_to).group_by(Document.document_type)
+
+
+def insights_status_counts_query(user_id: int, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    return created_between(select(
+        Document.insights_status,
+        func.count(Document.id).label('count')
+    ).where(
+        Document.user_id == user_id
+    ), created_from, created_to).group_by(Document.insights_status)
+
+
+def confidence_by_type_query(user_id: int, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    """Confiança média da Wu3 por tipo de documento, agregada no banco"""
+    return created_between(select(
+        Document.document_type,
+        func.avg(Document.confidence_score).label('average_confidence'),
+        func.count(Document.confidence_score).label('count')
+    ).where(
+        Document.user_id == user_id,
+        Document.confidence_score.isnot(None)
+    ), created_from, created_to).group_by(Document.document_type)
+
+
+def total_documents_query(user_id: int):
+    return select(func.count(Document.id)).where(Document.user_id == user_id)
+
+
+def today_documents_query(user_id: int, now: datetime = None):
+    """Documentos criados hoje: intervalo em created_at (usa o índice, ao contrário de date(created_at))"""
+    start, end = today_range(now)
+    return select(func.count(Document.id)).where(
+        Document.user_id == user_id,
+        Document.created_at >= start,
+        Document.created_at < end
+    )
+
+
+def documents_needing_insights_query(user_id: int):
+    """IDs (e insights_status atual) dos documentos completos ainda sem insights (índice parcial)"""
+    return select(Document.id, Document.insights_status).where(
+        Document.user_id == user_id,
+        text(DOCUMENTS_NEEDING_INSIGHTS)
+    ).order_by(Document.created_at)
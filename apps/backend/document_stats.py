@@ -0,0 +1,292 @@
+"""
+Estatísticas de documentos por usuário (tabela document_stats)
+Contadores atualizados na mesma transação de cada transição de status, tipo e
+insights; reparo periódico recalcula tudo a partir de documents e reporta divergências
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, delete, func, event, inspect, or_, and_, text
+from sqlalchemy.orm import Session
+
+from models import Document, DocumentStats
+from document_queries import (
+    today_range, created_between, status_counts_query, type_counts_query, insights_status_counts_query
+)
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATUS = "status"
+TYPE = "type"
+INSIGHTS = "insights"
+DAY = "day"
+
+# Atributos do documento que alimentam cada dimensão
+TRACKED_ATTRIBUTES = {STATUS: "status", TYPE: "document_type", INSIGHTS: "insights_status"}
+
+StatsKey = Tuple[int, str, str]  # (user_id, dimensão, chave)
+
+
+def _key(value: Optional[str]) -> str:
+    return value if value is not None else "none"
+
+
+def today_key() -> str:
+    return today_range()[0].date().isoformat()
+
+
+def document_keys(user_id: int, values: Dict[str, Optional[str]]) -> List[StatsKey]:
+    """Chaves de contador de um documento (valores por dimensão)"""
+    return [(user_id, dimension, _key(values.get(dimension))) for dimension in TRACKED_ATTRIBUTES]
+
+
+def _insert_for(dialect_name: str):
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert
+
+
+def apply_deltas(connection, deltas: Counter):
+    """
+    Soma os deltas aos contadores (upsert) na conexão/transação recebida
+
+    Linhas em ordem de chave primária: transações concorrentes travam as linhas na
+    mesma ordem e não entram em deadlock.
+    """
+    rows = [
+        {"user_id": user_id, "dimension": dimension, "key": key, "count": delta}
+        for (user_id, dimension, key), delta in sorted(deltas.items())
+        if delta
+    ]
+    if not rows:
+        return
+
+    insert = _insert_for(connection.dialect.name)
+    table = DocumentStats.__table__
+    statement = insert(table).values(rows)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.dimension, table.c.key],
+        set_={"count": table.c.count + statement.excluded.count, "updated_at": func.now()}
+    ))
+
+
+async def record_transitions(db, user_id: int, dimension: str, transitions: Iterable[Tuple[Optional[str], Optional[str]]]):
+    """Registra transições feitas com UPDATE em massa (fora do ORM), na transação da sessão"""
+    deltas: Counter = Counter()
+    for old, new in transitions:
+        if old != new:
+            deltas[(user_id, dimension, _key(old))] -= 1
+            deltas[(user_id, dimension, _key(new))] += 1
+
+    connection = await db.connection()
+    await connection.run_sync(apply_deltas, deltas)
+
+
+def _document_deltas(session: Session) -> Counter:
+    """Deltas dos documentos inseridos, alterados e removidos no flush"""
+    deltas: Counter = Counter()
+    today = today_key()
+
+    for document in session.new:
+        if isinstance(document, Document):
+            for key in document_keys(document.user_id, {
+                dimension: getattr(document, attribute) for dimension, attribute in TRACKED_ATTRIBUTES.items()
+            }):
+                deltas[key] += 1
+            deltas[(document.user_id, DAY, today)] += 1
+
+    for document in session.dirty:
+        if not isinstance(document, Document):
+            continue
+        state = inspect(document)
+        for dimension, attribute in TRACKED_ATTRIBUTES.items():
+            history = state.attrs[attribute].history
+            if not history.added or not history.deleted:
+                continue
+            old, new = history.deleted[0], history.added[0]
+            if old != new:
+                deltas[(document.user_id, dimension, _key(old))] -= 1
+                deltas[(document.user_id, dimension, _key(new))] += 1
+
+    for document in session.deleted:
+        if isinstance(document, Document):
+            for key in document_keys(document.user_id, {
+                dimension: getattr(document, attribute) for dimension, attribute in TRACKED_ATTRIBUTES.items()
+            }):
+                deltas[key] -= 1
+            if document.created_at and document.created_at.astimezone().date().isoformat() == today:
+                deltas[(document.user_id, DAY, today)] -= 1
+
+    return deltas
+
+
+@event.listens_for(Session, "after_flush")
+def _update_stats_after_flush(session: Session, flush_context):
+    """Transições feitas pelo ORM: contadores atualizados no mesmo flush/transação"""
+    deltas = _document_deltas(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+async def get_user_stats(db, user_id: int) -> Dict[str, Any]:
+    """Estatísticas do usuário numa única leitura pela chave primária"""
+    today = today_key()
+    rows = (await db.execute(
+        select(DocumentStats.dimension, DocumentStats.key, DocumentStats.count).where(
+            DocumentStats.user_id == user_id,
+            or_(DocumentStats.dimension != DAY, DocumentStats.key == today)
+        )
+    )).all()
+
+    grouped: Dict[str, Dict[str, int]] = {STATUS: {}, TYPE: {}, INSIGHTS: {}, DAY: {}}
+    for row in rows:
+        if row.count:
+            grouped[row.dimension][row.key] = row.count
+
+    return {
+        "total_documents": sum(grouped[STATUS].values()),
+        "today_documents": grouped[DAY].get(today, 0),
+        "by_status": grouped[STATUS],
+        "by_type": grouped[TYPE],
+        "by_insights_status": grouped[INSIGHTS]
+    }
+
+
+async def get_user_stats_between(db, user_id: int, created_from: Optional[datetime], created_to: Optional[datetime]) -> Dict[str, Any]:
+    """
+    Estatísticas só dos documentos criados em [created_from, created_to)
+
+    Os contadores de document_stats não têm recorte por data: agrega direto em
+    documents, lendo apenas as partições do intervalo.
+    """
+    grouped: Dict[str, Dict[str, int]] = {}
+    for dimension, query in ((STATUS, status_counts_query), (TYPE, type_counts_query), (INSIGHTS, insights_status_counts_query)):
+        rows = (await db.execute(query(user_id, created_from, created_to))).all()
+        grouped[dimension] = {_key(value): count for value, count in rows}
+
+    start, end = today_range()
+    today = await db.scalar(created_between(created_between(
+        select(func.count(Document.id)).where(Document.user_id == user_id), start, end
+    ), created_from, created_to))
+
+    return {
+        "total_documents": sum(grouped[STATUS].values()),
+        "today_documents": today or 0,
+        "by_status": grouped[STATUS],
+        "by_type": grouped[TYPE],
+        "by_insights_status": grouped[INSIGHTS]
+    }
+
+
+async def _expected_counts(db) -> Counter:
+    """Contadores recalculados a partir de documents"""
+    expected: Counter = Counter()
+
+    rows = (await db.execute(
+        select(
+            Document.user_id, Document.status, Document.document_type, Document.insights_status,
+            func.count(Document.id)
+        ).group_by(Document.user_id, Document.status, Document.document_type, Document.insights_status)
+    )).all()
+    for user_id, status, document_type, insights_status, count in rows:
+        for key in document_keys(user_id, {STATUS: status, TYPE: document_type, INSIGHTS: insights_status}):
+            expected[key] += count
+
+    start, end = today_range()
+    rows = (await db.execute(
+        select(Document.user_id, func.count(Document.id)).where(
+            Document.created_at >= start,
+            Document.created_at < end
+        ).group_by(Document.user_id)
+    )).all()
+    for user_id, count in rows:
+        expected[(user_id, DAY, today_key())] += count
+
+    return expected
+
+
+async def repair_document_stats(session_factory=None) -> Dict[str, Any]:
+    """
+    Recalcula todos os contadores e corrige as divergências
+
+    No PostgreSQL a tabela de estatísticas fica travada (EXCLUSIVE) durante o reparo:
+    transições concorrentes aguardam e aplicam seus deltas depois, sobre os valores
+    corrigidos. Contadores de dias anteriores são descartados.
+
+    Returns:
+        Relatório com as divergências encontradas (esperado x armazenado)
+    """
+    if session_factory is None:
+        from database import AsyncSessionLocal
+        session_factory = AsyncSessionLocal
+
+    started_at = datetime.utcnow()
+    today = today_key()
+
+    async with session_factory() as db:
+        connection = await db.connection()
+        if connection.dialect.name == "postgresql":
+            await db.execute(text("LOCK TABLE document_stats IN EXCLUSIVE MODE"))
+
+        expected = await _expected_counts(db)
+        stored = {
+            (row.user_id, row.dimension, row.key): row.count
+            for row in (await db.execute(
+                select(DocumentStats.user_id, DocumentStats.dimension, DocumentStats.key, DocumentStats.count).where(
+                    or_(DocumentStats.dimension != DAY, DocumentStats.key == today)
+                )
+            )).all()
+        }
+
+        drift = []
+        corrections: Counter = Counter()
+        for key in sorted(set(expected) | set(stored)):
+            difference = expected.get(key, 0) - stored.get(key, 0)
+            if difference:
+                user_id, dimension, value = key
+                drift.append({
+                    "user_id": user_id,
+                    "dimension": dimension,
+                    "key": value,
+                    "expected": expected.get(key, 0),
+                    "stored": stored.get(key, 0)
+                })
+                corrections[key] = difference
+
+        await connection.run_sync(apply_deltas, corrections)
+
+        # Contadores zerados e de dias anteriores não são mais lidos
+        result = await db.execute(
+            delete(DocumentStats).where(or_(
+                DocumentStats.count == 0,
+                and_(DocumentStats.dimension == DAY, DocumentStats.key != today)
+            ))
+        )
+        pruned = result.rowcount or 0
+        await db.commit()
+
+    if drift:
+        logger.warning(f"Estatísticas de documentos: {len(drift)} contadores divergentes corrigidos")
+    else:
+        logger.info("Estatísticas de documentos: nenhum contador divergente")
+
+    return {
+        "checked": len(set(expected) | set(stored)),
+        "drift_count": len(drift),
+        "drift": drift[:100],
+        "pruned": pruned,
+        "started_at": started_at.isoformat(),
+        "duration_seconds": round((datetime.utcnow() - started_at).total_seconds(), 3)
+    }
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(asyncio.run(repair_document_stats()), indent=2, ensure_ascii=False))
@@ -4,13 +4,25 @@ Cliente GPT-4 para geração de insights e análises de documentos
 import os
 import json
 import logging
+import time
 import asyncio
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Callable, Awaitable
 from datetime import datetime
 import aiohttp
 
+from http_pool import http_pool
+from insights_cache import insights_cache, build_cache_key
+from streaming_json import IncrementalJSONFieldParser
+from prompt_compaction import compact_extracted_data, estimate_tokens, GPT_PROMPT_TOKEN_BUDGET
+from openai_scheduler import openai_scheduler, LANE_INTERACTIVE
+from rate_limiter import parse_retry_after
+from insights_microbatch import InsightsMicroBatcher
+
 logger = logging.getLogger(__name__)
 
+# Callback chamado a cada campo de insight recebido durante o streaming
+ProgressCallback = Callable[[str, Any], Awaitable[None]]
+
 class GPTClient:
     """Cliente para integração com OpenAI GPT-4"""
     
@@ -21,6 +33,32 @@ class GPTClient:
         self.max_tokens = int(os.getenv("GPT_MAX_TOKENS", "1000"))
         self.timeout = int(os.getenv("GPT_TIMEOUT_SECONDS", "30"))
         self.enabled = os.getenv("ENABLE_AI_INSIGHTS", "true").lower() == "true"
+        self.api_url = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+        self.streaming = os.getenv("GPT_STREAMING", "true").lower() == "true"
+        self.prompt_token_budget = GPT_PROMPT_TOKEN_BUDGET
+        self.prompt_stats = {"prompts": 0, "original_tokens": 0, "tokens": 0}
+        
+        # Cascata de modelos: modelo rápido primeiro, modelo principal só quando necessário
+        self.cascade_enabled = os.getenv("GPT_CASCADE_ENABLED", "false").lower() == "true"
+        self.fast_model = os.getenv("GPT_FAST_MODEL", "gpt-4o-mini")
+        self.cascade_min_confidence = float(os.getenv("GPT_CASCADE_MIN_CONFIDENCE", "0.8"))
+        self.high_stakes_types = {
+            doc_type.strip() for doc_type in os.getenv("GPT_HIGH_STAKES_TYPES", "contract,financial").split(",")
+            if doc_type.strip()
+        }
+        self.cascade_stats = {"requests": 0, "fast_accepted": 0, "direct": {}, "escalations": {}}
+        self.model_stats: Dict[str, Dict[str, float]] = {}
+        
+        # Micro-lotes: documentos pequenos em background compartilham uma chamada
+        self.microbatcher = InsightsMicroBatcher(self)
+        
+        # Sessão HTTP compartilhada (keep-alive, limite por host, cache de DNS)
+        http_pool.register(
+            "openai",
+            limit=int(os.getenv("OPENAI_HTTP_POOL_LIMIT", "50")),
+            limit_per_host=int(os.getenv("OPENAI_HTTP_POOL_LIMIT_PER_HOST", "20")),
+            timeout_seconds=self.timeout
+        )
         
         if not self.api_key or self.api_key == "sk-xxxxx-your-openai-api-key-here":
             logger.warning("OpenAI API key não configurada. Usando modo de fallback.")
@@ -31,25 +69,53 @@ class GPTClient:
         extracted_data: Dict[str, Any], 
         document_type: str,
         original_filename: str,
-        confidence_score: Optional[float] = None
+        confidence_score: Optional[float] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        priority: str = LANE_INTERACTIVE,
+        document_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Gera insights inteligentes baseados nos dados extraídos do documento
+        
+        Com on_progress (e GPT_STREAMING ativo), a resposta é recebida em streaming
+        e cada campo do JSON é repassado ao callback assim que fica completo.
+        priority define a fila no agendador de chamadas (interactive, post_upload, batch).
+        Com document_id, documentos pequenos em background podem ir num micro-lote.
         """
         if not self.enabled:
             return self._generate_fallback_insights(extracted_data, document_type, original_filename)
         
+        # Mesmos dados e parâmetros: reaproveitar insights já gerados
+        cache_key = self.cache_key(extracted_data, document_type)
+        cached = await insights_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Insights em cache para documento {original_filename}")
+            return dict(cached)
+        
         try:
-            # Preparar prompt contextualizado
-            prompt = self._build_analysis_prompt(
-                extracted_data, document_type, original_filename, confidence_score
-            )
+            compacted = None
+            if document_id and self.microbatcher.enabled:
+                compacted = self.microbatcher.compact(extracted_data, document_type)
             
-            # Fazer chamada para OpenAI
-            response = await self._call_openai_api(prompt)
+            if compacted is not None and self.microbatcher.accepts(
+                document_type, priority, compacted["tokens"], confidence_score
+            ):
+                insights = await self.microbatcher.submit(
+                    document_id, extracted_data, document_type, original_filename,
+                    confidence_score, priority, compacted
+                )
+                # Sem streaming no lote: repassa os campos de uma vez
+                if on_progress is not None:
+                    for field, value in insights.items():
+                        await on_progress(field, value)
+            else:
+                insights = await self._request_insights(
+                    extracted_data, document_type, original_filename, confidence_score, on_progress, priority
+                )
             
-            # Processar resposta
-            insights = self._parse_gpt_response(response)
+            # Respostas que não puderam ser interpretadas não vão para o cache
+            if insights.get("fonte") == "openai_gpt4":
+                await insights_cache.set(cache_key, insights, insights["modelo_usado"], document_type)
             
             logger.info(f"Insights gerados com sucesso para documento {original_filename}")
             return insights
@@ -58,6 +124,133 @@ class GPTClient:
             logger.error(f"Erro ao gerar insights com GPT-4: {str(e)}")
             return self._generate_fallback_insights(extracted_data, document_type, original_filename)
     
+    async def _request_insights(
+        self,
+        extracted_data: Dict[str, Any],
+        document_type: str,
+        original_filename: str,
+        confidence_score: Optional[float],
+        on_progress: Optional[ProgressCallback],
+        priority: str
+    ) -> Dict[str, Any]:
+        """Chamada individual à OpenAI (com cascata de modelos, se habilitada)"""
+        # Preparar prompt contextualizado
+        prompt = self._build_analysis_prompt(
+            extracted_data, document_type, original_filename, confidence_score
+        )
+        
+        streaming = on_progress is not None and self.streaming
+        models = self._select_models(document_type, confidence_score)
+        for model in models:
+            final = model == models[-1]
+            
+            # Fazer chamada para OpenAI; só o último modelo da cascata vai em streaming,
+            # para o cliente não receber campos do modelo rápido que depois seriam descartados
+            started_at = time.monotonic()
+            if streaming and final:
+                response = await self._stream_openai_api(prompt, on_progress, priority, model)
+            else:
+                response = await self._call_openai_api(prompt, priority, model)
+            self._record_model_latency(model, time.monotonic() - started_at)
+            
+            # Processar resposta
+            insights = self._parse_gpt_response(response, model)
+            
+            if final:
+                break
+            
+            reason = self._escalation_reason(insights)
+            if reason is None:
+                self.cascade_stats["fast_accepted"] += 1
+                # Resposta do modelo rápido aceita: repassa os campos de uma vez
+                if streaming:
+                    for field, value in insights.items():
+                        await on_progress(field, value)
+                break
+            
+            self._count(self.cascade_stats["escalations"], reason)
+            logger.info(f"Insights de {original_filename}: escalando de {model} para {models[-1]} ({reason})")
+        
+        return insights
+    
+    @property
+    def models(self) -> set:
+        """Modelos que podem gerar os insights na configuração atual"""
+        return {self.fast_model, self.model} if self.cascade_enabled else {self.model}
+    
+    def cache_key(self, extracted_data: Dict[str, Any], document_type: str) -> str:
+        """Chave do cache de insights para os parâmetros atuais do modelo"""
+        model = f"{self.fast_model}>{self.model}" if self.cascade_enabled else self.model
+        return build_cache_key(model, self.temperature, self.max_tokens, document_type, extracted_data)
+    
+    def _select_models(self, document_type: str, confidence_score: Optional[float]) -> list:
+        """
+        Modelos a tentar, em ordem
+        
+        Na cascata, o modelo rápido vai primeiro, exceto para tipos de documento de
+        alto risco ou extrações de baixa confiança, que vão direto ao modelo principal.
+        """
+        if not self.cascade_enabled or self.fast_model == self.model:
+            return [self.model]
+        
+        self.cascade_stats["requests"] += 1
+        
+        reason = self._direct_reason(document_type, confidence_score)
+        if reason is not None:
+            self._count(self.cascade_stats["direct"], reason)
+            return [self.model]
+        
+        return [self.fast_model, self.model]
+    
+    def first_model(self, document_type: str, confidence_score: Optional[float]) -> str:
+        """Primeiro modelo que _select_models tentaria (sem contar nas estatísticas da cascata)"""
+        if not self.cascade_enabled or self.fast_model == self.model:
+            return self.model
+        return self.model if self._direct_reason(document_type, confidence_score) else self.fast_model
+    
+    def _direct_reason(self, document_type: str, confidence_score: Optional[float]) -> Optional[str]:
+        """Motivo para pular o modelo rápido (None se ele pode tentar primeiro)"""
+        if document_type in self.high_stakes_types:
+            return "high_stakes_type"
+        if confidence_score is not None and confidence_score < self.cascade_min_confidence:
+            return "low_confidence"
+        return None
+    
+    @staticmethod
+    def _escalation_reason(insights: Dict[str, Any]) -> Optional[str]:
+        """Motivo para descartar a resposta do modelo rápido (None se aceitável)"""
+        if insights.get("fonte") != "openai_gpt4":
+            return "unparseable_response"
+        
+        required_fields = ["resumo", "pontos_principais", "recomendacoes", "nivel_atencao"]
+        if any(insights.get(field) in (None, "", [], "Não disponível") for field in required_fields):
+            return "missing_fields"
+        
+        return None
+    
+    @staticmethod
+    def _count(counter: Dict[str, int], key: str):
+        counter[key] = counter.get(key, 0) + 1
+    
+    def _record_model_latency(self, model: str, seconds: float):
+        stats = self.model_stats.setdefault(model, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        stats["calls"] += 1
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+    
+    @staticmethod
+    def _confidence_text(confidence_score: Optional[float]) -> str:
+        """Frase sobre a confiança da extração para o prompt"""
+        if not confidence_score:
+            return ""
+        
+        confidence_pct = confidence_score * 100
+        if confidence_pct >= 90:
+            return f"Os dados foram extraídos com alta confiança ({confidence_pct:.1f}%)."
+        elif confidence_pct >= 70:
+            return f"Os dados foram extraídos com confiança moderada ({confidence_pct:.1f}%). Recomenda-se revisão."
+        return f"Os dados foram extraídos com baixa confiança ({confidence_pct:.1f}%). Verificação manual necessária."
+    
     def _build_analysis_prompt(
         self, 
         extracted_data: Dict[str, Any], 
@@ -67,18 +260,20 @@ class GPTClient:
     ) -> str:
         """Constrói prompt contextualizado para análise do documento"""
         
-        confidence_text = ""
-        if confidence_score:
-            confidence_pct = confidence_score * 100
-            if confidence_pct >= 90:
-                confidence_text = f"Os dados foram extraídos com alta confiança ({confidence_pct:.1f}%)."
-            elif confidence_pct >= 70:
-                confidence_text = f"Os dados foram extraídos com confiança moderada ({confidence_pct:.1f}%). Recomenda-se revisão."
-            else:
-                confidence_text = f"Os dados foram extraídos com baixa confiança ({confidence_pct:.1f}%). Verificação manual necessária."
+        confidence_text = self._confidence_text(confidence_score)
+        
+        # Dados compactados para o prompt (sem metadados, listas longas resumidas)
+        compacted = compact_extracted_data(extracted_data, document_type, self.prompt_token_budget)
+        data_text = compacted["text"]
         
-        # Dados formatados para o prompt
-        data_text = json.dumps(extracted_data, indent=2, ensure_ascii=False)
+        saved = compacted["original_tokens"] - compacted["tokens"]
+        self.prompt_stats["prompts"] += 1
+        self.prompt_stats["original_tokens"] += compacted["original_tokens"]
+        self.prompt_stats["tokens"] += compacted["tokens"]
+        logger.info(
+            f"Prompt de {original_filename}: {compacted['tokens']} tokens estimados nos dados "
+            f"(original {compacted['original_tokens']}, {saved} economizados)"
+        )
         
         prompt = f"""
 Você é um analista especializado em documentos corporativos. Analise os dados extraídos abaixo e forneça insights estratégicos.
@@ -107,16 +302,9 @@ Seja objetivo, prático e focado em ações. Use linguagem profissional mas aces
 """
         return prompt
     
-    async def _call_openai_api(self, prompt: str) -> str:
-        """Faz chamada assíncrona para a API da OpenAI"""
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": self.model,
+    def _build_request_payload(self, prompt: str, model: Optional[str] = None, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            "model": model or self.model,
             "messages": [
                 {
                     "role": "system",
@@ -128,27 +316,126 @@ Seja objetivo, prático e focado em ações. Use linguagem profissional mas aces
                 }
             ],
             "temperature": self.temperature,
-            "max_tokens": self.max_tokens
+            "max_tokens": max_tokens or self.max_tokens
+        }
+    
+    def _request_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
         }
+    
+    def _estimate_request_tokens(self, payload: Dict[str, Any]) -> int:
+        """Tokens estimados da chamada: mensagens + limite de resposta"""
+        messages = json.dumps(payload["messages"], ensure_ascii=False)
+        return estimate_tokens(messages) + payload["max_tokens"]
+    
+    def _check_response_status(self, response: aiohttp.ClientResponse):
+        """Repassa 429 ao agendador (pausa global pelo Retry-After)"""
+        if response.status == 429:
+            openai_scheduler.record_throttle(parse_retry_after(response.headers.get("Retry-After")))
+    
+    async def _call_openai_api(
+        self,
+        prompt: str,
+        priority: str = LANE_INTERACTIVE,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """Faz chamada assíncrona para a API da OpenAI"""
+        
+        payload = self._build_request_payload(prompt, model, max_tokens)
+        ticket = await openai_scheduler.acquire(priority, self._estimate_request_tokens(payload))
+        
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        session = http_pool.get_session("openai")
+        
+        async with session.post(
+            self.api_url,
+            headers=self._request_headers(),
+            json=payload,
+            timeout=timeout
+        ) as response:
+            
+            if response.status != 200:
+                self._check_response_status(response)
+                error_text = await response.text()
+                raise Exception(f"OpenAI API error {response.status}: {error_text}")
+            
+            result = await response.json()
+            openai_scheduler.reconcile(ticket, (result.get("usage") or {}).get("total_tokens"))
+            return result["choices"][0]["message"]["content"]
+    
+    async def _stream_openai_api(
+        self,
+        prompt: str,
+        on_progress: ProgressCallback,
+        priority: str = LANE_INTERACTIVE,
+        model: Optional[str] = None
+    ) -> str:
+        """
+        Faz chamada com stream=True e consome os eventos SSE da OpenAI
+        
+        Cada campo de nível superior do JSON é enviado a on_progress assim que
+        termina de chegar. Retorna o conteúdo completo da resposta.
+        """
+        payload = self._build_request_payload(prompt, model)
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+        ticket = await openai_scheduler.acquire(priority, self._estimate_request_tokens(payload))
         
         timeout = aiohttp.ClientTimeout(total=self.timeout)
+        session = http_pool.get_session("openai")
+        parser = IncrementalJSONFieldParser()
+        content_parts = []
         
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=payload
-            ) as response:
+        async with session.post(
+            self.api_url,
+            headers=self._request_headers(),
+            json=payload,
+            timeout=timeout
+        ) as response:
+            
+            if response.status != 200:
+                self._check_response_status(response)
+                error_text = await response.text()
+                raise Exception(f"OpenAI API error {response.status}: {error_text}")
+            
+            used_tokens = None
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                
+                try:
+                    event = json.loads(data)
+                    # Último evento (stream_options.include_usage): uso real, sem choices
+                    if event.get("usage"):
+                        used_tokens = event["usage"].get("total_tokens")
+                    delta = event["choices"][0].get("delta", {}).get("content")
+                except (ValueError, KeyError, IndexError):
+                    continue
                 
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"OpenAI API error {response.status}: {error_text}")
+                if not delta:
+                    continue
                 
-                result = await response.json()
-                return result["choices"][0]["message"]["content"]
+                content_parts.append(delta)
+                for field, value in parser.feed(delta):
+                    try:
+                        await on_progress(field, value)
+                    except Exception as e:
+                        logger.error(f"Erro ao repassar progresso de insights: {str(e)}")
+        
+        openai_scheduler.reconcile(ticket, used_tokens)
+        return "".join(content_parts)
     
-    def _parse_gpt_response(self, response: str) -> Dict[str, Any]:
+    def _parse_gpt_response(self, response: str, model: Optional[str] = None) -> Dict[str, Any]:
         """Processa resposta do GPT e extrai JSON"""
+        model = model or self.model
         try:
             # Tentar extrair JSON da resposta
             response = response.strip()
@@ -170,7 +457,7 @@ Seja objetivo, prático e focado em ações. Use linguagem profissional mas aces
             
             # Adicionar metadados
             insights["gerado_em"] = datetime.utcnow().isoformat()
-            insights["modelo_usado"] = self.model
+            insights["modelo_usado"] = model
             insights["fonte"] = "openai_gpt4"
             
             return insights
@@ -187,7 +474,7 @@ Seja objetivo, prático e focado em ações. Use linguagem profissional mas aces
                 "nivel_atencao": "medio",
                 "observacoes": "Resposta do GPT não pôde ser processada como JSON",
                 "gerado_em": datetime.utcnow().isoformat(),
-                "modelo_usado": self.model,
+                "modelo_usado": model,
                 "fonte": "openai_gpt4_fallback"
             }
     
@@ -257,7 +544,36 @@ Seja objetivo, prático e focado em ações. Use linguagem profissional mas aces
             "model": self.model,
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
-            "timeout": self.timeout
+            "timeout": self.timeout,
+            "streaming": self.streaming,
+            "prompt_compaction": {
+                "token_budget": self.prompt_token_budget,
+                "tokens_saved": self.prompt_stats["original_tokens"] - self.prompt_stats["tokens"],
+                **self.prompt_stats
+            },
+            "http_pool": http_pool.get_stats().get("openai"),
+            "scheduler": openai_scheduler.get_stats(),
+            "cascade": {
+                "enabled": self.cascade_enabled,
+                "fast_model": self.fast_model,
+                "min_confidence": self.cascade_min_confidence,
+                "high_stakes_types": sorted(self.high_stakes_types),
+                "escalation_rate": (
+                    round(sum(self.cascade_stats["escalations"].values()) / self.cascade_stats["requests"], 3)
+                    if self.cascade_stats["requests"] else 0.0
+                ),
+                **self.cascade_stats
+            },
+            "microbatch": self.microbatcher.get_stats(),
+            "model_latency": {
+                model: {
+                    "calls": stats["calls"],
+                    "avg_seconds": round(stats["total_seconds"] / stats["calls"], 3),
+                    "max_seconds": round(stats["max_seconds"], 3)
+                }
+                for model, stats in self.model_stats.items()
+            },
+            "insights_cache": insights_cache.get_stats()
         }
 
 # Instância global do cliente
@@ -267,12 +583,15 @@ async def generate_document_insights(
     extracted_data: Dict[str, Any], 
     document_type: str,
     original_filename: str,
-    confidence_score: Optional[float] = None
+    confidence_score: Optional[float] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    priority: str = LANE_INTERACTIVE,
+    document_id: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Função de conveniência para gerar insights de documentos
     """
     return await gpt_client.generate_document_insights(
-        extracted_data, document_type, original_filename, confidence_score
+        extracted_data, document_type, original_filename, confidence_score, on_progress, priority, document_id
     )
 
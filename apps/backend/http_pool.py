@@ -0,0 +1,178 @@
+"""
+Pool compartilhado de sessões HTTP (aiohttp) para clientes externos
+Uma sessão por serviço (Wu3, OpenAI), criada no startup da aplicação e fechada no shutdown
+"""
+import os
+import logging
+from typing import Dict, Any, Optional
+
+import aiohttp
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações padrão
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+
+
+class HTTPClientPool:
+    """
+    Gerencia sessões aiohttp nomeadas com pool de conexões
+
+    Cada sessão reutiliza conexões keep-alive, limita conexões por host e
+    mantém cache de DNS. Contadores alimentados por TraceConfig permitem
+    dimensionar o pool sob carga (conexões abertas, ociosas e requisições aguardando conexão).
+    """
+
+    def __init__(self):
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def register(
+        self,
+        name: str,
+        limit: int = HTTP_POOL_LIMIT,
+        limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout: float = HTTP_KEEPALIVE_SECONDS,
+        dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+        timeout_seconds: Optional[float] = None,
+        connect_timeout_seconds: float = HTTP_CONNECT_TIMEOUT_SECONDS
+    ):
+        """Registra a configuração de uma sessão nomeada"""
+        self._configs[name] = {
+            "limit": limit,
+            "limit_per_host": limit_per_host,
+            "keepalive_timeout": keepalive_timeout,
+            "dns_cache_ttl": dns_cache_ttl,
+            "timeout_seconds": timeout_seconds,
+            "connect_timeout_seconds": connect_timeout_seconds
+        }
+        self._counters.setdefault(name, {
+            "requests_total": 0,
+            "requests_in_flight": 0,
+            "waiting": 0,
+            "connections_created": 0,
+            "connections_reused": 0
+        })
+
+    async def start(self):
+        """Cria as sessões registradas (chamar no startup da aplicação)"""
+        for name in self._configs:
+            self.get_session(name)
+        logger.info(f"Pool HTTP iniciado: {', '.join(self._configs) or 'nenhuma sessão'}")
+
+    async def close(self):
+        """Fecha todas as sessões (chamar no shutdown da aplicação)"""
+        for name, session in list(self._sessions.items()):
+            if not session.closed:
+                await session.close()
+            logger.info(f"Sessão HTTP '{name}' fechada")
+        self._sessions = {}
+
+    def get_session(self, name: str) -> aiohttp.ClientSession:
+        """
+        Retorna a sessão compartilhada do serviço
+
+        A sessão é criada sob demanda se o startup ainda não ocorreu (scripts, testes).
+        Deve ser chamada dentro de um event loop em execução.
+        """
+        session = self._sessions.get(name)
+        if session is not None and not session.closed:
+            return session
+
+        if name not in self._configs:
+            self.register(name)
+
+        session = self._create_session(name, self._configs[name])
+        self._sessions[name] = session
+        return session
+
+    def _create_session(self, name: str, config: Dict[str, Any]) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=config["limit"],
+            limit_per_host=config["limit_per_host"],
+            keepalive_timeout=config["keepalive_timeout"],
+            ttl_dns_cache=config["dns_cache_ttl"],
+            use_dns_cache=True
+        )
+
+        timeout = aiohttp.ClientTimeout(
+            total=config["timeout_seconds"],
+            connect=config["connect_timeout_seconds"]
+        )
+
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[self._build_trace_config(name)]
+        )
+
+    def _build_trace_config(self, name: str) -> aiohttp.TraceConfig:
+        counters = self._counters[name]
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            counters["requests_total"] += 1
+            counters["requests_in_flight"] += 1
+
+        async def on_request_finished(session, context, params):
+            counters["requests_in_flight"] -= 1
+
+        async def on_connection_queued_start(session, context, params):
+            counters["waiting"] += 1
+
+        async def on_connection_queued_end(session, context, params):
+            counters["waiting"] -= 1
+
+        async def on_connection_create_end(session, context, params):
+            counters["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            counters["connections_reused"] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_finished)
+        trace_config.on_request_exception.append(on_request_finished)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(on_connection_queued_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+
+        return trace_config
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas por sessão: conexões abertas, ociosas, em uso e requisições aguardando"""
+        stats = {}
+
+        for name, config in self._configs.items():
+            session = self._sessions.get(name)
+            in_use = 0
+            idle = 0
+
+            if session is not None and not session.closed:
+                connector = session.connector
+                # Atributos internos do TCPConnector (aiohttp 3.x)
+                in_use = len(getattr(connector, "_acquired", ()))
+                idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+
+            stats[name] = {
+                "active": session is not None and not session.closed,
+                "open": in_use + idle,
+                "in_use": in_use,
+                "idle": idle,
+                "limit": config["limit"],
+                "limit_per_host": config["limit_per_host"],
+                **self._counters[name]
+            }
+
+        return stats
+
+
+# Instância global do pool
+http_pool = HTTPClientPool()
@@ -0,0 +1,341 @@
+"""
+Cache de insights GPT em dois níveis
+L1: LRU em memória com TTL; L2: persistente (tabela PostgreSQL ou Redis)
+Chave: hash canônico de (modelo, temperatura, max_tokens, tipo de documento, dados extraídos)
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional
+
+from sqlalchemy import select, delete, func
+
+# Redis é opcional: sem o pacote, o backend 'redis' degrada para o armazenamento em memória
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - depende do ambiente
+    aioredis = None
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações
+INSIGHTS_CACHE_BACKEND = os.getenv("INSIGHTS_CACHE_BACKEND", "postgres")  # postgres, redis, memory, none
+INSIGHTS_CACHE_TTL_SECONDS = int(os.getenv("INSIGHTS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+INSIGHTS_CACHE_MAX_ENTRIES = int(os.getenv("INSIGHTS_CACHE_MAX_ENTRIES", "1000"))
+INSIGHTS_CACHE_MAX_ROWS = int(os.getenv("INSIGHTS_CACHE_MAX_ROWS", "100000"))
+INSIGHTS_CACHE_PRUNE_EVERY = int(os.getenv("INSIGHTS_CACHE_PRUNE_EVERY", "500"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def build_cache_key(
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    document_type: str,
+    extracted_data: Dict[str, Any]
+) -> str:
+    """
+    Hash canônico dos parâmetros que determinam os insights
+
+    JSON com chaves ordenadas e separadores fixos: a ordem dos campos extraídos
+    não altera a chave.
+    """
+    canonical = json.dumps(
+        {
+            "model": model,
+            "temperature": round(float(temperature), 4),
+            "max_tokens": int(max_tokens),
+            "document_type": document_type,
+            "extracted_data": extracted_data
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LRUTTLCache:
+    """LRU em memória com limite de entradas e expiração por TTL"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # chave -> (expira_em, valor)
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        return self._entries.pop(key, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MemoryInsightsStore:
+    """Armazenamento L2 em memória (desenvolvimento, testes e substituto do Redis)"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = INSIGHTS_CACHE_MAX_ROWS):
+        self._cache = LRUTTLCache(max_entries, INSIGHTS_CACHE_TTL_SECONDS)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, insights: Dict[str, Any], ttl_seconds: int, model: str, document_type: str):
+        self._cache.set(key, insights, ttl_seconds)
+
+    async def delete(self, key: str):
+        self._cache.delete(key)
+
+
+class RedisInsightsStore:
+    """Armazenamento L2 no Redis (expiração via SETEX; limite de memória pela política do Redis)"""
+
+    name = "redis"
+
+    def __init__(self, redis_url: str = REDIS_URL):
+        self.client = aioredis.from_url(redis_url)
+
+    def _key(self, key: str) -> str:
+        return f"orbit:insights:{key}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = await self.client.get(self._key(key))
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, insights: Dict[str, Any], ttl_seconds: int, model: str, document_type: str):
+        await self.client.setex(self._key(key), ttl_seconds, json.dumps(insights, ensure_ascii=False))
+
+    async def delete(self, key: str):
+        await self.client.delete(self._key(key))
+
+
+class PostgresInsightsStore:
+    """
+    Armazenamento L2 na tabela insights_cache
+
+    Entradas expiradas são ignoradas na leitura e removidas periodicamente; acima de
+    INSIGHTS_CACHE_MAX_ROWS as menos acessadas recentemente são descartadas.
+    """
+
+    name = "postgres"
+
+    def __init__(self, session_factory=None, max_rows: int = INSIGHTS_CACHE_MAX_ROWS, prune_every: int = INSIGHTS_CACHE_PRUNE_EVERY):
+        if session_factory is None:
+            from database import AsyncSessionLocal
+            session_factory = AsyncSessionLocal
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self._sets_since_prune = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        from models import InsightsCacheEntry
+
+        async with self.session_factory() as db:
+            entry = await db.scalar(
+                select(InsightsCacheEntry).where(
+                    InsightsCacheEntry.cache_key == key,
+                    InsightsCacheEntry.expires_at > _utcnow()
+                )
+            )
+            if entry is None:
+                return None
+
+            entry.hit_count += 1
+            entry.last_accessed_at = _utcnow()
+            insights = json.loads(entry.insights)
+            await db.commit()
+            return insights
+
+    async def set(self, key: str, insights: Dict[str, Any], ttl_seconds: int, model: str, document_type: str):
+        from models import InsightsCacheEntry
+
+        now = _utcnow()
+        async with self.session_factory() as db:
+            await db.merge(InsightsCacheEntry(
+                cache_key=key,
+                model=model,
+                document_type=document_type,
+                insights=json.dumps(insights, ensure_ascii=False),
+                hit_count=0,
+                created_at=now,
+                last_accessed_at=now,
+                expires_at=now + timedelta(seconds=ttl_seconds)
+            ))
+            await db.commit()
+
+        self._sets_since_prune += 1
+        if self._sets_since_prune >= self.prune_every:
+            self._sets_since_prune = 0
+            await self.prune()
+
+    async def delete(self, key: str):
+        from models import InsightsCacheEntry
+
+        async with self.session_factory() as db:
+            await db.execute(delete(InsightsCacheEntry).where(InsightsCacheEntry.cache_key == key))
+            await db.commit()
+
+    async def prune(self) -> int:
+        """Remove entradas expiradas e o excedente de max_rows (LRU por last_accessed_at)"""
+        from models import InsightsCacheEntry
+
+        async with self.session_factory() as db:
+            result = await db.execute(
+                delete(InsightsCacheEntry).where(InsightsCacheEntry.expires_at <= _utcnow())
+            )
+            removed = result.rowcount or 0
+
+            total = await db.scalar(select(func.count()).select_from(InsightsCacheEntry))
+            if total > self.max_rows:
+                oldest = select(InsightsCacheEntry.cache_key).order_by(
+                    InsightsCacheEntry.last_accessed_at
+                ).limit(total - self.max_rows)
+                result = await db.execute(
+                    delete(InsightsCacheEntry).where(InsightsCacheEntry.cache_key.in_(oldest))
+                )
+                removed += result.rowcount or 0
+
+            await db.commit()
+
+        if removed:
+            logger.info(f"Cache de insights: {removed} entradas removidas da tabela")
+        return removed
+
+
+class InsightsCache:
+    """
+    Cache de insights em dois níveis
+
+    Leitura: L1 (memória) → L2 (persistente) → miss. Um hit no L2 repopula o L1.
+    Falhas no L2 nunca impedem a geração de insights: são registradas e tratadas como miss.
+    """
+
+    def __init__(self, backend: str = INSIGHTS_CACHE_BACKEND, max_entries: int = INSIGHTS_CACHE_MAX_ENTRIES, ttl_seconds: int = INSIGHTS_CACHE_TTL_SECONDS):
+        self.enabled = backend != "none"
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUTTLCache(max_entries, ttl_seconds)
+        self.store = self._create_store(backend) if self.enabled else None
+        self.stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "invalidations": 0,
+            "errors": 0
+        }
+
+    @staticmethod
+    def _create_store(backend: str):
+        if backend == "memory":
+            return MemoryInsightsStore()
+        if backend == "redis":
+            if aioredis is None:
+                logger.warning("Cache de insights: pacote redis não instalado, usando armazenamento em memória")
+                return MemoryInsightsStore()
+            return RedisInsightsStore()
+        return PostgresInsightsStore()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+
+        insights = self.local.get(key)
+        if insights is not None:
+            self.stats["l1_hits"] += 1
+            return insights
+
+        try:
+            insights = await self.store.get(key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Erro ao ler cache de insights ({self.store.name}): {str(e)}")
+            insights = None
+
+        if insights is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["l2_hits"] += 1
+        self.local.set(key, insights)
+        return insights
+
+    async def set(self, key: str, insights: Dict[str, Any], model: str, document_type: str):
+        if not self.enabled:
+            return
+
+        self.local.set(key, insights)
+        self.stats["sets"] += 1
+
+        try:
+            await self.store.set(key, insights, self.ttl_seconds, model, document_type)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Erro ao gravar cache de insights ({self.store.name}): {str(e)}")
+
+    async def invalidate(self, key: str):
+        """Remove a entrada dos dois níveis"""
+        if not self.enabled:
+            return
+
+        self.local.delete(key)
+        self.stats["invalidations"] += 1
+
+        try:
+            await self.store.delete(key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Erro ao invalidar cache de insights ({self.store.name}): {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["l1_hits"] + self.stats["l2_hits"] + self.stats["misses"]
+        hits = self.stats["l1_hits"] + self.stats["l2_hits"]
+        return {
+            "enabled": self.enabled,
+            "backend": self.store.name if self.store else "none",
+            "ttl_seconds": self.ttl_seconds,
+            "l1_entries": len(self.local),
+            "l1_max_entries": self.local.max_entries,
+            "l1_evictions": self.local.evictions,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            **self.stats
+        }
+
+
+# Instância global do cache
+insights_cache = InsightsCache()
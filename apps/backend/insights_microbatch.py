@@ -0,0 +1,282 @@
+"""
+Micro-lotes de insights GPT
+Agrupa documentos pequenos e compatíveis numa única chamada à OpenAI que devolve
+um array JSON com um objeto por documento, distribuído de volta a cada chamador
+"""
+import os
+import json
+import asyncio
+import logging
+from typing import Dict, Any, Optional, List, Set, Tuple
+
+from prompt_compaction import compact_extracted_data
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações
+GPT_MICROBATCH_ENABLED = os.getenv("GPT_MICROBATCH_ENABLED", "false").lower() == "true"
+GPT_MICROBATCH_MAX_DOCUMENTS = int(os.getenv("GPT_MICROBATCH_MAX_DOCUMENTS", "5"))
+GPT_MICROBATCH_WINDOW_SECONDS = float(os.getenv("GPT_MICROBATCH_WINDOW_SECONDS", "0.5"))
+GPT_MICROBATCH_TOKEN_BUDGET = int(os.getenv("GPT_MICROBATCH_TOKEN_BUDGET", "3000"))
+# Só documentos pequenos entram em lote (tokens estimados dos dados compactados)
+GPT_MICROBATCH_MAX_DOCUMENT_TOKENS = int(os.getenv("GPT_MICROBATCH_MAX_DOCUMENT_TOKENS", "400"))
+GPT_MICROBATCH_MAX_OUTPUT_TOKENS = int(os.getenv("GPT_MICROBATCH_MAX_OUTPUT_TOKENS", "4000"))
+
+
+class _Entry:
+    __slots__ = ("document_id", "extracted_data", "document_type", "original_filename",
+                 "confidence_score", "data_text", "tokens", "future")
+
+    def __init__(self, document_id, extracted_data, document_type, original_filename, confidence_score, data_text, tokens):
+        self.document_id = document_id
+        self.extracted_data = extracted_data
+        self.document_type = document_type
+        self.original_filename = original_filename
+        self.confidence_score = confidence_score
+        self.data_text = data_text
+        self.tokens = tokens
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class InsightsMicroBatcher:
+    """
+    Agrupa pedidos de insights em background por (tipo de documento, fila de prioridade)
+
+    Um grupo é enviado quando atinge max_documents, quando o próximo documento
+    estouraria o orçamento de tokens ou quando a janela de espera termina. A
+    resposta é um array JSON com document_id em cada objeto; documentos ausentes,
+    inválidos ou um lote que não pôde ser interpretado voltam para a chamada
+    individual do cliente GPT.
+    """
+
+    def __init__(
+        self,
+        client,
+        enabled: bool = GPT_MICROBATCH_ENABLED,
+        max_documents: int = GPT_MICROBATCH_MAX_DOCUMENTS,
+        window_seconds: float = GPT_MICROBATCH_WINDOW_SECONDS,
+        token_budget: int = GPT_MICROBATCH_TOKEN_BUDGET,
+        max_document_tokens: int = GPT_MICROBATCH_MAX_DOCUMENT_TOKENS
+    ):
+        self.client = client
+        self.enabled = enabled
+        self.max_documents = max_documents
+        self.window_seconds = window_seconds
+        self.token_budget = token_budget
+        self.max_document_tokens = max_document_tokens
+        self._groups: Dict[Tuple[str, str], List[_Entry]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.Task] = {}
+        # Lotes em andamento (referência mantida até terminarem)
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {"batches": 0, "documents": 0, "fallbacks": 0, "parse_failures": 0}
+
+    @property
+    def model(self) -> str:
+        """Modelo das chamadas em lote (o rápido, com a cascata habilitada)"""
+        return self.client.fast_model if self.client.cascade_enabled else self.client.model
+
+    def accepts(self, document_type: str, priority: str, data_tokens: int, confidence_score: Optional[float] = None) -> bool:
+        """
+        Documento pequeno de fila em background (chamadas interativas nunca esperam a janela)
+
+        Só entram documentos que a cascata enviaria primeiro ao modelo do lote: tipos de
+        alto risco e extrações de baixa confiança seguem direto para o modelo principal.
+        """
+        from openai_scheduler import LANE_INTERACTIVE
+
+        return (
+            self.enabled
+            and self.max_documents > 1
+            and priority != LANE_INTERACTIVE
+            and data_tokens <= self.max_document_tokens
+            and self.client.first_model(document_type, confidence_score) == self.model
+        )
+
+    def compact(self, extracted_data: Dict[str, Any], document_type: str) -> Dict[str, Any]:
+        return compact_extracted_data(extracted_data, document_type, self.client.prompt_token_budget)
+
+    async def submit(
+        self,
+        document_id: str,
+        extracted_data: Dict[str, Any],
+        document_type: str,
+        original_filename: str,
+        confidence_score: Optional[float],
+        priority: str,
+        compacted: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Adiciona o documento a um grupo e aguarda os insights dele"""
+        compacted = compacted or self.compact(extracted_data, document_type)
+        entry = _Entry(
+            document_id, extracted_data, document_type, original_filename,
+            confidence_score, compacted["text"], compacted["tokens"]
+        )
+        key = (document_type, priority)
+
+        group = self._groups.get(key)
+        if group and sum(item.tokens for item in group) + entry.tokens > self.token_budget:
+            self._flush(key)
+            group = None
+
+        if not group:
+            group = self._groups[key] = []
+            self._timers[key] = asyncio.create_task(self._flush_after(key))
+
+        group.append(entry)
+        if len(group) >= self.max_documents:
+            self._flush(key)
+
+        return await asyncio.shield(entry.future)
+
+    async def _flush_after(self, key: Tuple[str, str]):
+        await asyncio.sleep(self.window_seconds)
+        self._timers.pop(key, None)
+        self._flush(key)
+
+    def _flush(self, key: Tuple[str, str]):
+        # Grupo enviado antes do fim da janela: cancelar o timer
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        group = self._groups.pop(key, None)
+        if group:
+            task = asyncio.create_task(self._run(group, priority=key[1]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Envia os grupos ainda na janela de espera e aguarda os lotes em andamento"""
+        for key in list(self._groups):
+            self._flush(key)
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, group: List[_Entry], priority: str):
+        results: Dict[str, Dict[str, Any]] = {}
+
+        if len(group) > 1:
+            self.stats["batches"] += 1
+            self.stats["documents"] += len(group)
+            try:
+                results = await self._request_batch(group, priority)
+            except Exception as e:
+                self.stats["parse_failures"] += 1
+                logger.error(f"Erro no micro-lote de {len(group)} documentos, usando chamadas individuais: {str(e)}")
+
+            self.stats["fallbacks"] += sum(1 for entry in group if entry.document_id not in results)
+
+        await asyncio.gather(*(self._resolve(entry, results.get(entry.document_id), priority) for entry in group))
+
+    async def _resolve(self, entry: _Entry, insights: Optional[Dict[str, Any]], priority: str):
+        try:
+            if insights is None:
+                insights = await self.client._request_insights(
+                    entry.extracted_data, entry.document_type, entry.original_filename,
+                    entry.confidence_score, None, priority
+                )
+        except Exception as e:
+            if not entry.future.done():
+                entry.future.set_exception(e)
+            return
+
+        if not entry.future.done():
+            entry.future.set_result(insights)
+
+    async def _request_batch(self, group: List[_Entry], priority: str) -> Dict[str, Dict[str, Any]]:
+        """Uma chamada para o grupo; retorna os insights válidos por document_id"""
+        client = self.client
+        model = self.model
+        max_tokens = min(client.max_tokens * len(group), GPT_MICROBATCH_MAX_OUTPUT_TOKENS)
+
+        response = await client._call_openai_api(self.build_prompt(group), priority, model, max_tokens)
+        items = parse_batch_response(response)
+
+        expected = {entry.document_id for entry in group}
+        results = {}
+        for item in items:
+            document_id = str(item.pop("document_id", ""))
+            if document_id not in expected:
+                continue
+            insights = client._parse_gpt_response(json.dumps(item, ensure_ascii=False), model)
+            if client._escalation_reason(insights) is None:
+                results[document_id] = insights
+
+        logger.info(f"Micro-lote: {len(results)}/{len(group)} documentos respondidos numa única chamada")
+        return results
+
+    def build_prompt(self, group: List[_Entry]) -> str:
+        documents = "\n\n".join(
+            f"DOCUMENT_ID: {entry.document_id}\n"
+            f"DOCUMENTO: {entry.original_filename}\n"
+            f"TIPO: {entry.document_type}\n"
+            f"{self.client._confidence_text(entry.confidence_score)}\n"
+            f"DADOS EXTRAÍDOS:\n{entry.data_text}"
+            for entry in group
+        )
+
+        return f"""
+Você é um analista especializado em documentos corporativos. Analise SEPARADAMENTE cada um dos {len(group)} documentos abaixo e forneça insights estratégicos para cada um.
+
+{documents}
+
+Responda apenas com um array JSON contendo um objeto por documento, na mesma ordem, com os campos:
+
+[
+  {{
+    "document_id": "DOCUMENT_ID do documento analisado",
+    "resumo": "Resumo executivo do documento em 2-3 frases",
+    "pontos_principais": ["Lista de 3-5 pontos mais importantes"],
+    "riscos_identificados": ["Lista de riscos ou alertas identificados"],
+    "recomendacoes": ["Lista de 2-4 ações recomendadas"],
+    "proximos_passos": ["Lista de próximos passos sugeridos"],
+    "nivel_atencao": "baixo|medio|alto",
+    "prazo_sugerido": "Prazo sugerido para ação (ex: '30 dias', 'imediato', etc.)",
+    "observacoes": "Observações adicionais relevantes"
+  }}
+]
+
+Seja objetivo, prático e focado em ações. Use linguagem profissional mas acessível.
+"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "max_documents": self.max_documents,
+            "window_seconds": self.window_seconds,
+            "token_budget": self.token_budget,
+            "max_document_tokens": self.max_document_tokens,
+            "pending": sum(len(group) for group in self._groups.values()),
+            "running": len(self._tasks),
+            **self.stats
+        }
+
+
+def parse_batch_response(response: str) -> List[Dict[str, Any]]:
+    """
+    Extrai a lista de objetos da resposta do lote
+
+    Aceita o array puro, cercas de markdown ou um objeto com o array numa chave.
+
+    Raises:
+        ValueError: Se a resposta não contém uma lista de objetos
+    """
+    response = response.strip()
+    if response.startswith("```json"):
+        response = response[7:]
+    elif response.startswith("```"):
+        response = response[3:]
+    if response.endswith("```"):
+        response = response[:-3]
+
+    parsed = json.loads(response)
+    if isinstance(parsed, dict):
+        parsed = next((value for value in parsed.values() if isinstance(value, list)), None)
+
+    if not isinstance(parsed, list):
+        raise ValueError("Resposta do lote não é um array JSON")
+
+    return [item for item in parsed if isinstance(item, dict)]
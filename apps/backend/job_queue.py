@@ -0,0 +1,510 @@
+"""
+Fila persistente de jobs de processamento de documentos
+Implementação em PostgreSQL (SELECT ... FOR UPDATE SKIP LOCKED) e implementação em memória para testes
+"""
+import os
+import asyncio
+import logging
+import itertools
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, List
+
+from sqlalchemy import select, insert, update, func, or_, and_, event
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "postgres")  # postgres, memory
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_LOCK_TIMEOUT_SECONDS = int(os.getenv("JOB_LOCK_TIMEOUT_SECONDS", "300"))
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobQueue(ABC):
+    """Interface comum das filas de jobs"""
+
+    def __init__(self):
+        # Acorda workers locais assim que um job é enfileirado
+        self._new_job_event = asyncio.Event()
+
+    @abstractmethod
+    async def enqueue(
+        self,
+        document_id: str,
+        job_type: str = 'process_document',
+        delay_seconds: float = 0,
+        parked: bool = False,
+        user_id: Optional[int] = None,
+        batch_id: Optional[str] = None,
+        db=None
+    ) -> int:
+        """
+        Enfileira um job e retorna seu ID
+
+        Jobs estacionados (parked=True) não são reservados até release_parked().
+        Com db (AsyncSession do chamador), o job é criado na transação dele, junto com
+        o documento: o commit do chamador grava os dois ou nenhum.
+        """
+
+    @abstractmethod
+    async def enqueue_many(
+        self,
+        document_ids: List[str],
+        job_type: str,
+        user_id: Optional[int] = None,
+        batch_id: Optional[str] = None,
+        db=None
+    ) -> int:
+        """
+        Enfileira um job por documento de uma só vez e retorna quantos foram criados
+
+        Com db, os jobs entram na transação do chamador (como em enqueue)
+        """
+
+    @abstractmethod
+    async def claim(
+        self,
+        worker_id: str,
+        job_types: Optional[List[str]] = None,
+        max_per_user: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Reserva o próximo job disponível para o worker, ou None se a fila estiver vazia
+
+        Divisão justa entre usuários: entre os jobs disponíveis, tem prioridade o usuário
+        com menos jobs em execução (dos tipos pedidos); com max_per_user, usuários que já
+        atingiram o limite são ignorados até liberarem vagas.
+        """
+
+    @abstractmethod
+    async def complete(self, job_id: int):
+        """Marca o job como concluído"""
+
+    @abstractmethod
+    async def fail(self, job_id: int, error: str, retry_delay_seconds: float = 0) -> bool:
+        """
+        Registra falha do job
+
+        Returns:
+            True se o job foi reagendado, False se esgotou as tentativas
+        """
+
+    @abstractmethod
+    async def park(self, job_id: int):
+        """Estaciona o job (dependência externa indisponível) sem consumir tentativa"""
+
+    @abstractmethod
+    async def release_parked(self, limit: Optional[int] = None) -> int:
+        """Libera jobs estacionados (mais antigos primeiro) e retorna quantos foram liberados"""
+
+    async def wait_for_job(self, timeout: float):
+        """Aguarda um novo job local ou o fim do timeout (polling)"""
+        try:
+            await asyncio.wait_for(self._new_job_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._new_job_event.clear()
+
+    def _notify(self):
+        self._new_job_event.set()
+
+    def _notify_on_commit(self, db):
+        """Acorda os workers só quando a transação do chamador tornar os jobs visíveis"""
+        event.listen(db.sync_session, "after_commit", lambda session: self._notify(), once=True)
+
+
+class InMemoryJobQueue(JobQueue):
+    """Fila em memória com a mesma semântica da fila PostgreSQL (usada em testes e desenvolvimento)"""
+
+    def __init__(self):
+        super().__init__()
+        self.jobs: Dict[int, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._lock = asyncio.Lock()
+
+    def _new_job(self, document_id: str, job_type: str, delay_seconds: float, parked: bool, user_id: Optional[int], batch_id: Optional[str]) -> int:
+        job_id = next(self._ids)
+        self.jobs[job_id] = {
+            "id": job_id,
+            "document_id": document_id,
+            "job_type": job_type,
+            "user_id": user_id,
+            "batch_id": batch_id,
+            "status": "parked" if parked else "pending",
+            "attempts": 0,
+            "max_attempts": JOB_MAX_ATTEMPTS,
+            "run_after": _utcnow() + timedelta(seconds=delay_seconds),
+            "locked_at": None,
+            "locked_by": None,
+            "last_error": None
+        }
+        return job_id
+
+    async def enqueue(
+        self,
+        document_id: str,
+        job_type: str = 'process_document',
+        delay_seconds: float = 0,
+        parked: bool = False,
+        user_id: Optional[int] = None,
+        batch_id: Optional[str] = None,
+        db=None
+    ) -> int:
+        # Sem transação: o job fica disponível imediatamente mesmo com db
+        async with self._lock:
+            job_id = self._new_job(document_id, job_type, delay_seconds, parked, user_id, batch_id)
+        self._notify()
+        return job_id
+
+    async def enqueue_many(
+        self,
+        document_ids: List[str],
+        job_type: str,
+        user_id: Optional[int] = None,
+        batch_id: Optional[str] = None,
+        db=None
+    ) -> int:
+        async with self._lock:
+            for document_id in document_ids:
+                self._new_job(document_id, job_type, 0, False, user_id, batch_id)
+        self._notify()
+        return len(document_ids)
+
+    async def claim(
+        self,
+        worker_id: str,
+        job_types: Optional[List[str]] = None,
+        max_per_user: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        now = _utcnow()
+        stale_before = now - timedelta(seconds=JOB_LOCK_TIMEOUT_SECONDS)
+
+        async with self._lock:
+            jobs = [job for job in self.jobs.values() if job_types is None or job["job_type"] in job_types]
+            running_by_user = Counter(
+                job["user_id"] for job in jobs
+                if job["status"] == "running" and job["locked_at"] >= stale_before and job["user_id"] is not None
+            )
+
+            candidates = [
+                job for job in jobs
+                if (job["status"] == "pending" and job["run_after"] <= now)
+                or (job["status"] == "running" and job["locked_at"] < stale_before)
+            ]
+            if max_per_user:
+                candidates = [
+                    job for job in candidates
+                    if job["user_id"] is None or running_by_user[job["user_id"]] < max_per_user
+                ]
+            if not candidates:
+                return None
+
+            job = min(candidates, key=lambda j: (running_by_user[j["user_id"]], j["run_after"], j["id"]))
+            job["status"] = "running"
+            job["attempts"] += 1
+            job["locked_at"] = now
+            job["locked_by"] = worker_id
+            return dict(job)
+
+    async def complete(self, job_id: int):
+        async with self._lock:
+            self.jobs[job_id]["status"] = "done"
+            self.jobs[job_id]["locked_at"] = None
+
+    async def fail(self, job_id: int, error: str, retry_delay_seconds: float = 0) -> bool:
+        async with self._lock:
+            job = self.jobs[job_id]
+            job["last_error"] = error
+            job["locked_at"] = None
+
+            if job["attempts"] >= job["max_attempts"]:
+                job["status"] = "failed"
+                return False
+
+            job["status"] = "pending"
+            job["run_after"] = _utcnow() + timedelta(seconds=retry_delay_seconds)
+        self._notify()
+        return True
+
+    async def park(self, job_id: int):
+        async with self._lock:
+            job = self.jobs[job_id]
+            job["status"] = "parked"
+            job["attempts"] = max(0, job["attempts"] - 1)
+            job["locked_at"] = None
+
+    async def release_parked(self, limit: Optional[int] = None) -> int:
+        async with self._lock:
+            parked = sorted(
+                (job for job in self.jobs.values() if job["status"] == "parked"),
+                key=lambda j: (j["run_after"], j["id"])
+            )[:limit]
+            now = _utcnow()
+            for job in parked:
+                job["status"] = "pending"
+                job["run_after"] = now
+
+        if parked:
+            self._notify()
+        return len(parked)
+
+
+class PostgresJobQueue(JobQueue):
+    """
+    Fila persistente na tabela processing_jobs
+
+    Vários workers (em vários processos) podem reservar jobs ao mesmo tempo:
+    SELECT ... FOR UPDATE SKIP LOCKED garante que cada job é entregue a um único worker.
+    Jobs 'running' com lock mais antigo que JOB_LOCK_TIMEOUT_SECONDS são considerados
+    abandonados (worker morto) e voltam a ser reservados.
+    """
+
+    def __init__(self, session_factory=None):
+        super().__init__()
+        if session_factory is None:
+            from database import AsyncSessionLocal
+            session_factory = AsyncSessionLocal
+        self.session_factory = session_factory
+
+    async def enqueue(
+        self,
+        document_id: str,
+        job_type: str = 'process_document',
+        delay_seconds: float = 0,
+        parked: bool = False,
+        user_id: Optional[int] = None,
+        batch_id: Optional[str] = None,
+        db=None
+    ) -> int:
+        from models import ProcessingJob
+
+        job = ProcessingJob(
+            document_id=document_id,
+            job_type=job_type,
+            user_id=user_id,
+            batch_id=batch_id,
+            status='parked' if parked else 'pending',
+            attempts=0,
+            max_attempts=JOB_MAX_ATTEMPTS,
+            run_after=_utcnow() + timedelta(seconds=delay_seconds)
+        )
+
+        if db is not None:
+            # Commit fica com o chamador; flush só para obter o ID
+            db.add(job)
+            await db.flush([job])
+            self._notify_on_commit(db)
+            return job.id
+
+        async with self.session_factory() as session:
+            session.add(job)
+            await session.commit()
+            job_id = job.id
+
+        self._notify()
+        return job_id
+
+    async def enqueue_many(
+        self,
+        document_ids: List[str],
+        job_type: str,
+        user_id: Optional[int] = None,
+        batch_id: Optional[str] = None,
+        db=None
+    ) -> int:
+        from models import ProcessingJob
+
+        if not document_ids:
+            return 0
+
+        now = _utcnow()
+        rows = [
+            {
+                "document_id": document_id,
+                "job_type": job_type,
+                "user_id": user_id,
+                "batch_id": batch_id,
+                "status": 'pending',
+                "attempts": 0,
+                "max_attempts": JOB_MAX_ATTEMPTS,
+                "run_after": now
+            }
+            for document_id in document_ids
+        ]
+
+        if db is not None:
+            await db.execute(insert(ProcessingJob), rows)
+            self._notify_on_commit(db)
+            return len(document_ids)
+
+        async with self.session_factory() as session:
+            await session.execute(insert(ProcessingJob), rows)
+            await session.commit()
+
+        self._notify()
+        return len(document_ids)
+
+    async def claim(
+        self,
+        worker_id: str,
+        job_types: Optional[List[str]] = None,
+        max_per_user: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        from models import ProcessingJob
+
+        now = _utcnow()
+        stale_before = now - timedelta(seconds=JOB_LOCK_TIMEOUT_SECONDS)
+        type_filter = [ProcessingJob.job_type.in_(job_types)] if job_types else []
+
+        # Jobs em execução por usuário (divisão justa entre usuários)
+        running = select(
+            ProcessingJob.user_id,
+            func.count().label("running")
+        ).where(
+            ProcessingJob.status == 'running',
+            ProcessingJob.locked_at >= stale_before,
+            ProcessingJob.user_id.is_not(None),
+            *type_filter
+        ).group_by(ProcessingJob.user_id).subquery()
+        running_count = func.coalesce(running.c.running, 0)
+
+        query = select(ProcessingJob).outerjoin(
+            running, running.c.user_id == ProcessingJob.user_id
+        ).where(
+            or_(
+                and_(ProcessingJob.status == 'pending', ProcessingJob.run_after <= now),
+                and_(ProcessingJob.status == 'running', ProcessingJob.locked_at < stale_before)
+            ),
+            *type_filter
+        )
+        if max_per_user:
+            query = query.where(or_(ProcessingJob.user_id.is_(None), running_count < max_per_user))
+
+        async with self.session_factory() as db:
+            job = await db.scalar(
+                query.order_by(
+                    running_count, ProcessingJob.run_after, ProcessingJob.id
+                ).limit(1).with_for_update(of=ProcessingJob, skip_locked=True)
+            )
+
+            if job is None:
+                await db.rollback()
+                return None
+
+            job.status = 'running'
+            job.attempts += 1
+            job.locked_at = now
+            job.locked_by = worker_id
+            job.updated_at = now
+            await db.commit()
+
+            return {
+                "id": job.id,
+                "document_id": job.document_id,
+                "job_type": job.job_type,
+                "user_id": job.user_id,
+                "batch_id": job.batch_id,
+                "attempts": job.attempts,
+                "max_attempts": job.max_attempts
+            }
+
+    async def complete(self, job_id: int):
+        from models import ProcessingJob
+
+        async with self.session_factory() as db:
+            await db.execute(
+                update(ProcessingJob).where(ProcessingJob.id == job_id).values(
+                    status='done',
+                    locked_at=None,
+                    updated_at=_utcnow()
+                )
+            )
+            await db.commit()
+
+    async def fail(self, job_id: int, error: str, retry_delay_seconds: float = 0) -> bool:
+        from models import ProcessingJob
+
+        async with self.session_factory() as db:
+            job = await db.scalar(
+                select(ProcessingJob).where(ProcessingJob.id == job_id).with_for_update()
+            )
+            if job is None:
+                return False
+
+            job.last_error = error
+            job.locked_at = None
+            job.updated_at = _utcnow()
+
+            rescheduled = job.attempts < job.max_attempts
+            if rescheduled:
+                job.status = 'pending'
+                job.run_after = _utcnow() + timedelta(seconds=retry_delay_seconds)
+            else:
+                job.status = 'failed'
+
+            await db.commit()
+
+        if rescheduled:
+            self._notify()
+        return rescheduled
+
+    async def park(self, job_id: int):
+        from models import ProcessingJob
+
+        async with self.session_factory() as db:
+            await db.execute(
+                update(ProcessingJob).where(ProcessingJob.id == job_id).values(
+                    status='parked',
+                    attempts=func.greatest(ProcessingJob.attempts - 1, 0),
+                    locked_at=None,
+                    updated_at=_utcnow()
+                )
+            )
+            await db.commit()
+
+    async def release_parked(self, limit: Optional[int] = None) -> int:
+        from models import ProcessingJob
+
+        now = _utcnow()
+        async with self.session_factory() as db:
+            parked_ids = select(ProcessingJob.id).where(
+                ProcessingJob.status == 'parked'
+            ).order_by(
+                ProcessingJob.run_after, ProcessingJob.id
+            ).limit(limit).with_for_update(skip_locked=True)
+
+            result = await db.execute(
+                update(ProcessingJob).where(ProcessingJob.id.in_(parked_ids)).values(
+                    status='pending',
+                    run_after=now,
+                    updated_at=now
+                )
+            )
+            await db.commit()
+
+        if result.rowcount:
+            self._notify()
+        return result.rowcount or 0
+
+
+def create_job_queue(backend: Optional[str] = None) -> JobQueue:
+    """Cria a fila configurada em JOB_QUEUE_BACKEND"""
+    backend = (backend or JOB_QUEUE_BACKEND).lower()
+
+    if backend == "memory":
+        logger.info("Usando fila de jobs em memória")
+        return InMemoryJobQueue()
+
+    return PostgresJobQueue()
+
+
+# Instância global da fila
+job_queue = create_job_queue()
@@ -1,15 +1,17 @@
 from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import List, Optional
+import aiofiles.os
 import os
 import uuid
 import json
 import logging
 from datetime import datetime
-import asyncio
 
-from database import get_db, create_tables
+from database import get_async_db, create_tables_async, dispose_engines, AsyncSessionLocal
 from models import User, Document
 from auth import (
     LoginRequest, RegisterRequest, LoginResponse, UserProfile, UserCreate,
@@ -17,6 +19,11 @@ from auth import (
     verify_admin, get_user_by_email
 )
 from wu3_client import wu3_client
+from circuit_breaker import OPEN
+from storage_service import UPLOAD_DIR, save_upload_stream, store_content_addressed, release_stored_file
+from job_queue import job_queue
+from http_pool import http_pool
+from document_pipeline import worker_pool, insights_worker_pool, DOCUMENT_WORKERS, INSIGHTS_BATCH_CONCURRENCY
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -40,7 +47,49 @@ app.add_middleware(
 # Criar tabelas na inicialização (em produção, usar migrations)
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
+    await create_tables_async()
+    
+    # Carregar amostras gravadas para perfis replay do motor de simulação Wu3
+    from wu3_service import wu3_fallback_engine
+    if wu3_fallback_engine.needs_replay_samples():
+        async with AsyncSessionLocal() as db:
+            await wu3_fallback_engine.load_replay_samples(db)
+    
+    # Sessões HTTP compartilhadas para Wu3 e OpenAI
+    import gpt_client  # registra a sessão 'openai' no pool
+    await http_pool.start()
+    
+    # Workers de processamento (DOCUMENT_WORKERS=0 para processos apenas de API)
+    if DOCUMENT_WORKERS > 0:
+        worker_pool.start()
+    if INSIGHTS_BATCH_CONCURRENCY > 0:
+        insights_worker_pool.start()
+    
+    # Consulta ativa de status para documentos cujo webhook da Wu3 não chegou
+    from wu3_reconciler import wu3_reconciler, WU3_POLL_ENABLED
+    if WU3_POLL_ENABLED and not wu3_client.is_fallback_mode:
+        wu3_reconciler.start()
+    
+    # Partições mensais de documents: as do mês atual em diante precisam existir antes
+    # da primeira inserção; a manutenção periódica cria as seguintes e arquiva as frias
+    from document_partitions import partition_manager, DOCUMENT_PARTITIONS_ENABLED
+    await partition_manager.ensure_partitions()
+    if DOCUMENT_PARTITIONS_ENABLED:
+        partition_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from wu3_reconciler import wu3_reconciler
+    from document_partitions import partition_manager
+    await wu3_reconciler.stop()
+    await partition_manager.stop()
+    await insights_worker_pool.stop()
+    await worker_pool.stop()
+    # Micro-lotes de insights ainda em andamento usam a sessão HTTP da OpenAI
+    from gpt_client import gpt_client
+    await gpt_client.microbatcher.stop()
+    await http_pool.close()
+    await dispose_engines()
 
 @app.get("/")
 async def root():
@@ -51,11 +100,11 @@ async def health_check():
     return {"status": "ok"}
 
 @app.post("/api/login", response_model=LoginResponse)
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Endpoint de login que autentica usuário e retorna token JWT
     """
-    user = authenticate_user(db, login_data.email, login_data.password)
+    user = await authenticate_user(db, login_data.email, login_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -79,7 +128,7 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     )
 
 @app.post("/api/user/register", status_code=status.HTTP_201_CREATED)
-async def register_user(user_data: RegisterRequest, db: Session = Depends(get_db)):
+async def register_user(user_data: RegisterRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Endpoint para criar novo usuário (temporário para desenvolvimento)
     """
@@ -91,7 +140,7 @@ async def register_user(user_data: RegisterRequest, db: Session = Depends(get_db
     )
     
     try:
-        user = create_user(db, user_create)
+        user = await create_user(db, user_create)
         return {
             "message": "Usuário criado com sucesso",
             "user": {
@@ -124,16 +173,16 @@ async def get_user_profile(current_user: User = Depends(get_current_user)):
     )
 
 @app.get("/api/admin/dashboard")
-async def admin_dashboard(admin_user: User = Depends(verify_admin), db: Session = Depends(get_db)):
+async def admin_dashboard(admin_user: User = Depends(verify_admin), db: AsyncSession = Depends(get_async_db)):
     """
     Endpoint do dashboard administrativo (apenas para admins)
     """
     # Buscar estatísticas do sistema
-    total_users = db.query(User).count()
-    active_users = db.query(User).filter(User.is_active == True).count()
+    total_users = await db.scalar(select(func.count(User.id)))
+    active_users = await db.scalar(select(func.count(User.id)).where(User.is_active == True))
     
     # Buscar lista de usuários
-    users = db.query(User).all()
+    users = (await db.execute(select(User))).scalars().all()
     users_list = [
         {
             "id": user.id,
@@ -157,6 +206,30 @@ async def admin_dashboard(admin_user: User = Depends(verify_admin), db: Session
         "users": users_list
     }
 
+@app.post("/api/admin/document-stats/repair")
+async def repair_document_stats(admin_user: User = Depends(verify_admin)):
+    """
+    Recalcula as estatísticas de documentos a partir da tabela documents (apenas para admins)
+
+    Corrige e reporta os contadores divergentes (esperado x armazenado).
+    """
+    from document_stats import repair_document_stats as repair
+
+    return await repair()
+
+@app.post("/api/admin/document-partitions/archive")
+async def archive_document_partitions(older_than_months: int, admin_user: User = Depends(verify_admin)):
+    """
+    Move para o schema de arquivo as partições de documents com mais de N meses (apenas para admins)
+    """
+    from document_partitions import partition_manager
+
+    if older_than_months < 1:
+        raise HTTPException(status_code=400, detail="older_than_months deve ser maior que zero")
+
+    archived = await partition_manager.archive_partitions(older_than_months)
+    return {"archived": archived, "partitions": partition_manager.get_stats()}
+
 @app.get("/api/client/dashboard")
 async def client_dashboard(current_user: User = Depends(get_current_user)):
     """
@@ -181,15 +254,17 @@ async def client_dashboard(current_user: User = Depends(get_current_user)):
     }
 
 # Endpoints de documentos
-@app.post("/api/documents/upload")
+@app.post("/api/documents/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(
     file: UploadFile = File(...),
     document_type: str = Form(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Realiza upload de documento e inicia processamento com IA Wu3
+    Realiza upload de documento e enfileira o processamento com IA Wu3
+    
+    Retorna 202 imediatamente; o resultado chega via WebSocket (document_processed)
     """
     # Validar tipo de arquivo
     allowed_extensions = ['.pdf', '.jpg', '.jpeg', '.png', '.docx', '.doc']
@@ -204,182 +279,116 @@ async def upload_document(
     # Gerar ID único para o documento
     document_id = str(uuid.uuid4())
     
-    # Criar diretório de upload se não existir
-    upload_dir = "/home/ubuntu/orbit/apps/backend/uploads"
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    # Salvar arquivo
-    file_path = os.path.join(upload_dir, f"{document_id}_{file.filename}")
+    # Salvar arquivo em blocos (memória constante, sem bloquear o event loop)
+    temp_path = os.path.join(UPLOAD_DIR, "tmp", f"{document_id}{file_extension}")
     
     try:
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        stored_file = await save_upload_stream(file, temp_path)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao salvar arquivo: {str(e)}")
     
-    # Criar registro no banco
-    document = Document(
-        id=document_id,
-        user_id=current_user.id,
-        document_type=document_type,
-        original_filename=file.filename,
-        file_path=file_path,
-        status='processing'
+    logger.info(
+        f"Upload {document_id} recebido: {stored_file['size_bytes']} bytes, sha256={stored_file['sha256']}"
     )
     
-    db.add(document)
-    db.commit()
-    db.refresh(document)
+    # Conteúdo já processado pode ser reaproveitado mesmo com a Wu3 indisponível
+    from document_pipeline import find_reusable_document
+    reusable = await find_reusable_document(db, stored_file['sha256'], document_type, document_id)
+    
+    # Com o circuito da Wu3 aberto o documento fica na fila até o serviço voltar
+    wu3_unavailable = reusable is None and wu3_client.circuit_breaker.state == OPEN
     
-    # Processar documento com IA Wu3 real
     try:
-        # Usar cliente Wu3 real (com fallback para mock se não configurado)
-        wu3_result = await wu3_client.process_document(file_path, document_type, document_id)
-        
-        # Atualizar documento com resultado da Wu3
-        document.extracted_data = json.dumps(wu3_result.get('extracted_data', {}))
-        document.confidence_score = str(wu3_result.get('confidence_score', 0.0))
-        document.status = wu3_result.get('status', 'complete')
-        document.wu3_document_id = wu3_result.get('wu3_document_id')
-        document.wu3_request_id = wu3_result.get('wu3_request_id')
-        document.error_message = wu3_result.get('error_message')
-        document.processing_time_seconds = str(wu3_result.get('processing_time_seconds', 0.0))
-        document.wu3_version = wu3_result.get('wu3_version')
-        
-        db.commit()
-        
-        # Se houve erro no processamento Wu3
-        if wu3_result.get('status') == 'failed':
-            return {
-                "status": "failed",
-                "document_id": document_id,
-                "message": f"Erro no processamento: {wu3_result.get('error_message', 'Erro desconhecido')}",
-                "error_message": wu3_result.get('error_message')
-            }
-        
-        # Sucesso no processamento Wu3
-        upload_response = {
-            "status": "success",
-            "document_id": document_id,
-            "message": "Documento processado com sucesso",
-            "extracted_data": wu3_result.get('extracted_data', {}),
-            "confidence_score": wu3_result.get('confidence_score', 0.0),
-            "wu3_document_id": wu3_result.get('wu3_document_id'),
-            "processing_time": wu3_result.get('processing_time_seconds', 0.0)
-        }
+        # Arquivo armazenado uma única vez por conteúdo (contagem de referências)
+        file_path = await store_content_addressed(
+            db, temp_path, stored_file['sha256'], stored_file['size_bytes'], file_extension
+        )
         
-        # Gerar insights automaticamente se habilitado
-        try:
-            from gpt_client import gpt_client
-            
-            if gpt_client.enabled and wu3_result.get('status') == 'complete':
-                # Marcar como gerando insights
-                document.insights_status = 'generating'
-                db.commit()
-                
-                # Gerar insights em background (assíncrono)
-                asyncio.create_task(generate_insights_background(
-                    document_id=document_id,
-                    extracted_data=wu3_result.get('extracted_data', {}),
-                    document_type=document_type,
-                    original_filename=file.filename,
-                    confidence_score=wu3_result.get('confidence_score'),
-                    user_id=current_user.id
-                ))
-                
-                upload_response["insights_generation"] = "started"
-                upload_response["message"] += " - Gerando insights inteligentes..."
-            else:
-                upload_response["insights_generation"] = "disabled"
-                
-        except Exception as insights_error:
-            logger.warning(f"Erro ao iniciar geração de insights: {str(insights_error)}")
-            upload_response["insights_generation"] = "error"
+        # Criar registro no banco (na mesma transação da referência ao arquivo)
+        document = Document(
+            id=document_id,
+            user_id=current_user.id,
+            document_type=document_type,
+            original_filename=file.filename,
+            file_path=file_path,
+            content_hash=stored_file['sha256'],
+            file_size=stored_file['size_bytes'],
+            status='queued' if wu3_unavailable else 'processing'
+        )
+        db.add(document)
         
-        return upload_response
+        # Enfileirar processamento Wu3 → insights GPT → notificação (executado pelos workers).
+        # Job na mesma transação do documento: nunca fica documento sem job nem job sem documento
+        job_id = await job_queue.enqueue(document_id, parked=wu3_unavailable, user_id=current_user.id, db=db)
         
+        await db.commit()
     except Exception as e:
-        # Em caso de erro, atualizar status no banco
-        document.status = 'failed'
-        document.error_message = str(e)
-        db.commit()
-        
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Erro no processamento: {str(e)}"
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Erro ao salvar documento: {str(e)}")
+    
+    return {
+        "status": "accepted",
+        "document_id": document_id,
+        "job_id": job_id,
+        "document_status": document.status,
+        "message": (
+            "Documento recebido. Serviço de extração indisponível no momento; o processamento será feito automaticamente"
+            if wu3_unavailable else "Documento recebido e enviado para processamento"
         )
+    }
 
 @app.get("/api/documents")
 async def list_documents(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    status: Optional[str] = None,
+    document_type: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Lista documentos do usuário atual
-    """
-    documents = db.query(Document).filter(Document.user_id == current_user.id).all()
+    Lista documentos do usuário atual, mais recentes primeiro
     
-    result = []
-    for doc in documents:
-        extracted_data = {}
-        if doc.extracted_data:
-            try:
-                extracted_data = json.loads(doc.extracted_data)
-            except:
-                extracted_data = {}
-        
-        result.append({
-            "id": doc.id,
-            "document_type": doc.document_type,
-            "original_filename": doc.original_filename,
-            "status": doc.status,
-            "confidence_score": float(doc.confidence_score) if doc.confidence_score else None,
-            "extracted_data": extracted_data,
-            "created_at": doc.created_at.isoformat() if doc.created_at else None
-        })
-    
-    return {"documents": result}
-
-@app.get("/api/documents/{document_id}")
-async def get_document(
-    document_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Obtém detalhes de um documento específico
+    Paginação por cursor: next_cursor da resposta vai no parâmetro cursor da próxima
+    página (null na última). Filtros opcionais por status, tipo e intervalo de
+    criação [created_from, created_to).
+    
+    Campos: fields (lista separada por vírgulas) substitui os campos padrão da
+    listagem e include acrescenta a eles (ex.: include=extracted_data). Colunas
+    JSON pesadas ficam fora por padrão.
     """
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.user_id == current_user.id
-    ).first()
+    from document_queries import user_documents_query, DOCUMENTS_PAGE_SIZE, DOCUMENTS_MAX_PAGE_SIZE, encode_cursor
+    from document_fields import LIST_FIELDS, resolve_fields, fields_options, serialize_document
     
-    if not document:
-        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    page_size = min(max(limit or DOCUMENTS_PAGE_SIZE, 1), DOCUMENTS_MAX_PAGE_SIZE)
     
-    extracted_data = {}
-    if document.extracted_data:
-        try:
-            extracted_data = json.loads(document.extracted_data)
-        except:
-            extracted_data = {}
+    try:
+        selected = resolve_fields(fields, include, LIST_FIELDS)
+        query = user_documents_query(
+            current_user.id, cursor=cursor, status=status, document_type=document_type,
+            created_from=created_from, created_to=created_to
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Só as colunas pedidas (created_at sempre, para o cursor); um documento a mais indica próxima página
+    query = query.options(*fields_options(selected, Document.created_at)).limit(page_size + 1)
+    documents = (await db.execute(query)).scalars().all()
+    has_more = len(documents) > page_size
+    documents = documents[:page_size]
     
+    last = documents[-1] if documents else None
     return {
-        "id": document.id,
-        "document_type": document.document_type,
-        "original_filename": document.original_filename,
-        "status": document.status,
-        "confidence_score": float(document.confidence_score) if document.confidence_score else None,
-        "extracted_data": extracted_data,
-        "created_at": document.created_at.isoformat() if document.created_at else None
+        "documents": [serialize_document(doc, selected) for doc in documents],
+        "next_cursor": encode_cursor(last.created_at, last.id) if has_more else None
     }
 
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-
-
 @app.get("/api/documents/types")
 async def get_document_types():
     """
@@ -390,55 +399,118 @@ async def get_document_types():
 
 @app.get("/api/documents/stats")
 async def get_document_stats(
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Retorna estatísticas de documentos do usuário
+    
+    Com created_from/created_to, considera só os documentos criados em [created_from, created_to).
     """
-    from sqlalchemy import func
+    from document_stats import get_user_stats, get_user_stats_between
     
-    # Contar documentos por status
-    stats = db.query(
-        Document.status,
-        func.count(Document.id).label('count')
-    ).filter(
-        Document.user_id == current_user.id
-    ).group_by(Document.status).all()
+    if created_from or created_to:
+        # Agregação em documents restrita às partições do intervalo
+        return await get_user_stats_between(db, current_user.id, created_from, created_to)
     
-    # Contar documentos por tipo
-    type_stats = db.query(
-        Document.document_type,
-        func.count(Document.id).label('count')
-    ).filter(
-        Document.user_id == current_user.id
-    ).group_by(Document.document_type).all()
-    
-    # Total de documentos
-    total_documents = db.query(func.count(Document.id)).filter(
-        Document.user_id == current_user.id
-    ).scalar()
+    # Contadores mantidos a cada transição (tabela document_stats): uma leitura pela chave primária
+    return await get_user_stats(db, current_user.id)
+
+@app.get("/api/documents/stats/confidence")
+async def get_confidence_stats(
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Retorna a confiança média da extração por tipo de documento
+    (opcionalmente só dos documentos criados em [created_from, created_to))
+    """
+    from document_queries import confidence_by_type_query
     
-    # Documentos processados hoje
-    from datetime import date
-    today_documents = db.query(func.count(Document.id)).filter(
-        Document.user_id == current_user.id,
-        func.date(Document.created_at) == date.today()
-    ).scalar()
+    rows = (await db.execute(confidence_by_type_query(current_user.id, created_from, created_to))).all()
     
     return {
-        "total_documents": total_documents or 0,
-        "today_documents": today_documents or 0,
-        "by_status": {stat.status: stat.count for stat in stats},
-        "by_type": {stat.document_type: stat.count for stat in type_stats}
+        "by_type": {
+            row.document_type: {"average_confidence": round(float(row.average_confidence), 4), "count": row.count}
+            for row in rows
+        }
     }
 
+@app.get("/api/documents/{document_id}")
+async def get_document(
+    document_id: str,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Obtém detalhes de um documento específico
+    
+    Aceita fields/include como a listagem (ex.: include=gpt_insights,gpt_summary).
+    """
+    from document_fields import DETAIL_FIELDS, resolve_fields, fields_options, serialize_document
+    
+    try:
+        selected = resolve_fields(fields, include, DETAIL_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    document = await db.scalar(select(Document).options(*fields_options(selected)).where(
+        Document.id == document_id,
+        Document.user_id == current_user.id
+    ))
+    
+    if not document:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    
+    return serialize_document(document, selected)
+
+@app.delete("/api/documents/{document_id}")
+async def delete_document(
+    document_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Remove um documento do usuário e libera sua referência ao arquivo armazenado
+    """
+    document = await db.scalar(select(Document).where(
+        Document.id == document_id,
+        Document.user_id == current_user.id
+    ))
+    
+    if not document:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    
+    content_hash = document.content_hash
+    file_path = document.file_path
+    
+    await db.delete(document)
+    
+    if content_hash:
+        # Commit junto com a remoção do documento; o arquivo só é apagado sem outras referências
+        await release_stored_file(db, content_hash)
+    else:
+        # Uploads anteriores ao armazenamento por conteúdo têm arquivo próprio
+        await db.commit()
+        if file_path and await aiofiles.os.path.exists(file_path):
+            await aiofiles.os.remove(file_path)
+    
+    return {"success": True, "document_id": document_id}
 
 @app.get("/api/wu3/status")
 async def get_wu3_status(current_user: User = Depends(get_current_user)):
     """
     Verifica o status da configuração Wu3
     """
+    from wu3_service import wu3_fallback_engine
+    from wu3_reconciler import wu3_reconciler
+    
     is_valid, message = wu3_client.validate_configuration()
     
     return {
@@ -447,7 +519,22 @@ async def get_wu3_status(current_user: User = Depends(get_current_user)):
         "api_url": wu3_client.base_url,
         "has_api_key": bool(wu3_client.api_key and wu3_client.api_key != "seu_token_real_wu3_aqui"),
         "timeout": wu3_client.timeout,
-        "max_retries": wu3_client.max_retries
+        "max_retries": wu3_client.max_retries,
+        "fallback_profiles": wu3_fallback_engine.describe() if not is_valid else None,
+        "http_pool": http_pool.get_stats().get("wu3"),
+        "rate_limiter": await wu3_client.rate_limiter.get_stats(),
+        "circuit_breaker": wu3_client.circuit_breaker.get_status(),
+        "status_reconciler": wu3_reconciler.get_stats()
+    }
+
+@app.get("/api/http/pool/stats")
+async def get_http_pool_stats(current_user: User = Depends(get_current_user)):
+    """
+    Retorna estatísticas do pool de conexões HTTP (Wu3 e OpenAI)
+    """
+    return {
+        'http_pool': http_pool.get_stats(),
+        'timestamp': datetime.utcnow().isoformat()
     }
 
 @app.get("/api/wu3/document/{wu3_document_id}/status")
@@ -467,7 +554,7 @@ async def get_wu3_document_status(
 
 # Endpoint de webhook Wu3
 @app.post("/api/webhooks/wu3")
-async def receive_wu3_webhook(request: Request, db: Session = Depends(get_db)):
+async def receive_wu3_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Recebe notificação de processamento da IA Wu3
     """
@@ -563,7 +650,7 @@ async def get_websocket_stats(current_user: User = Depends(get_current_user)):
 @app.post("/api/websocket/test-notification")
 async def test_websocket_notification(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Endpoint de teste para enviar notificação WebSocket
@@ -596,18 +683,19 @@ async def test_websocket_notification(
 async def generate_document_insights_endpoint(
     document_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Gera insights inteligentes para um documento específico
     """
-    from gpt_client import generate_document_insights
+    from document_pipeline import load_extraction, claim_insights_generation, generate_insights_background
+    from single_flight import single_flight, flight_key
     
     # Buscar documento
-    document = db.query(Document).filter(
+    document = await db.scalar(select(Document).options(joinedload(Document.payload)).where(
         Document.id == document_id,
         Document.user_id == current_user.id
-    ).first()
+    ))
     
     if not document:
         raise HTTPException(status_code=404, detail="Documento não encontrado")
@@ -619,100 +707,53 @@ async def generate_document_insights_endpoint(
             detail="Documento ainda não foi processado completamente"
         )
     
-    # Verificar se já tem insights
-    if document.insights_status == 'generating':
-        return {
-            'status': 'generating',
-            'message': 'Insights já estão sendo gerados para este documento'
-        }
+    # Uma geração por documento: chamadas concorrentes aguardam o mesmo resultado
+    extracted_data, confidence_score = load_extraction(document)
     
-    try:
-        # Marcar como gerando
-        document.insights_status = 'generating'
-        db.commit()
-        
-        # Preparar dados extraídos
-        extracted_data = {}
-        if document.extracted_data:
-            try:
-                extracted_data = json.loads(document.extracted_data)
-            except json.JSONDecodeError:
-                extracted_data = {"raw_data": document.extracted_data}
-        
-        # Preparar score de confiança
-        confidence_score = None
-        if document.confidence_score:
-            try:
-                confidence_score = float(document.confidence_score)
-            except (ValueError, TypeError):
-                confidence_score = None
+    async def generate():
+        # UPDATE condicional: só uma requisição (em qualquer processo) marca 'generating'
+        if not await claim_insights_generation(document_id):
+            return {
+                'status': 'generating',
+                'message': 'Insights já estão sendo gerados para este documento'
+            }
         
-        # Gerar insights
-        insights = await generate_document_insights(
+        insights = await generate_insights_background(
+            document_id=document_id,
             extracted_data=extracted_data,
             document_type=document.document_type,
             original_filename=document.original_filename,
-            confidence_score=confidence_score
+            confidence_score=confidence_score,
+            user_id=current_user.id,
+            priority='interactive'
         )
         
-        # Salvar insights no banco
-        document.gpt_insights = json.dumps(insights, ensure_ascii=False)
-        document.gpt_summary = insights.get('resumo', 'Resumo não disponível')
-        document.gpt_generated_at = datetime.utcnow()
-        document.gpt_model_used = insights.get('modelo_usado', 'unknown')
-        document.insights_status = 'complete'
-        document.updated_at = datetime.utcnow()
-        
-        db.commit()
-        
-        # Enviar notificação WebSocket
-        from websocket_manager import websocket_manager
-        notification = {
-            'type': 'insights_generated',
-            'data': {
-                'document_id': document.id,
-                'original_filename': document.original_filename,
-                'insights_summary': insights.get('resumo', '')[:100] + '...'
-            },
-            'message': f'🧠 Insights gerados para {document.original_filename}',
-            'timestamp': datetime.utcnow().isoformat()
-        }
-        
-        await websocket_manager.send_personal_message(notification, str(current_user.id))
+        if insights is None:
+            raise HTTPException(status_code=500, detail="Erro ao gerar insights")
         
         return {
             'success': True,
-            'document_id': document.id,
+            'document_id': document_id,
             'insights': insights,
             'status': 'complete'
         }
-        
-    except Exception as e:
-        # Marcar como erro
-        document.insights_status = 'error'
-        document.error_message = str(e)
-        db.commit()
-        
-        logger.error(f"Erro ao gerar insights para documento {document_id}: {str(e)}")
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Erro ao gerar insights: {str(e)}"
-        )
+    
+    return await single_flight.do(flight_key(document_id, "generate_insights"), generate)
 
 @app.get("/api/documents/{document_id}/insights")
 async def get_document_insights(
     document_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Retorna insights de um documento específico
     """
     # Buscar documento
-    document = db.query(Document).filter(
+    document = await db.scalar(select(Document).options(joinedload(Document.payload)).where(
         Document.id == document_id,
         Document.user_id == current_user.id
-    ).first()
+    ))
     
     if not document:
         raise HTTPException(status_code=404, detail="Documento não encontrado")
@@ -729,10 +770,7 @@ async def get_document_insights(
     
     # Adicionar insights se disponíveis
     if document.gpt_insights:
-        try:
-            response['insights'] = json.loads(document.gpt_insights)
-        except json.JSONDecodeError:
-            response['insights'] = None
+        response['insights'] = document.gpt_insights
     
     return response
 
@@ -753,125 +791,123 @@ async def get_gpt_status(current_user: User = Depends(get_current_user)):
 @app.post("/api/documents/batch-generate-insights")
 async def batch_generate_insights(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Gera insights para todos os documentos do usuário que ainda não têm
+    
+    Cada documento vira um job na fila; os workers de insights processam o lote com
+    concorrência limitada e divisão justa entre usuários. O progresso é persistido em
+    insights_batches (GET /api/documents/insights-batches/{batch_id}) e enviado via
+    WebSocket (insights_batch_progress).
     """
+    from models import InsightsBatch
+    from document_queries import documents_needing_insights_query
+    from document_stats import record_transitions, INSIGHTS
+    
+    # O rollback em caso de falha expira current_user
+    user_id = current_user.id
+    
     # Buscar documentos sem insights
-    documents = db.query(Document).filter(
-        Document.user_id == current_user.id,
-        Document.status == 'complete',
-        Document.insights_status.in_(['pending', 'error'])
-    ).all()
+    candidates = (await db.execute(documents_needing_insights_query(user_id))).all()
     
-    if not documents:
+    if not candidates:
         return {
             'message': 'Nenhum documento encontrado para gerar insights',
             'documents_found': 0
         }
     
-    # Iniciar geração em background (simulado)
-    generated_count = 0
-    errors = []
-    
-    for document in documents[:5]:  # Limitar a 5 por vez para evitar sobrecarga
-        try:
-            # Marcar como gerando
-            document.insights_status = 'generating'
-            db.commit()
-            
-            # Aqui seria ideal usar uma task queue (Celery, RQ, etc.)
-            # Por simplicidade, vamos gerar de forma síncrona
-            
-            generated_count += 1
-            
-        except Exception as e:
-            errors.append({
-                'document_id': document.id,
-                'filename': document.original_filename,
-                'error': str(e)
-            })
+    async def move_insights_status(ids_by_status: dict, new_status: str) -> list:
+        """UPDATE condicional por valor anterior; só os documentos efetivamente alterados contam nas estatísticas"""
+        moved = []
+        for old_status, ids in ids_by_status.items():
+            previous = Document.insights_status.is_(None) if old_status is None else Document.insights_status == old_status
+            result = await db.execute(
+                update(Document).where(Document.id.in_(ids), previous).values(insights_status=new_status).returning(Document.id)
+            )
+            changed = result.scalars().all()
+            await record_transitions(db, user_id, INSIGHTS, [(old_status, new_status)] * len(changed))
+            moved.extend(changed)
+        return moved
+    
+    ids_by_status = {}
+    for candidate in candidates:
+        ids_by_status.setdefault(candidate.insights_status, []).append(candidate.id)
+    
+    # Status 'queued', lote e jobs na mesma transação: ou tudo é gravado ou nada
+    # ('queued' evita que o mesmo documento entre em dois lotes)
+    batch_id = str(uuid.uuid4())
+    try:
+        document_ids = await move_insights_status(ids_by_status, 'queued')
+        if not document_ids:
+            await db.rollback()
+            return {
+                'message': 'Nenhum documento encontrado para gerar insights',
+                'documents_found': 0
+            }
+        
+        db.add(InsightsBatch(
+            id=batch_id,
+            user_id=user_id,
+            status='running',
+            total=len(document_ids),
+            completed=0,
+            failed=0
+        ))
+        await job_queue.enqueue_many(document_ids, 'generate_insights', user_id=user_id, batch_id=batch_id, db=db)
+        await db.commit()
+    except Exception as e:
+        # O rollback devolve cada documento ao status que tinha (ids_by_status)
+        await db.rollback()
+        
+        # O lote fica registrado como 'failed' para consulta do progresso
+        db.add(InsightsBatch(
+            id=batch_id,
+            user_id=user_id,
+            status='failed',
+            total=sum(len(ids) for ids in ids_by_status.values()),
+            completed=0,
+            failed=0,
+            finished_at=datetime.utcnow()
+        ))
+        await db.commit()
+        
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao enfileirar geração de insights (lote {batch_id}): {str(e)}"
+        )
     
     return {
-        'message': f'Iniciada geração de insights para {generated_count} documentos',
-        'documents_found': len(documents),
-        'generation_started': generated_count,
-        'errors': errors
+        'message': f'Iniciada geração de insights para {len(document_ids)} documentos',
+        'batch_id': batch_id,
+        'documents_found': len(document_ids),
+        'generation_started': len(document_ids),
+        'errors': []
     }
 
-
-async def generate_insights_background(
-    document_id: str,
-    extracted_data: dict,
-    document_type: str,
-    original_filename: str,
-    confidence_score: float,
-    user_id: int
+@app.get("/api/documents/insights-batches/{batch_id}")
+async def get_insights_batch(
+    batch_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Gera insights em background após upload do documento
+    Retorna o progresso de um lote de geração de insights
     """
-    from gpt_client import generate_document_insights
-    from websocket_manager import websocket_manager
+    from models import InsightsBatch
+    from document_pipeline import batch_progress
     
-    try:
-        # Gerar insights
-        insights = await generate_document_insights(
-            extracted_data=extracted_data,
-            document_type=document_type,
-            original_filename=original_filename,
-            confidence_score=confidence_score
-        )
-        
-        # Atualizar banco de dados
-        db = next(get_db())
-        document = db.query(Document).filter(Document.id == document_id).first()
-        
-        if document:
-            document.gpt_insights = json.dumps(insights, ensure_ascii=False)
-            document.gpt_summary = insights.get('resumo', 'Resumo não disponível')
-            document.gpt_generated_at = datetime.utcnow()
-            document.gpt_model_used = insights.get('modelo_usado', 'unknown')
-            document.insights_status = 'complete'
-            document.updated_at = datetime.utcnow()
-            
-            db.commit()
-            
-            # Enviar notificação WebSocket
-            notification = {
-                'type': 'insights_generated',
-                'data': {
-                    'document_id': document.id,
-                    'original_filename': document.original_filename,
-                    'insights_summary': insights.get('resumo', '')[:100] + '...',
-                    'nivel_atencao': insights.get('nivel_atencao', 'medio')
-                },
-                'message': f'🧠 Insights gerados para {document.original_filename}',
-                'timestamp': datetime.utcnow().isoformat()
-            }
-            
-            await websocket_manager.send_personal_message(notification, str(user_id))
-            
-            logger.info(f"Insights gerados com sucesso para documento {document_id}")
-        
-        db.close()
-        
-    except Exception as e:
-        logger.error(f"Erro ao gerar insights em background para documento {document_id}: {str(e)}")
-        
-        # Marcar como erro no banco
-        try:
-            db = next(get_db())
-            document = db.query(Document).filter(Document.id == document_id).first()
-            
-            if document:
-                document.insights_status = 'error'
-                document.error_message = f"Erro ao gerar insights: {str(e)}"
-                db.commit()
-            
-            db.close()
-            
-        except Exception as db_error:
-            logger.error(f"Erro ao atualizar status de erro no banco: {str(db_error)}")
+    batch = await db.scalar(select(InsightsBatch).where(
+        InsightsBatch.id == batch_id,
+        InsightsBatch.user_id == current_user.id
+    ))
+    
+    if not batch:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+    
+    return batch_progress(batch)
+
 
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
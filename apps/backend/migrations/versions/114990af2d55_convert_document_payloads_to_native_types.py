@@ -0,0 +1,175 @@
+"""convert_document_payloads_to_native_types
+
+Revision ID: 114990af2d55
+Revises: 82a1250a214a
+Create Date: 2026-10-19 00:12:47.901533
+
+"""
+import os
+import time
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '114990af2d55'
+down_revision: Union[str, None] = '82a1250a214a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# Conversão em lotes pequenos, cada um na sua transação (bloqueia poucas linhas por vez)
+BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+BATCH_SLEEP_SECONDS = float(os.getenv("MIGRATION_BATCH_SLEEP_SECONDS", "0.05"))
+
+# coluna texto -> (coluna nova, tipo, expressão de conversão)
+CONVERSIONS = {
+    'extracted_data': ('extracted_data_jsonb', 'jsonb', "orbit_try_jsonb({value}, true)"),
+    'gpt_insights': ('gpt_insights_jsonb', 'jsonb', "orbit_try_jsonb({value}, false)"),
+    'confidence_score': ('confidence_score_real', 'real', "orbit_try_numeric({value})::real"),
+    'processing_time_seconds': ('processing_time_seconds_numeric', 'numeric(10, 3)', "orbit_try_numeric({value})"),
+}
+
+# Linhas com valor antigo ainda não convertido
+PENDING = " OR ".join(f"({old} IS NOT NULL AND {new} IS NULL)" for old, (new, _, _) in CONVERSIONS.items())
+
+
+def _assignments() -> str:
+    return ", ".join(f"{new} = {expression.format(value=old)}" for old, (new, _, expression) in CONVERSIONS.items())
+
+
+GIN_INDEXES = {
+    'ix_documents_extracted_data_gin': 'extracted_data',
+    'ix_documents_gpt_insights_gin': 'gpt_insights',
+}
+
+
+def _already_converted() -> bool:
+    """Execução anterior já trocou as colunas (falhou só na criação dos índices)"""
+    data_type = op.get_bind().execute(sa.text("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'documents' AND column_name = 'extracted_data' AND table_schema = current_schema()
+    """)).scalar()
+    return data_type == 'jsonb'
+
+
+def _prepare() -> None:
+    """Colunas novas, funções de conversão e trigger que mantém as colunas novas em dia"""
+    # Texto que não é JSON válido: dados extraídos ficam em raw_data (como a API já fazia), insights viram NULL
+    op.execute("""
+        CREATE OR REPLACE FUNCTION orbit_try_jsonb(value text, keep_raw boolean) RETURNS jsonb
+        LANGUAGE plpgsql IMMUTABLE AS $$
+        BEGIN
+            IF value IS NULL OR value = '' THEN
+                RETURN NULL;
+            END IF;
+            RETURN value::jsonb;
+        EXCEPTION WHEN others THEN
+            RETURN CASE WHEN keep_raw THEN jsonb_build_object('raw_data', value) END;
+        END $$
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION orbit_try_numeric(value text) RETURNS numeric
+        LANGUAGE plpgsql IMMUTABLE AS $$
+        BEGIN
+            RETURN NULLIF(trim(value), '')::numeric;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END $$
+    """)
+
+    for new, column_type, _ in CONVERSIONS.values():
+        op.execute(f"ALTER TABLE documents ADD COLUMN IF NOT EXISTS {new} {column_type}")
+
+    # Escritas da versão anterior da API durante a conversão também chegam às colunas novas
+    assignments = "\n".join(f"    NEW.{new} := {expression.format(value='NEW.' + old)};"
+                            for old, (new, _, expression) in CONVERSIONS.items())
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION orbit_documents_sync_native_types() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+        {assignments}
+            RETURN NEW;
+        END $$
+    """)
+    op.execute("DROP TRIGGER IF EXISTS documents_sync_native_types ON documents")
+    op.execute(f"""
+        CREATE TRIGGER documents_sync_native_types
+        BEFORE INSERT OR UPDATE OF {', '.join(CONVERSIONS)} ON documents
+        FOR EACH ROW EXECUTE FUNCTION orbit_documents_sync_native_types()
+    """)
+
+
+def _backfill() -> None:
+    """
+    Converte as linhas existentes em lotes por id
+
+    Retomável: uma nova execução pula as linhas já convertidas. O cursor por id
+    garante que cada linha é visitada uma vez (valores que não convertem não
+    prendem o laço).
+    """
+    bind = op.get_bind()
+    statement = sa.text(f"""
+        WITH batch AS (
+            SELECT id FROM documents
+            WHERE id > :last_id AND ({PENDING})
+            ORDER BY id
+            LIMIT :batch_size
+        )
+        UPDATE documents SET {_assignments()}
+        FROM batch WHERE documents.id = batch.id
+        RETURNING documents.id
+    """)
+
+    last_id, converted = '', 0
+    while True:
+        ids = bind.execute(statement, {"last_id": last_id, "batch_size": BATCH_SIZE}).scalars().all()
+        if not ids:
+            break
+        last_id = max(ids)
+        converted += len(ids)
+        logger.info(f"documents: {converted} linhas convertidas")
+        time.sleep(BATCH_SLEEP_SECONDS)
+
+
+def upgrade() -> None:
+    if not _already_converted():
+        with op.get_context().autocommit_block():
+            _prepare()
+            _backfill()
+
+        # Troca rápida das colunas, numa transação curta
+        op.execute("SET LOCAL lock_timeout = '10s'")
+        op.execute("LOCK TABLE documents IN ACCESS EXCLUSIVE MODE")
+        op.execute(f"UPDATE documents SET {_assignments()} WHERE {PENDING}")
+        op.execute("DROP TRIGGER IF EXISTS documents_sync_native_types ON documents")
+        op.execute("DROP FUNCTION IF EXISTS orbit_documents_sync_native_types()")
+        for old, (new, _, _) in CONVERSIONS.items():
+            op.drop_column('documents', old)
+            op.alter_column('documents', new, new_column_name=old)
+
+    with op.get_context().autocommit_block():
+        for name, column in GIN_INDEXES.items():
+            op.create_index(
+                name, 'documents', [column], unique=False,
+                postgresql_using='gin', postgresql_ops={column: 'jsonb_path_ops'},
+                postgresql_concurrently=True, if_not_exists=True
+            )
+        op.execute("DROP FUNCTION IF EXISTS orbit_try_jsonb(text, boolean)")
+        op.execute("DROP FUNCTION IF EXISTS orbit_try_numeric(text)")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in GIN_INDEXES:
+            op.drop_index(name, table_name='documents', postgresql_concurrently=True, if_exists=True)
+
+    for column in CONVERSIONS:
+        op.alter_column(
+            'documents', column, type_=sa.String(), existing_nullable=True,
+            postgresql_using=f"{column}::text"
+        )
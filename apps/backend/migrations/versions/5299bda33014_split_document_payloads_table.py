@@ -0,0 +1,164 @@
+"""split_document_payloads_table
+
+Revision ID: 5299bda33014
+Revises: 114990af2d55
+Create Date: 2026-10-19 01:36:20.118472
+
+"""
+import os
+import time
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5299bda33014'
+down_revision: Union[str, None] = '114990af2d55'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# Cópia em lotes pequenos, cada um na sua transação
+BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+BATCH_SLEEP_SECONDS = float(os.getenv("MIGRATION_BATCH_SLEEP_SECONDS", "0.05"))
+
+# Espaço livre por página de documents: updates de status cabem na mesma página (HOT)
+DOCUMENTS_FILLFACTOR = 80
+
+PAYLOAD_COLUMNS = ('extracted_data', 'gpt_insights', 'gpt_summary')
+HAS_PAYLOAD = " OR ".join(f"{column} IS NOT NULL" for column in PAYLOAD_COLUMNS)
+
+UPSERT_FROM_DOCUMENTS = f"""
+    INSERT INTO document_payloads (document_id, {', '.join(PAYLOAD_COLUMNS)})
+    SELECT id, {', '.join(PAYLOAD_COLUMNS)} FROM documents
+    WHERE {{where}}
+    ON CONFLICT (document_id) DO UPDATE SET
+        {', '.join(f'{column} = EXCLUDED.{column}' for column in PAYLOAD_COLUMNS)}
+"""
+
+GIN_INDEXES = {
+    'ix_document_payloads_extracted_data_gin': 'extracted_data',
+    'ix_document_payloads_gpt_insights_gin': 'gpt_insights',
+}
+
+
+def _already_split() -> bool:
+    """Execução anterior já removeu as colunas de documents (falhou só nos índices)"""
+    return not op.get_bind().execute(sa.text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'documents' AND column_name = 'extracted_data' AND table_schema = current_schema()
+    """)).scalar()
+
+
+def _prepare() -> None:
+    """Tabela nova e trigger que replica nela as escritas da versão anterior da API"""
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS document_payloads (
+            document_id VARCHAR NOT NULL PRIMARY KEY REFERENCES documents (id) ON DELETE CASCADE,
+            extracted_data JSONB,
+            gpt_insights JSONB,
+            gpt_summary VARCHAR
+        )
+    """)
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION orbit_documents_sync_payload() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO document_payloads (document_id, {', '.join(PAYLOAD_COLUMNS)})
+            VALUES (NEW.id, {', '.join(f'NEW.{column}' for column in PAYLOAD_COLUMNS)})
+            ON CONFLICT (document_id) DO UPDATE SET
+                {', '.join(f'{column} = EXCLUDED.{column}' for column in PAYLOAD_COLUMNS)};
+            RETURN NULL;
+        END $$
+    """)
+    op.execute("DROP TRIGGER IF EXISTS documents_sync_payload ON documents")
+    op.execute(f"""
+        CREATE TRIGGER documents_sync_payload
+        AFTER INSERT OR UPDATE OF {', '.join(PAYLOAD_COLUMNS)} ON documents
+        FOR EACH ROW EXECUTE FUNCTION orbit_documents_sync_payload()
+    """)
+
+
+def _backfill() -> None:
+    """
+    Copia os payloads existentes em lotes por id
+
+    Retomável: documentos que já têm linha em document_payloads são pulados.
+    """
+    bind = op.get_bind()
+    statement = sa.text(f"""
+        WITH batch AS (
+            SELECT id FROM documents
+            WHERE id > :last_id AND ({HAS_PAYLOAD})
+              AND NOT EXISTS (SELECT 1 FROM document_payloads WHERE document_id = documents.id)
+            ORDER BY id
+            LIMIT :batch_size
+        )
+        {UPSERT_FROM_DOCUMENTS.format(where="id IN (SELECT id FROM batch)")}
+        RETURNING document_id
+    """)
+
+    last_id, copied = '', 0
+    while True:
+        ids = bind.execute(statement, {"last_id": last_id, "batch_size": BATCH_SIZE}).scalars().all()
+        if not ids:
+            break
+        last_id = max(ids)
+        copied += len(ids)
+        logger.info(f"document_payloads: {copied} documentos copiados")
+        time.sleep(BATCH_SLEEP_SECONDS)
+
+
+def upgrade() -> None:
+    if not _already_split():
+        with op.get_context().autocommit_block():
+            _prepare()
+            _backfill()
+
+        # Remoção das colunas numa transação curta (DROP COLUMN não reescreve a tabela;
+        # o espaço volta conforme as linhas são atualizadas ou num VACUUM FULL/pg_repack)
+        op.execute("SET LOCAL lock_timeout = '10s'")
+        op.execute("LOCK TABLE documents IN ACCESS EXCLUSIVE MODE")
+        op.execute(UPSERT_FROM_DOCUMENTS.format(
+            where=f"({HAS_PAYLOAD}) AND NOT EXISTS (SELECT 1 FROM document_payloads WHERE document_id = documents.id)"
+        ))
+        op.execute("DROP TRIGGER IF EXISTS documents_sync_payload ON documents")
+        op.execute("DROP FUNCTION IF EXISTS orbit_documents_sync_payload()")
+        op.drop_index('ix_documents_extracted_data_gin', table_name='documents', if_exists=True)
+        op.drop_index('ix_documents_gpt_insights_gin', table_name='documents', if_exists=True)
+        for column in PAYLOAD_COLUMNS:
+            op.drop_column('documents', column)
+        op.execute(f"ALTER TABLE documents SET (fillfactor = {DOCUMENTS_FILLFACTOR})")
+
+    with op.get_context().autocommit_block():
+        for name, column in GIN_INDEXES.items():
+            op.create_index(
+                name, 'document_payloads', [column], unique=False,
+                postgresql_using='gin', postgresql_ops={column: 'jsonb_path_ops'},
+                postgresql_concurrently=True, if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE documents RESET (fillfactor)")
+    op.add_column('documents', sa.Column('extracted_data', postgresql.JSONB(), nullable=True))
+    op.add_column('documents', sa.Column('gpt_insights', postgresql.JSONB(), nullable=True))
+    op.add_column('documents', sa.Column('gpt_summary', sa.String(), nullable=True))
+    op.execute(f"""
+        UPDATE documents SET {', '.join(f'{column} = p.{column}' for column in PAYLOAD_COLUMNS)}
+        FROM document_payloads p WHERE p.document_id = documents.id
+    """)
+    op.drop_table('document_payloads')
+    op.create_index(
+        'ix_documents_extracted_data_gin', 'documents', ['extracted_data'], unique=False,
+        postgresql_using='gin', postgresql_ops={'extracted_data': 'jsonb_path_ops'}
+    )
+    op.create_index(
+        'ix_documents_gpt_insights_gin', 'documents', ['gpt_insights'], unique=False,
+        postgresql_using='gin', postgresql_ops={'gpt_insights': 'jsonb_path_ops'}
+    )
@@ -0,0 +1,47 @@
+"""create_insights_batches_table
+
+Revision ID: 5c26a1d1ea41
+Revises: b18d19d2f105
+Create Date: 2026-10-18 16:08:33.590417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c26a1d1ea41'
+down_revision: Union[str, None] = 'b18d19d2f105'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('insights_batches',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('completed', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_insights_batches_id'), 'insights_batches', ['id'], unique=False)
+    op.create_index(op.f('ix_insights_batches_user_id'), 'insights_batches', ['user_id'], unique=False)
+    op.add_column('processing_jobs', sa.Column('user_id', sa.Integer(), nullable=True))
+    op.add_column('processing_jobs', sa.Column('batch_id', sa.String(), nullable=True))
+    op.create_index(op.f('ix_processing_jobs_batch_id'), 'processing_jobs', ['batch_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_processing_jobs_batch_id'), table_name='processing_jobs')
+    op.drop_column('processing_jobs', 'batch_id')
+    op.drop_column('processing_jobs', 'user_id')
+    op.drop_index(op.f('ix_insights_batches_user_id'), table_name='insights_batches')
+    op.drop_index(op.f('ix_insights_batches_id'), table_name='insights_batches')
+    op.drop_table('insights_batches')
@@ -0,0 +1,232 @@
+"""partition_documents_by_month
+
+Revision ID: 5fbc24a5771c
+Revises: 5299bda33014
+Create Date: 2026-10-19 03:05:41.662190
+
+"""
+import os
+import time
+import logging
+from datetime import date, datetime, timezone
+from typing import List, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5fbc24a5771c'
+down_revision: Union[str, None] = '5299bda33014'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# Cópia em lotes pequenos, cada um na sua transação
+BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+BATCH_SLEEP_SECONDS = float(os.getenv("MIGRATION_BATCH_SLEEP_SECONDS", "0.05"))
+
+# Partições criadas além do mês atual (depois a aplicação mantém a janela: document_partitions)
+MONTHS_AHEAD = int(os.getenv("DOCUMENT_PARTITIONS_MONTHS_AHEAD", "3"))
+DOCUMENTS_FILLFACTOR = 80
+
+NEW_TABLE = 'documents_partitioned'
+OLD_TABLE = 'documents_unpartitioned'
+
+DOCUMENTS_NEEDING_INSIGHTS = "status = 'complete' AND (insights_status IS NULL OR insights_status IN ('pending', 'error'))"
+
+# Índices de documents: nome -> (colunas, predicado parcial)
+INDEXES = {
+    'ix_documents_id': (['id'], None),
+    'ix_documents_user_id_created_at_id': (['user_id', 'created_at', 'id'], None),
+    'ix_documents_user_id_status': (['user_id', 'status'], None),
+    'ix_documents_user_id_document_type': (['user_id', 'document_type'], None),
+    'ix_documents_user_id_needing_insights': (['user_id', 'created_at'], DOCUMENTS_NEEDING_INSIGHTS),
+    'ix_documents_content_hash_document_type': (['content_hash', 'document_type'], None),
+    'ix_documents_pending_wu3_poll': (['wu3_next_poll_at'], "status = 'processing' AND webhook_received = false"),
+}
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_sql(parent: str, month: date) -> str:
+    end = _add_months(month, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS documents_p{month:%Y_%m} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00') "
+        f"WITH (fillfactor = {DOCUMENTS_FILLFACTOR})"
+    )
+
+
+def _create_indexes(table: str, suffix: str = '') -> None:
+    for name, (columns, where) in INDEXES.items():
+        op.create_index(
+            name + suffix, table, columns, unique=False, if_not_exists=True,
+            postgresql_where=sa.text(where) if where is not None else None
+        )
+
+
+def _columns() -> List[str]:
+    return op.get_bind().execute(sa.text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = 'documents' AND table_schema = current_schema()
+        ORDER BY ordinal_position
+    """)).scalars().all()
+
+
+def _already_partitioned() -> bool:
+    """Execução anterior já trocou as tabelas"""
+    return bool(op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('documents')"
+    )).scalar())
+
+
+def _prepare(columns: List[str]) -> None:
+    """
+    Tabela particionada vazia (com partições e índices) e trigger que replica nela
+    as escritas feitas em documents durante a cópia
+    """
+    # created_at entra na chave primária: linhas antigas sem data recebem a atual
+    op.execute("UPDATE documents SET created_at = now() WHERE created_at IS NULL")
+
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS {NEW_TABLE} (
+            LIKE documents INCLUDING DEFAULTS,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+
+    # Do mês do documento mais antigo até MONTHS_AHEAD meses à frente (min() lê a tabela uma vez)
+    oldest = op.get_bind().execute(sa.text("SELECT min(created_at) FROM documents")).scalar()
+    current = datetime.now(timezone.utc).date().replace(day=1)
+    month = oldest.astimezone(timezone.utc).date().replace(day=1) if oldest else current
+    while month <= _add_months(current, MONTHS_AHEAD):
+        op.execute(_partition_sql(NEW_TABLE, month))
+        month = _add_months(month, 1)
+
+    # Índices antes da cópia: com a tabela vazia não bloqueiam as escritas replicadas pelo trigger
+    _create_indexes(NEW_TABLE, suffix='_partitioned')
+
+    values = ", ".join(f"NEW.{column}" for column in columns)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column not in ('id', 'created_at'))
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION orbit_documents_sync_partitioned() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM {NEW_TABLE} WHERE id = OLD.id;
+            ELSE
+                INSERT INTO {NEW_TABLE} ({', '.join(columns)}) VALUES ({values})
+                ON CONFLICT (id, created_at) DO UPDATE SET {updates};
+            END IF;
+            RETURN NULL;
+        END $$
+    """)
+    op.execute("DROP TRIGGER IF EXISTS documents_sync_partitioned ON documents")
+    op.execute("""
+        CREATE TRIGGER documents_sync_partitioned
+        AFTER INSERT OR UPDATE OR DELETE ON documents
+        FOR EACH ROW EXECUTE FUNCTION orbit_documents_sync_partitioned()
+    """)
+
+
+def _backfill(columns: List[str]) -> None:
+    """
+    Copia os documentos existentes em lotes por id
+
+    Retomável: linhas já presentes na tabela nova (cópia anterior ou trigger) são
+    mantidas, e a versão do trigger é sempre a mais recente.
+    """
+    bind = op.get_bind()
+    next_batch = sa.text("""
+        SELECT max(id) FROM (
+            SELECT id FROM documents WHERE id > :last_id ORDER BY id LIMIT :batch_size
+        ) batch
+    """)
+    copy = sa.text(f"""
+        INSERT INTO {NEW_TABLE} ({', '.join(columns)})
+        SELECT {', '.join(columns)} FROM documents
+        WHERE id > :last_id AND id <= :batch_end
+        ON CONFLICT (id, created_at) DO NOTHING
+    """)
+
+    last_id, copied = '', 0
+    while True:
+        batch_end = bind.execute(next_batch, {"last_id": last_id, "batch_size": BATCH_SIZE}).scalar()
+        if batch_end is None:
+            break
+        copied += bind.execute(copy, {"last_id": last_id, "batch_end": batch_end}).rowcount
+        last_id = batch_end
+        logger.info(f"{NEW_TABLE}: {copied} documentos copiados")
+        time.sleep(BATCH_SLEEP_SECONDS)
+
+
+def upgrade() -> None:
+    if _already_partitioned():
+        return
+
+    columns = _columns()
+    with op.get_context().autocommit_block():
+        _prepare(columns)
+        _backfill(columns)
+
+    # Troca das tabelas numa transação curta (a tabela nova já está em dia pelo trigger).
+    # A tabela antiga fica como documents_unpartitioned para conferência; remover com DROP TABLE depois.
+    op.execute("SET LOCAL lock_timeout = '10s'")
+    op.execute("LOCK TABLE documents IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER IF EXISTS documents_sync_partitioned ON documents")
+    op.execute("DROP FUNCTION IF EXISTS orbit_documents_sync_partitioned()")
+
+    # O id deixa de ser único sozinho (chave primária inclui created_at): sem FK de document_payloads
+    op.execute("ALTER TABLE document_payloads DROP CONSTRAINT IF EXISTS document_payloads_document_id_fkey")
+
+    op.rename_table('documents', OLD_TABLE)
+    op.execute(f"ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT documents_pkey TO {OLD_TABLE}_pkey")
+    for name in INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_unpartitioned")
+
+    op.rename_table(NEW_TABLE, 'documents')
+    op.execute(f"ALTER TABLE documents RENAME CONSTRAINT {NEW_TABLE}_pkey TO documents_pkey")
+    for name in INDEXES:
+        op.execute(f"ALTER INDEX {name}_partitioned RENAME TO {name}")
+
+    # Remoção do documento leva o payload junto (papel do ON DELETE CASCADE da FK)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION orbit_documents_delete_payload() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            DELETE FROM document_payloads WHERE document_id = OLD.id;
+            RETURN NULL;
+        END $$
+    """)
+    op.execute("""
+        CREATE TRIGGER documents_delete_payload
+        AFTER DELETE ON documents
+        FOR EACH ROW EXECUTE FUNCTION orbit_documents_delete_payload()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS documents_delete_payload ON documents")
+    op.execute("DROP FUNCTION IF EXISTS orbit_documents_delete_payload()")
+    op.execute(f"DROP TABLE IF EXISTS {OLD_TABLE}")
+
+    op.rename_table('documents', NEW_TABLE)
+    op.execute(f"""
+        CREATE TABLE documents (LIKE {NEW_TABLE} INCLUDING DEFAULTS)
+        WITH (fillfactor = {DOCUMENTS_FILLFACTOR})
+    """)
+    op.execute(f"INSERT INTO documents SELECT * FROM {NEW_TABLE}")
+    op.drop_table(NEW_TABLE)  # partições junto
+
+    op.alter_column('documents', 'created_at', nullable=True)
+    op.create_primary_key('documents_pkey', 'documents', ['id'])
+    _create_indexes('documents')
+    op.create_foreign_key(
+        'document_payloads_document_id_fkey', 'document_payloads', 'documents',
+        ['document_id'], ['id'], ondelete='CASCADE'
+    )
@@ -0,0 +1,51 @@
+"""add_document_access_pattern_indexes
+
+Revision ID: 6786277e17dc
+Revises: 5c26a1d1ea41
+Create Date: 2026-10-18 19:12:40.205731
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6786277e17dc'
+down_revision: Union[str, None] = '5c26a1d1ea41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Mesmo texto de models.DOCUMENTS_NEEDING_INSIGHTS
+DOCUMENTS_NEEDING_INSIGHTS = "status = 'complete' AND (insights_status IS NULL OR insights_status IN ('pending', 'error'))"
+
+
+def upgrade() -> None:
+    # CONCURRENTLY não bloqueia escritas na tabela, mas não roda dentro de transação
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_documents_user_id_created_at', 'documents', ['user_id', 'created_at'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_documents_user_id_status', 'documents', ['user_id', 'status'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_documents_user_id_document_type', 'documents', ['user_id', 'document_type'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_documents_user_id_needing_insights', 'documents', ['user_id', 'created_at'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True,
+            postgresql_where=sa.text(DOCUMENTS_NEEDING_INSIGHTS)
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_documents_user_id_needing_insights', table_name='documents', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_documents_user_id_document_type', table_name='documents', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_documents_user_id_status', table_name='documents', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_documents_user_id_created_at', table_name='documents', postgresql_concurrently=True, if_exists=True)
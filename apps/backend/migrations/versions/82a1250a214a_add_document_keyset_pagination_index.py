@@ -0,0 +1,37 @@
+"""add_document_keyset_pagination_index
+
+Revision ID: 82a1250a214a
+Revises: c43d68678897
+Create Date: 2026-10-18 22:41:05.316274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '82a1250a214a'
+down_revision: Union[str, None] = 'c43d68678897'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # (user_id, created_at, id) atende a paginação por keyset e substitui (user_id, created_at)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_documents_user_id_created_at_id', 'documents', ['user_id', 'created_at', 'id'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_documents_user_id_created_at', table_name='documents', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_documents_user_id_created_at', 'documents', ['user_id', 'created_at'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_documents_user_id_created_at_id', table_name='documents', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,40 @@
+"""create_insights_cache_table
+
+Revision ID: b18d19d2f105
+Revises: bd9545338699
+Create Date: 2026-10-18 14:52:19.803114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b18d19d2f105'
+down_revision: Union[str, None] = 'bd9545338699'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('insights_cache',
+    sa.Column('cache_key', sa.String(length=64), nullable=False),
+    sa.Column('model', sa.String(), nullable=False),
+    sa.Column('document_type', sa.String(), nullable=False),
+    sa.Column('insights', sa.String(), nullable=False),
+    sa.Column('hit_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('last_accessed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('cache_key')
+    )
+    op.create_index(op.f('ix_insights_cache_last_accessed_at'), 'insights_cache', ['last_accessed_at'], unique=False)
+    op.create_index(op.f('ix_insights_cache_expires_at'), 'insights_cache', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_insights_cache_expires_at'), table_name='insights_cache')
+    op.drop_index(op.f('ix_insights_cache_last_accessed_at'), table_name='insights_cache')
+    op.drop_table('insights_cache')
@@ -0,0 +1,38 @@
+"""add_wu3_status_polling_fields
+
+Revision ID: bd9545338699
+Revises: d95a3d70a6a9
+Create Date: 2026-10-18 13:27:06.418552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bd9545338699'
+down_revision: Union[str, None] = 'd95a3d70a6a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('wu3_poll_attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('documents', sa.Column('wu3_next_poll_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(
+        'ix_documents_pending_wu3_poll', 'documents', ['wu3_next_poll_at'], unique=False,
+        postgresql_where=sa.text("status = 'processing' AND webhook_received = false")
+    )
+    # Documentos já parados aguardando webhook entram na próxima rodada do reconciliador
+    op.execute(
+        "UPDATE documents SET wu3_next_poll_at = now(), webhook_received = false "
+        "WHERE status = 'processing' AND wu3_document_id IS NOT NULL AND webhook_received IS NOT TRUE"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_pending_wu3_poll', table_name='documents')
+    op.drop_column('documents', 'wu3_next_poll_at')
+    op.drop_column('documents', 'wu3_poll_attempts')
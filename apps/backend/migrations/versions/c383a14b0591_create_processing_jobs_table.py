@@ -0,0 +1,46 @@
+"""create_processing_jobs_table
+
+Revision ID: c383a14b0591
+Revises: f6a8aa2b3cc6
+Create Date: 2026-10-18 09:12:41.208317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c383a14b0591'
+down_revision: Union[str, None] = 'f6a8aa2b3cc6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('processing_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('document_id', sa.String(), nullable=False),
+    sa.Column('job_type', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('locked_by', sa.String(), nullable=True),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_processing_jobs_id'), 'processing_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_processing_jobs_document_id'), 'processing_jobs', ['document_id'], unique=False)
+    op.create_index('ix_processing_jobs_status_run_after', 'processing_jobs', ['status', 'run_after'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_processing_jobs_status_run_after', table_name='processing_jobs')
+    op.drop_index(op.f('ix_processing_jobs_document_id'), table_name='processing_jobs')
+    op.drop_index(op.f('ix_processing_jobs_id'), table_name='processing_jobs')
+    op.drop_table('processing_jobs')
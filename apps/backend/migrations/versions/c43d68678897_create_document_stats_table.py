@@ -0,0 +1,50 @@
+"""create_document_stats_table
+
+Revision ID: c43d68678897
+Revises: 6786277e17dc
+Create Date: 2026-10-18 21:03:11.482910
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c43d68678897'
+down_revision: Union[str, None] = '6786277e17dc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('document_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('dimension', sa.String(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('user_id', 'dimension', 'key')
+    )
+
+    # Carga inicial a partir de documents (document_stats.repair_document_stats corrige
+    # transições feitas entre esta carga e a subida da nova versão da API)
+    for dimension, column in (('status', 'status'), ('type', 'document_type'), ('insights', 'insights_status')):
+        op.execute(f"""
+            INSERT INTO document_stats (user_id, dimension, key, count)
+            SELECT user_id, '{dimension}', COALESCE({column}, 'none'), count(*)
+            FROM documents
+            GROUP BY user_id, COALESCE({column}, 'none')
+        """)
+    op.execute("""
+        INSERT INTO document_stats (user_id, dimension, key, count)
+        SELECT user_id, 'day', to_char(CURRENT_DATE, 'YYYY-MM-DD'), count(*)
+        FROM documents
+        WHERE created_at >= CURRENT_DATE
+        GROUP BY user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('document_stats')
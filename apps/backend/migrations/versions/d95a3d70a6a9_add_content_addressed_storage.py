@@ -0,0 +1,40 @@
+"""add_content_addressed_storage
+
+Revision ID: d95a3d70a6a9
+Revises: c383a14b0591
+Create Date: 2026-10-18 11:04:52.671930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd95a3d70a6a9'
+down_revision: Union[str, None] = 'c383a14b0591'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('stored_files',
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('file_path', sa.String(), nullable=False),
+    sa.Column('size_bytes', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('content_hash')
+    )
+    op.add_column('documents', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('documents', sa.Column('file_size', sa.Integer(), nullable=True))
+    op.create_index('ix_documents_content_hash_document_type', 'documents', ['content_hash', 'document_type'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_content_hash_document_type', table_name='documents')
+    op.drop_column('documents', 'file_size')
+    op.drop_column('documents', 'content_hash')
+    op.drop_table('stored_files')
@@ -1,13 +1,23 @@
 """
 Modelos do banco de dados para ORBIT IA
 """
-from sqlalchemy import Column, String, Integer, DateTime, Boolean
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, Index, Numeric, REAL, JSON, DDL, event, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from datetime import datetime
+from datetime import datetime, timezone
 
 Base = declarative_base()
 
+# JSONB no PostgreSQL (JSON genérico nos demais bancos); None grava NULL, não o JSON null
+JSONType = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql")
+
+# Documentos aptos a gerar insights em lote: predicado do índice parcial e da consulta
+# (texto idêntico com literais, para o planner reconhecer o índice também em planos genéricos)
+DOCUMENTS_NEEDING_INSIGHTS = "status = 'complete' AND (insights_status IS NULL OR insights_status IN ('pending', 'error'))"
+
 class User(Base):
     """Modelo de usuário do sistema"""
     __tablename__ = "users"
@@ -26,7 +36,16 @@ class User(Base):
 
 
 class Document(Base):
-    """Modelo de documento processado pela IA Wu3"""
+    """
+    Modelo de documento processado pela IA Wu3
+
+    Linha estreita (campos de status atualizados com frequência, fillfactor reduzido
+    para updates HOT); dados extraídos e insights ficam em document_payloads.
+
+    No PostgreSQL a tabela é particionada por mês em created_at (document_partitions
+    cria as partições com antecedência); a chave primária da tabela inclui created_at,
+    a identidade no ORM continua sendo o id.
+    """
     __tablename__ = "documents"
     
     id = Column(String, primary_key=True, index=True)  # UUID
@@ -34,33 +53,221 @@ class Document(Base):
     document_type = Column(String, nullable=False)  # contract, invoice, etc.
     original_filename = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
-    extracted_data = Column(String, nullable=True)  # JSON como string
-    confidence_score = Column(String, nullable=True)  # Float como string
+    confidence_score = Column(REAL, nullable=True)  # 0.0 a 1.0
     status = Column(String, default='processing')  # processing, complete, error, failed
     
     # Campos específicos para integração Wu3
     wu3_document_id = Column(String, nullable=True)  # ID retornado pela Wu3
     wu3_request_id = Column(String, nullable=True)  # ID da requisição Wu3
     error_message = Column(String, nullable=True)  # Mensagem de erro se houver
-    processing_time_seconds = Column(String, nullable=True)  # Tempo de processamento
+    processing_time_seconds = Column(Numeric(10, 3, asdecimal=False), nullable=True)  # Tempo de processamento
     wu3_version = Column(String, nullable=True)  # Versão do modelo Wu3 usado
     
+    # Armazenamento endereçado por conteúdo (uploads duplicados compartilham o arquivo)
+    content_hash = Column(String(64), nullable=True)  # SHA-256 do arquivo
+    file_size = Column(Integer, nullable=True)  # Tamanho em bytes
+    
     # Campos específicos para webhooks
     webhook_received = Column(Boolean, default=False)  # Se webhook foi recebido
     webhook_received_at = Column(DateTime(timezone=True), nullable=True)  # Quando webhook foi recebido
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Consulta ativa de status quando o webhook não chega
+    wu3_poll_attempts = Column(Integer, nullable=False, default=0, server_default='0')
+    wu3_next_poll_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Valor definido na aplicação: faz parte da chave da tabela (UPDATE/DELETE do ORM filtram
+    # por id e created_at, o que também restringe a escrita a uma partição)
+    created_at = Column(
+        DateTime(timezone=True), primary_key=True,
+        default=lambda: datetime.now(timezone.utc), server_default=func.now()
+    )
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    __mapper_args__ = {"primary_key": [id]}
+    
+    __table_args__ = (
+        # Listagem paginada por (created_at, id), totais e "hoje" por usuário
+        Index('ix_documents_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        # Agrupamentos das estatísticas por usuário
+        Index('ix_documents_user_id_status', 'user_id', 'status'),
+        Index('ix_documents_user_id_document_type', 'user_id', 'document_type'),
+        # Parcial: documentos ainda sem insights (batch-generate-insights)
+        Index(
+            'ix_documents_user_id_needing_insights', 'user_id', 'created_at',
+            postgresql_where=text(DOCUMENTS_NEEDING_INSIGHTS)
+        ),
+        Index('ix_documents_content_hash_document_type', 'content_hash', 'document_type'),
+        # Parcial: apenas documentos aguardando resultado assíncrono da Wu3
+        Index(
+            'ix_documents_pending_wu3_poll', 'wu3_next_poll_at',
+            postgresql_where=text("status = 'processing' AND webhook_received = false")
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    
     def __repr__(self):
         return f"<Document(id='{self.id}', filename='{self.original_filename}', status='{self.status}')>"
 
 
     
     # Campos específicos para insights GPT
-    gpt_insights = Column(String, nullable=True)  # JSON string com insights gerados
-    gpt_summary = Column(String, nullable=True)   # Resumo em texto simples
     gpt_generated_at = Column(DateTime(timezone=True), nullable=True)
     gpt_model_used = Column(String, nullable=True)
-    insights_status = Column(String, default='pending')  # pending, generating, complete, error
+    insights_status = Column(String, default='pending')  # pending, queued, generating, complete, error
+    
+    # Conteúdo volumoso (1:1). Nunca carregado implicitamente: consultas que leem estes
+    # campos pedem selectinload/joinedload(Document.payload). Sem FK (a tabela
+    # particionada não tem id único): um trigger remove o payload junto com o documento
+    payload = relationship(
+        "DocumentPayload", uselist=False, lazy="raise",
+        primaryjoin="Document.id == foreign(DocumentPayload.document_id)",
+        cascade="all, delete-orphan", passive_deletes=True
+    )
+    extracted_data = association_proxy("payload", "extracted_data", creator=lambda value: DocumentPayload(extracted_data=value))
+    gpt_insights = association_proxy("payload", "gpt_insights", creator=lambda value: DocumentPayload(gpt_insights=value))
+    gpt_summary = association_proxy("payload", "gpt_summary", creator=lambda value: DocumentPayload(gpt_summary=value))
+
+
+class DocumentPayload(Base):
+    """Dados extraídos e insights GPT de um documento (separados da linha de status)"""
+    __tablename__ = "document_payloads"
+    
+    document_id = Column(String, primary_key=True)  # documents.id
+    extracted_data = Column(JSONType, nullable=True)  # Dados extraídos pela Wu3
+    gpt_insights = Column(JSONType, nullable=True)  # Insights gerados
+    gpt_summary = Column(String, nullable=True)   # Resumo em texto simples
+    
+    __table_args__ = (
+        # Filtros por conteúdo do JSON (@>, ?, jsonpath)
+        Index('ix_document_payloads_extracted_data_gin', 'extracted_data', postgresql_using='gin', postgresql_ops={'extracted_data': 'jsonb_path_ops'}),
+        Index('ix_document_payloads_gpt_insights_gin', 'gpt_insights', postgresql_using='gin', postgresql_ops={'gpt_insights': 'jsonb_path_ops'}),
+    )
+    
+    def __repr__(self):
+        return f"<DocumentPayload(document_id='{self.document_id}')>"
+
+
+# Remoção do documento leva o payload junto (papel do ON DELETE CASCADE da FK). O mesmo
+# trigger da migração de particionamento, para bancos criados por create_all
+event.listen(Document.__table__, "after_create", DDL("""
+    CREATE OR REPLACE FUNCTION orbit_documents_delete_payload() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        DELETE FROM document_payloads WHERE document_id = OLD.id;
+        RETURN NULL;
+    END $$
+""").execute_if(dialect="postgresql"))
+event.listen(Document.__table__, "after_create", DDL("""
+    CREATE TRIGGER documents_delete_payload
+    AFTER DELETE ON documents
+    FOR EACH ROW EXECUTE FUNCTION orbit_documents_delete_payload()
+""").execute_if(dialect="postgresql"))
+event.listen(Document.__table__, "after_create", DDL("""
+    CREATE TRIGGER documents_delete_payload
+    AFTER DELETE ON documents
+    FOR EACH ROW BEGIN
+        DELETE FROM document_payloads WHERE document_id = OLD.id;
+    END
+""").execute_if(dialect="sqlite"))
+
+
+
+class ProcessingJob(Base):
+    """Job da fila de processamento assíncrono de documentos"""
+    __tablename__ = "processing_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(String, nullable=False, index=True)  # FK para documents
+    job_type = Column(String, nullable=False, default='process_document')  # process_document, generate_insights
+    user_id = Column(Integer, nullable=True)  # Dono do documento (divisão justa entre usuários)
+    batch_id = Column(String, nullable=True, index=True)  # FK para insights_batches
+    status = Column(String, nullable=False, default='pending')  # pending, running, done, failed, parked
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    locked_by = Column(String, nullable=True)  # Identificador do worker
+    last_error = Column(String, nullable=True)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        Index('ix_processing_jobs_status_run_after', 'status', 'run_after'),
+    )
+    
+    def __repr__(self):
+        return f"<ProcessingJob(id={self.id}, document_id='{self.document_id}', status='{self.status}')>"
 
+
+class StoredFile(Base):
+    """Arquivo armazenado uma única vez por conteúdo (SHA-256), com contagem de referências"""
+    __tablename__ = "stored_files"
+    
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 do conteúdo
+    file_path = Column(String, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # Documentos que apontam para o arquivo
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<StoredFile(content_hash='{self.content_hash}', ref_count={self.ref_count})>"
+
+
+class InsightsCacheEntry(Base):
+    """Insights GPT em cache (nível persistente), chaveados pelo hash canônico da requisição"""
+    __tablename__ = "insights_cache"
+    
+    cache_key = Column(String(64), primary_key=True)  # SHA-256 de modelo + parâmetros + dados
+    model = Column(String, nullable=False)
+    document_type = Column(String, nullable=False)
+    insights = Column(String, nullable=False)  # JSON como string
+    hit_count = Column(Integer, nullable=False, default=0)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_accessed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<InsightsCacheEntry(cache_key='{self.cache_key}', model='{self.model}')>"
+
+
+class InsightsBatch(Base):
+    """Lote de geração de insights (progresso persistido)"""
+    __tablename__ = "insights_batches"
+    
+    id = Column(String, primary_key=True, index=True)  # UUID
+    user_id = Column(Integer, nullable=False, index=True)  # FK para users
+    status = Column(String, nullable=False, default='running')  # running, complete, failed (falha ao enfileirar)
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    def __repr__(self):
+        return f"<InsightsBatch(id='{self.id}', status='{self.status}', {self.completed + self.failed}/{self.total})>"
+
+
+class DocumentStats(Base):
+    """
+    Contadores de documentos por usuário, mantidos na mesma transação de cada transição
+
+    Uma linha por (usuário, dimensão, chave): dimensões status, type, insights e day
+    (documentos criados no dia, chave AAAA-MM-DD).
+    """
+    __tablename__ = "document_stats"
+    
+    user_id = Column(Integer, primary_key=True)  # FK para users
+    dimension = Column(String, primary_key=True)  # status, type, insights, day
+    key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<DocumentStats(user_id={self.user_id}, {self.dimension}:{self.key}={self.count})>"
@@ -0,0 +1,207 @@
+"""
+Agendador de chamadas à OpenAI com orçamento de requisições e tokens por minuto
+Filas por prioridade (interativo → pós-upload → lote) com envelhecimento contra starvation
+"""
+import os
+import time
+import asyncio
+import logging
+import itertools
+from typing import Dict, Any, Optional, List
+
+from rate_limiter import TokenBucket
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações
+OPENAI_SCHEDULER_ENABLED = os.getenv("OPENAI_SCHEDULER_ENABLED", "true").lower() == "true"
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "30000"))
+OPENAI_SCHEDULER_AGING_SECONDS = float(os.getenv("OPENAI_SCHEDULER_AGING_SECONDS", "30"))
+OPENAI_DEFAULT_RETRY_AFTER_SECONDS = float(os.getenv("OPENAI_DEFAULT_RETRY_AFTER_SECONDS", "5"))
+
+# Filas em ordem de prioridade
+LANE_INTERACTIVE = "interactive"
+LANE_POST_UPLOAD = "post_upload"
+LANE_BATCH = "batch"
+LANES = (LANE_INTERACTIVE, LANE_POST_UPLOAD, LANE_BATCH)
+
+
+class _Waiter:
+    __slots__ = ("lane", "rank", "tokens", "enqueued_at", "seq", "future")
+
+    def __init__(self, lane: str, tokens: int, seq: int):
+        self.lane = lane
+        self.rank = LANES.index(lane)
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class OpenAIScheduler:
+    """
+    Libera chamadas à OpenAI respeitando RPM e TPM
+
+    Cada chamada informa sua fila e uma estimativa de tokens (prompt + max_tokens) e
+    aguarda a liberação. A chamada de maior prioridade é sempre a próxima; a cada
+    aging_seconds de espera ela sobe uma fila, então lotes longos não ficam parados
+    indefinidamente atrás de tráfego interativo. Após a resposta, reconcile() ajusta o
+    orçamento pelo `usage` real; um 429 pausa todas as filas pelo Retry-After.
+    """
+
+    def __init__(
+        self,
+        rpm: int = OPENAI_RPM_LIMIT,
+        tpm: int = OPENAI_TPM_LIMIT,
+        aging_seconds: float = OPENAI_SCHEDULER_AGING_SECONDS,
+        enabled: bool = OPENAI_SCHEDULER_ENABLED
+    ):
+        self.enabled = enabled
+        self.rpm = rpm
+        self.tpm = tpm
+        self.aging_seconds = aging_seconds
+        self.requests = TokenBucket(rpm / 60.0, rpm)
+        self.tokens = TokenBucket(tpm / 60.0, tpm)
+        self.blocked_until = 0.0
+
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        self.stats = {
+            "granted": {lane: 0 for lane in LANES},
+            "promoted": 0,
+            "throttled": 0,
+            "estimated_tokens": 0,
+            "used_tokens": 0,
+            "total_wait_seconds": 0.0
+        }
+
+    async def acquire(self, lane: str, estimated_tokens: int) -> Dict[str, Any]:
+        """
+        Aguarda a vez na fila e o orçamento de RPM/TPM
+
+        Returns:
+            Ticket da chamada (passar para reconcile() com o uso real)
+        """
+        if lane not in LANES:
+            raise ValueError(f"Fila de prioridade inválida: {lane}")
+
+        # Uma chamada maior que o orçamento do minuto nunca seria liberada
+        estimated_tokens = max(1, min(int(estimated_tokens), self.tpm))
+        ticket = {"lane": lane, "estimated_tokens": estimated_tokens}
+
+        if not self.enabled:
+            return ticket
+
+        waiter = _Waiter(lane, estimated_tokens, next(self._seq))
+        self._waiters.append(waiter)
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # Liberada mas não usada: devolver o orçamento
+                self.requests.refund(1)
+                self.tokens.refund(estimated_tokens)
+            raise
+
+        waited = time.monotonic() - waiter.enqueued_at
+        self.stats["granted"][lane] += 1
+        self.stats["estimated_tokens"] += estimated_tokens
+        self.stats["total_wait_seconds"] += waited
+        if waited > self.aging_seconds and lane != LANE_INTERACTIVE:
+            self.stats["promoted"] += 1
+        return ticket
+
+    def reconcile(self, ticket: Dict[str, Any], used_tokens: Optional[int]):
+        """Ajusta o orçamento de TPM pela diferença entre estimativa e uso real (`usage.total_tokens`)"""
+        if used_tokens is None:
+            return
+
+        self.stats["used_tokens"] += used_tokens
+        if not self.enabled:
+            return
+
+        difference = used_tokens - ticket["estimated_tokens"]
+        if difference < 0:
+            self.tokens.refund(-difference)
+        elif difference > 0:
+            self.tokens.charge(difference)
+
+    def record_throttle(self, retry_after: Optional[float]):
+        """429 da OpenAI: pausa todas as filas e zera o orçamento disponível"""
+        retry_after = retry_after or OPENAI_DEFAULT_RETRY_AFTER_SECONDS
+        now = time.monotonic()
+        self.stats["throttled"] += 1
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.requests.drain(now)
+        self.tokens.drain(now)
+        logger.warning(f"OpenAI: 429 recebido, chamadas pausadas por {retry_after:.1f}s")
+
+    def _priority(self, waiter: _Waiter, now: float):
+        aged = (now - waiter.enqueued_at) / self.aging_seconds if self.aging_seconds > 0 else 0.0
+        return (waiter.rank - aged, waiter.seq)
+
+    def _try_grant(self, tokens: int, now: float) -> float:
+        """Consome 1 requisição e os tokens estimados; retorna 0 ou os segundos a aguardar"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        wait = self.requests.try_consume(1, now)
+        if wait > 0:
+            return wait
+
+        wait = self.tokens.try_consume(tokens, now)
+        if wait > 0:
+            self.requests.refund(1)
+        return wait
+
+    async def _dispatch(self):
+        while self._waiters:
+            now = time.monotonic()
+            waiter = min(self._waiters, key=lambda candidate: self._priority(candidate, now))
+
+            wait = self._try_grant(waiter.tokens, now)
+            if wait <= 0:
+                self._waiters.remove(waiter)
+                waiter.future.set_result(True)
+                continue
+
+            # Reavaliar quando houver orçamento ou chegar alguém de maior prioridade
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(wait, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        waiting = {lane: 0 for lane in LANES}
+        for waiter in self._waiters:
+            waiting[waiter.lane] += 1
+
+        return {
+            "enabled": self.enabled,
+            "rpm_limit": self.rpm,
+            "tpm_limit": self.tpm,
+            "aging_seconds": self.aging_seconds,
+            "available_requests": round(self.requests.tokens, 1),
+            "available_tokens": round(self.tokens.tokens),
+            "blocked_for_seconds": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            "waiting": waiting,
+            **self.stats,
+            "total_wait_seconds": round(self.stats["total_wait_seconds"], 2)
+        }
+
+
+# Instância global do agendador
+openai_scheduler = OpenAIScheduler()
@@ -0,0 +1,200 @@
+"""
+Compactação dos dados extraídos antes de enviá-los ao GPT
+Remove campos irrelevantes por tipo de documento, resume listas longas (mantendo
+totais e extremos) e serializa sem espaços até caber no orçamento de tokens
+"""
+import os
+import re
+import json
+import math
+import logging
+from typing import Dict, Any, List, Optional
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações
+GPT_PROMPT_TOKEN_BUDGET = int(os.getenv("GPT_PROMPT_TOKEN_BUDGET", "1500"))
+GPT_PROMPT_LIST_MAX_ITEMS = int(os.getenv("GPT_PROMPT_LIST_MAX_ITEMS", "20"))
+GPT_PROMPT_MAX_STRING_CHARS = int(os.getenv("GPT_PROMPT_MAX_STRING_CHARS", "500"))
+
+# Campos que não ajudam na análise (metadados de processamento, dados de contato e pessoais)
+IRRELEVANT_FIELDS = {
+    "*": {"metadata", "document_id", "processed_at", "processing_time_seconds", "model_used", "wu3_version"},
+    "contract": {"email", "telefone"},
+    "financial": {"agencia", "conta"},
+    "identity": {"filiacao_mae", "filiacao_pai", "cep"},
+    "generic": {"qualidade_imagem", "idioma_detectado"}
+}
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_MONEY_PATTERN = re.compile(r"^\s*(-)?\s*(?:R\$)?\s*(-)?\s*([\d.]+(?:,\d+)?|\d+(?:\.\d+)?)\s*$")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimativa local de tokens (sem tokenizer externo)
+
+    Aproxima o BPE dos modelos GPT: cada palavra conta um token a cada ~4 caracteres
+    e cada sinal de pontuação conta um token.
+    """
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        tokens += math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+    return tokens
+
+
+def parse_money(value: Any) -> Optional[float]:
+    """Converte valores como 'R$ 1.234,56', '-R$ 10,00' ou 12.5 em float"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+
+    match = _MONEY_PATTERN.match(value)
+    if not match:
+        return None
+
+    negative = bool(match.group(1) or match.group(2))
+    number = match.group(3)
+    if "," in number:
+        number = number.replace(".", "").replace(",", ".")
+    elif number.count(".") > 1:
+        number = number.replace(".", "")
+
+    try:
+        amount = float(number)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+def format_money(amount: float) -> str:
+    """Formata no padrão brasileiro (R$ 1.234,56)"""
+    formatted = f"{abs(amount):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    return f"-R$ {formatted}" if amount < 0 else f"R$ {formatted}"
+
+
+def _amount_field(items: List[Any]) -> Optional[str]:
+    """Campo monetário comum aos itens da lista (ex.: 'valor'), se houver"""
+    if not items or not all(isinstance(item, dict) for item in items):
+        return None
+
+    for field in ("valor", "valor_total", "amount", "value"):
+        if all(parse_money(item.get(field)) is not None for item in items):
+            return field
+    return None
+
+
+def _sample(items: List[Any], max_items: int) -> List[Any]:
+    """Amostra determinística: primeiros, últimos e itens igualmente espaçados no meio"""
+    if len(items) <= max_items:
+        return list(items)
+    if max_items <= 2:
+        return [items[0], items[-1]][:max_items]
+
+    step = (len(items) - 1) / (max_items - 1)
+    return [items[round(index * step)] for index in range(max_items)]
+
+
+def summarize_list(items: List[Any], max_items: int) -> Any:
+    """
+    Resume uma lista longa mantendo informação agregada
+
+    Listas de lançamentos com valor monetário viram totais, entradas/saídas, extremos
+    e uma amostra; as demais listas viram uma amostra com a contagem total.
+    """
+    if len(items) <= max_items:
+        return items
+
+    amount_field = _amount_field(items)
+    if amount_field is None:
+        return {"total_itens": len(items), "amostra": _sample(items, max_items)}
+
+    amounts = [parse_money(item[amount_field]) for item in items]
+    credits = [amount for amount in amounts if amount >= 0]
+    debits = [amount for amount in amounts if amount < 0]
+
+    largest_credit = max(range(len(items)), key=lambda index: amounts[index])
+    largest_debit = min(range(len(items)), key=lambda index: amounts[index])
+
+    return {
+        "total_itens": len(items),
+        "soma": format_money(sum(amounts)),
+        "entradas": {"quantidade": len(credits), "total": format_money(sum(credits))},
+        "saidas": {"quantidade": len(debits), "total": format_money(sum(debits))},
+        "maior_entrada": items[largest_credit] if credits else None,
+        "maior_saida": items[largest_debit] if debits else None,
+        "amostra": _sample(items, max(2, max_items - 2))
+    }
+
+
+def _compact_value(value: Any, max_items: int, max_string_chars: int) -> Any:
+    if isinstance(value, dict):
+        return {
+            key: _compact_value(item, max_items, max_string_chars)
+            for key, item in value.items()
+            if item not in (None, "", [], {})
+        }
+
+    if isinstance(value, list):
+        summarized = summarize_list(value, max_items)
+        if isinstance(summarized, list):
+            return [_compact_value(item, max_items, max_string_chars) for item in summarized]
+        return _compact_value(summarized, max_items, max_string_chars)
+
+    if isinstance(value, str) and len(value) > max_string_chars:
+        return value[:max_string_chars] + "…"
+
+    return value
+
+
+def _serialize(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def compact_extracted_data(
+    extracted_data: Dict[str, Any],
+    document_type: str,
+    token_budget: int = GPT_PROMPT_TOKEN_BUDGET,
+    max_items: int = GPT_PROMPT_LIST_MAX_ITEMS,
+    max_string_chars: int = GPT_PROMPT_MAX_STRING_CHARS
+) -> Dict[str, Any]:
+    """
+    Compacta os dados extraídos para o prompt
+
+    Remove campos irrelevantes e serializa sem espaços; enquanto o resultado passar
+    do orçamento, reduz pela metade o tamanho das listas e das strings longas.
+
+    Returns:
+        Dict com data (dados compactados), text (JSON compacto), original_tokens e tokens
+    """
+    original_text = json.dumps(extracted_data, indent=2, ensure_ascii=False, default=str)
+    original_tokens = estimate_tokens(original_text)
+
+    irrelevant = IRRELEVANT_FIELDS["*"] | IRRELEVANT_FIELDS.get(document_type, IRRELEVANT_FIELDS["generic"])
+    relevant = {key: value for key, value in extracted_data.items() if key not in irrelevant}
+
+    while True:
+        data = _compact_value(relevant, max_items, max_string_chars)
+        text = _serialize(data)
+        tokens = estimate_tokens(text)
+
+        if tokens <= token_budget or (max_items <= 2 and max_string_chars <= 100):
+            break
+
+        max_items = max(2, max_items // 2)
+        max_string_chars = max(100, max_string_chars // 2)
+
+    if tokens > token_budget:
+        logger.warning(f"Dados extraídos acima do orçamento mesmo após compactação ({tokens}/{token_budget} tokens)")
+
+    return {
+        "data": data,
+        "text": text,
+        "original_tokens": original_tokens,
+        "tokens": tokens
+    }
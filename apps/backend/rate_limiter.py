@@ -0,0 +1,344 @@
+"""
+Limitador de taxa adaptativo para chamadas a APIs externas
+Token bucket com ajuste AIMD, respeito a Retry-After e fila justa (FIFO) de chamadores
+"""
+import os
+import time
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Mapping
+
+# Redis é opcional: sem o pacote, o estado do limitador fica local ao processo
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - depende do ambiente
+    aioredis = None
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+
+class TokenBucket:
+    """Token bucket simples (reabastecimento contínuo)"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def try_consume(self, amount: float = 1.0, now: Optional[float] = None) -> float:
+        """
+        Tenta consumir tokens
+
+        Returns:
+            0 se os tokens foram consumidos, ou segundos a aguardar antes de tentar de novo
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+
+        if self.rate <= 0:
+            return float("inf")
+        return (amount - self.tokens) / self.rate
+
+    def refund(self, amount: float):
+        """Devolve tokens consumidos a mais (estimativa maior que o uso real)"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def charge(self, amount: float):
+        """Consome tokens sem esperar (uso real maior que a estimativa; o saldo pode ficar negativo)"""
+        self.tokens -= amount
+
+    def drain(self, now: Optional[float] = None):
+        """Zera os tokens disponíveis"""
+        self.updated_at = time.monotonic() if now is None else now
+        self.tokens = 0.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Converte o header Retry-After (segundos ou data HTTP) em segundos"""
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_rate_limit_headers(headers: Mapping[str, str]) -> Dict[str, Optional[float]]:
+    """
+    Extrai Retry-After e os headers de cota restante
+
+    Suporta X-RateLimit-Remaining/X-RateLimit-Reset (reset em epoch ou em segundos)
+    e RateLimit-Remaining/RateLimit-Reset (segundos).
+    """
+    def _number(*names: str) -> Optional[float]:
+        for name in names:
+            value = headers.get(name)
+            if value is not None:
+                try:
+                    return float(value)
+                except ValueError:
+                    continue
+        return None
+
+    reset = _number("X-RateLimit-Reset", "RateLimit-Reset")
+    # Valores grandes são timestamps absolutos
+    if reset is not None and reset > 10 ** 9:
+        reset = max(0.0, reset - time.time())
+
+    return {
+        "retry_after": parse_retry_after(headers.get("Retry-After")),
+        "remaining": _number("X-RateLimit-Remaining", "RateLimit-Remaining"),
+        "reset_after": reset
+    }
+
+
+class LocalLimiterState:
+    """Estado do limitador no próprio processo"""
+
+    def __init__(self, initial_rate: float, burst: float):
+        self.bucket = TokenBucket(initial_rate, burst)
+        self.blocked_until = 0.0
+        self.last_decrease_at = 0.0
+
+    async def try_acquire(self) -> float:
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return self.bucket.try_consume(1.0, now)
+
+    async def get_rate(self) -> float:
+        return self.bucket.rate
+
+    async def set_rate(self, rate: float):
+        self.bucket.rate = rate
+
+    async def block_for(self, seconds: float):
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.bucket.drain(now)
+
+    async def mark_decrease(self, cooldown: float) -> bool:
+        """Retorna True se uma nova redução multiplicativa é permitida"""
+        now = time.monotonic()
+        if now - self.last_decrease_at < cooldown:
+            return False
+        self.last_decrease_at = now
+        return True
+
+    async def blocked_for(self) -> float:
+        return max(0.0, self.blocked_until - time.monotonic())
+
+
+class RedisLimiterState:
+    """
+    Estado do limitador compartilhado entre processos via Redis
+
+    Tokens, taxa atual e pausa (Retry-After) ficam num hash; o consumo é atômico (script Lua).
+    """
+
+    ACQUIRE_SCRIPT = """
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate', 'blocked_until')
+    local now = tonumber(ARGV[1])
+    local rate = tonumber(state[3]) or tonumber(ARGV[2])
+    local capacity = tonumber(ARGV[3])
+    local blocked = tonumber(state[4]) or 0
+    if blocked > now then
+        return tostring(blocked - now)
+    end
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now), 'rate', tostring(rate))
+    redis.call('EXPIRE', KEYS[1], 3600)
+    return tostring(wait)
+    """
+
+    DECREASE_SCRIPT = """
+    local last = tonumber(redis.call('HGET', KEYS[1], 'last_decrease_at')) or 0
+    local now = tonumber(ARGV[1])
+    if now - last < tonumber(ARGV[2]) then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'last_decrease_at', tostring(now))
+    return 1
+    """
+
+    def __init__(self, name: str, initial_rate: float, burst: float, redis_url: str = REDIS_URL):
+        self.key = f"orbit:rate_limiter:{name}"
+        self.initial_rate = initial_rate
+        self.burst = burst
+        self.client = aioredis.from_url(redis_url)
+        self._acquire = self.client.register_script(self.ACQUIRE_SCRIPT)
+        self._decrease = self.client.register_script(self.DECREASE_SCRIPT)
+
+    async def try_acquire(self) -> float:
+        wait = await self._acquire(keys=[self.key], args=[time.time(), self.initial_rate, self.burst])
+        return float(wait)
+
+    async def get_rate(self) -> float:
+        rate = await self.client.hget(self.key, "rate")
+        return float(rate) if rate is not None else self.initial_rate
+
+    async def set_rate(self, rate: float):
+        await self.client.hset(self.key, "rate", str(rate))
+
+    async def block_for(self, seconds: float):
+        blocked_until = time.time() + seconds
+        current = await self.client.hget(self.key, "blocked_until")
+        if current is None or float(current) < blocked_until:
+            await self.client.hset(self.key, mapping={"blocked_until": str(blocked_until), "tokens": "0", "ts": str(time.time())})
+
+    async def mark_decrease(self, cooldown: float) -> bool:
+        return bool(await self._decrease(keys=[self.key], args=[time.time(), cooldown]))
+
+    async def blocked_for(self) -> float:
+        blocked_until = await self.client.hget(self.key, "blocked_until")
+        return max(0.0, float(blocked_until) - time.time()) if blocked_until is not None else 0.0
+
+
+class AdaptiveRateLimiter:
+    """
+    Limitador de taxa global com AIMD
+
+    - Chamadores aguardam em fila FIFO (asyncio.Lock é justo) em vez de tentar às cegas.
+    - Sucesso: aumento aditivo da taxa até max_rate.
+    - 429: redução multiplicativa (no máximo uma por janela de cooldown) e pausa
+      global pelo Retry-After (ou pelo reset informado nos headers de cota).
+    - Cota zerada (X-RateLimit-Remaining: 0): pausa até o reset, sem esperar o 429.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_rate: float,
+        min_rate: float,
+        max_rate: float,
+        burst: float = 1.0,
+        increase_step: float = 0.05,
+        decrease_factor: float = 0.5,
+        default_retry_after: float = 2.0,
+        decrease_cooldown: float = 1.0,
+        backend: str = "local"
+    ):
+        self.name = name
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.default_retry_after = default_retry_after
+        self.decrease_cooldown = decrease_cooldown
+        self.backend = "local"
+        self._lock = asyncio.Lock()
+        self._local_state = LocalLimiterState(initial_rate, burst)
+        self.state = self._local_state
+
+        self.stats = {
+            "acquired": 0,
+            "waiting": 0,
+            "throttled": 0,
+            "successes": 0,
+            "total_wait_seconds": 0.0
+        }
+
+        if backend == "redis":
+            if aioredis is None:
+                logger.warning(f"Rate limiter '{name}': pacote redis não instalado, usando estado local")
+            else:
+                self.state = RedisLimiterState(name, initial_rate, burst)
+                self.backend = "redis"
+
+    async def _call_state(self, method: str, *args):
+        """Executa operação no estado; se o Redis falhar, degrada para o estado local"""
+        try:
+            return await getattr(self.state, method)(*args)
+        except Exception as e:
+            if self.state is self._local_state:
+                raise
+            logger.error(f"Rate limiter '{self.name}': erro no Redis ({str(e)}), usando estado local")
+            self.state = self._local_state
+            self.backend = "local"
+            return await getattr(self.state, method)(*args)
+
+    async def acquire(self):
+        """Aguarda a vez (FIFO) e um token disponível"""
+        started_at = time.monotonic()
+        self.stats["waiting"] += 1
+        try:
+            async with self._lock:
+                while True:
+                    wait = await self._call_state("try_acquire")
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+        finally:
+            self.stats["waiting"] -= 1
+
+        self.stats["acquired"] += 1
+        self.stats["total_wait_seconds"] += time.monotonic() - started_at
+
+    async def record_response(self, status_code: int, headers: Mapping[str, str]):
+        """Ajusta a taxa a partir do status e dos headers de rate limit da resposta"""
+        limits = parse_rate_limit_headers(headers)
+
+        if status_code == 429:
+            self.stats["throttled"] += 1
+            retry_after = limits["retry_after"] or limits["reset_after"] or self.default_retry_after
+            await self._call_state("block_for", retry_after)
+
+            if await self._call_state("mark_decrease", self.decrease_cooldown):
+                rate = await self._call_state("get_rate")
+                new_rate = max(self.min_rate, rate * self.decrease_factor)
+                await self._call_state("set_rate", new_rate)
+                logger.warning(
+                    f"Rate limiter '{self.name}': 429 recebido, taxa {rate:.2f} → {new_rate:.2f} req/s, "
+                    f"pausa de {retry_after:.1f}s"
+                )
+            return
+
+        if limits["remaining"] is not None and limits["remaining"] <= 0 and limits["reset_after"]:
+            await self._call_state("block_for", limits["reset_after"])
+
+        if 200 <= status_code < 300:
+            self.stats["successes"] += 1
+            rate = await self._call_state("get_rate")
+            if rate < self.max_rate:
+                await self._call_state("set_rate", min(self.max_rate, rate + self.increase_step))
+
+    async def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "rate_per_second": round(await self._call_state("get_rate"), 3),
+            "min_rate": self.min_rate,
+            "max_rate": self.max_rate,
+            "blocked_for_seconds": round(await self._call_state("blocked_for"), 2),
+            **self.stats,
+            "total_wait_seconds": round(self.stats["total_wait_seconds"], 2)
+        }
@@ -0,0 +1,95 @@
+"""
+Single-flight: deduplicação de trabalho concorrente por documento e operação
+Chamadas simultâneas com a mesma chave aguardam o mesmo resultado em vez de
+repetir chamadas externas (Wu3, OpenAI)
+"""
+import os
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Any, Awaitable, Callable, TypeVar
+
+from sqlalchemy import text
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações
+SINGLE_FLIGHT_BACKEND = os.getenv("SINGLE_FLIGHT_BACKEND", "local")  # local, postgres
+
+T = TypeVar("T")
+
+
+def flight_key(document_id: str, operation: str) -> str:
+    """Chave de deduplicação (documento + operação)"""
+    return f"{operation}:{document_id}"
+
+
+def advisory_lock_id(key: str) -> int:
+    """Chave do advisory lock do PostgreSQL (bigint com sinal derivado da chave)"""
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+class SingleFlight:
+    """
+    Executa no máximo uma operação por chave ao mesmo tempo
+
+    - local: no próprio processo, a primeira chamada executa e as concorrentes
+      aguardam o mesmo resultado (ou a mesma exceção).
+    - postgres: além disso, lock_claim serializa entre processos/workers a
+      reivindicação da operação (leitura do status + transição, na transação do
+      chamador). O lock é de transação: liberado no commit da reivindicação, nunca
+      mantido durante as chamadas externas; quem chega depois vê o novo status.
+
+    O cancelamento de um chamador não interrompe a execução compartilhada.
+    """
+
+    def __init__(self, backend: str = SINGLE_FLIGHT_BACKEND):
+        self.backend = backend
+        self._flights: Dict[str, asyncio.Task] = {}
+        self.stats = {"executed": 0, "shared": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._flights.get(key)
+
+        if task is None:
+            self.stats["executed"] += 1
+            task = asyncio.create_task(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda _, key=key, task=task: self._forget(key, task))
+        else:
+            self.stats["shared"] += 1
+            logger.info(f"Single-flight: aguardando execução em andamento de '{key}'")
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Evita aviso de exceção não recuperada quando todos os chamadores foram cancelados
+        if not task.cancelled():
+            task.exception()
+
+    async def lock_claim(self, db, key: str):
+        """
+        Advisory lock de transação (backend postgres) na sessão do chamador
+
+        Usado em volta da verificação de status e da transição que reivindica a
+        operação; o chamador faz commit logo em seguida, antes de qualquer chamada externa.
+        """
+        if self.backend != "postgres":
+            return
+
+        await db.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": advisory_lock_id(key)})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "in_flight": len(self._flights),
+            **self.stats
+        }
+
+
+# Instância global
+single_flight = SingleFlight()
@@ -0,0 +1,242 @@
+"""
+Serviço de armazenamento de arquivos enviados
+Copia uploads para o disco em blocos de tamanho fixo, sem carregar o arquivo inteiro em memória
+e armazena cada conteúdo uma única vez (endereçado pelo SHA-256, com contagem de referências)
+"""
+import os
+import hashlib
+import logging
+from typing import Dict, Any, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import select, update, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import StoredFile
+from single_flight import advisory_lock_id
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações
+UPLOAD_DIR = os.getenv("STORAGE_PATH", "/home/ubuntu/orbit/apps/backend/uploads")
+MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
+UPLOAD_CHUNK_SIZE_KB = int(os.getenv("UPLOAD_CHUNK_SIZE_KB", "1024"))
+CONTENT_DIR = os.path.join(UPLOAD_DIR, "objects")
+
+
+def get_max_upload_bytes() -> int:
+    """Tamanho máximo aceito para upload em bytes"""
+    return MAX_FILE_SIZE_MB * 1024 * 1024
+
+
+def _file_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Arquivo excede o tamanho máximo permitido de {MAX_FILE_SIZE_MB} MB"
+    )
+
+
+async def save_upload_stream(
+    upload_file: UploadFile,
+    destination_path: str,
+    max_size_bytes: Optional[int] = None,
+    chunk_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Copia o conteúdo de um UploadFile para o disco em blocos
+
+    O tamanho e o SHA-256 são calculados durante a cópia. A escrita usa aiofiles
+    para não bloquear o event loop, e o uso de memória fica limitado a um bloco.
+
+    Args:
+        upload_file: Arquivo recebido pelo FastAPI
+        destination_path: Caminho final do arquivo
+        max_size_bytes: Tamanho máximo permitido (padrão: MAX_FILE_SIZE_MB)
+        chunk_size: Tamanho de cada bloco lido (padrão: UPLOAD_CHUNK_SIZE_KB)
+
+    Returns:
+        Dict com file_path, size_bytes e sha256
+
+    Raises:
+        HTTPException: 413 se o arquivo ultrapassar o tamanho máximo
+    """
+    if max_size_bytes is None:
+        max_size_bytes = get_max_upload_bytes()
+    if chunk_size is None:
+        chunk_size = UPLOAD_CHUNK_SIZE_KB * 1024
+
+    # Rejeitar cedo quando o tamanho já é conhecido pelo parser multipart
+    declared_size = getattr(upload_file, "size", None)
+    if declared_size is not None and declared_size > max_size_bytes:
+        raise _file_too_large()
+
+    await aiofiles.os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+
+    hasher = hashlib.sha256()
+    size_bytes = 0
+
+    try:
+        async with aiofiles.open(destination_path, "wb") as buffer:
+            while True:
+                chunk = await upload_file.read(chunk_size)
+                if not chunk:
+                    break
+
+                size_bytes += len(chunk)
+                if size_bytes > max_size_bytes:
+                    raise _file_too_large()
+
+                hasher.update(chunk)
+                await buffer.write(chunk)
+    except BaseException:
+        # Não deixar arquivos parciais no disco
+        await _remove_silently(destination_path)
+        raise
+
+    logger.info(f"Arquivo salvo em {destination_path} ({size_bytes} bytes)")
+
+    return {
+        "file_path": destination_path,
+        "size_bytes": size_bytes,
+        "sha256": hasher.hexdigest()
+    }
+
+
+async def _remove_silently(path: str):
+    """Remove um arquivo ignorando erros (fora do event loop)"""
+    try:
+        await aiofiles.os.remove(path)
+    except OSError:
+        pass
+
+
+def content_path(content_hash: str, extension: str = "") -> str:
+    """Caminho do arquivo endereçado por conteúdo (objects/ab/cd/abcd...ext)"""
+    return os.path.join(CONTENT_DIR, content_hash[:2], content_hash[2:4], f"{content_hash}{extension.lower()}")
+
+
+async def _lock_content(db: AsyncSession, content_hash: str):
+    """
+    Serializa uploads e remoções do mesmo conteúdo até o fim da transação (PostgreSQL)
+
+    Sem o lock, uma remoção pode apagar o arquivo entre a verificação de existência
+    de um upload concorrente e o commit dele. No SQLite as escritas já são serializadas.
+    """
+    connection = await db.connection()
+    if connection.dialect.name == "postgresql":
+        await db.execute(
+            text("SELECT pg_advisory_xact_lock(:lock_id)"),
+            {"lock_id": advisory_lock_id(f"stored_file:{content_hash}")}
+        )
+
+
+async def store_content_addressed(
+    db: AsyncSession,
+    temp_path: str,
+    content_hash: str,
+    size_bytes: int,
+    extension: str = ""
+) -> str:
+    """
+    Move um upload temporário para o armazenamento endereçado por conteúdo
+
+    Se o conteúdo já existe, o arquivo temporário é descartado e apenas a contagem
+    de referências é incrementada. A alteração em stored_files entra na transação
+    da sessão (o commit fica com o chamador, junto com o Document).
+
+    Returns:
+        Caminho do arquivo armazenado
+    """
+    try:
+        return await _store_content_addressed(db, temp_path, content_hash, size_bytes, extension)
+    except BaseException:
+        await _remove_silently(temp_path)
+        raise
+
+
+async def _store_content_addressed(db: AsyncSession, temp_path: str, content_hash: str, size_bytes: int, extension: str) -> str:
+    await _lock_content(db, content_hash)
+    stored = await db.scalar(
+        select(StoredFile).where(StoredFile.content_hash == content_hash).with_for_update()
+    )
+
+    if stored is None:
+        stored = StoredFile(
+            content_hash=content_hash,
+            file_path=content_path(content_hash, extension),
+            size_bytes=size_bytes,
+            ref_count=1
+        )
+        try:
+            async with db.begin_nested():
+                db.add(stored)
+        except IntegrityError:
+            # Outro upload do mesmo conteúdo criou o registro ao mesmo tempo
+            stored = await db.scalar(
+                select(StoredFile).where(StoredFile.content_hash == content_hash).with_for_update()
+            )
+            stored.ref_count += 1
+    else:
+        stored.ref_count += 1
+
+    if await aiofiles.os.path.exists(stored.file_path):
+        await _remove_silently(temp_path)
+        logger.info(f"Conteúdo {content_hash[:12]} já armazenado ({stored.ref_count} referências)")
+    else:
+        await aiofiles.os.makedirs(os.path.dirname(stored.file_path), exist_ok=True)
+        await aiofiles.os.replace(temp_path, stored.file_path)
+
+    await db.flush()
+    return stored.file_path
+
+
+async def release_stored_file(db: AsyncSession, content_hash: str) -> bool:
+    """
+    Remove uma referência ao conteúdo; apaga o arquivo quando não há mais referências
+
+    Faz commit da sessão. O arquivo sai do lugar antes do commit, ainda sob o lock do
+    conteúdo (um upload concorrente grava um arquivo novo), e só é apagado depois dele.
+
+    Returns:
+        True se o arquivo foi apagado
+    """
+    await _lock_content(db, content_hash)
+    stored = await db.scalar(
+        select(StoredFile).where(StoredFile.content_hash == content_hash).with_for_update()
+    )
+    if stored is None:
+        await db.commit()
+        return False
+
+    if stored.ref_count > 1:
+        await db.execute(
+            update(StoredFile).where(StoredFile.content_hash == content_hash).values(
+                ref_count=StoredFile.ref_count - 1
+            )
+        )
+        await db.commit()
+        return False
+
+    file_path = stored.file_path
+    removed_path = f"{file_path}.removed"
+    await db.delete(stored)
+
+    moved = await aiofiles.os.path.exists(file_path)
+    if moved:
+        await aiofiles.os.replace(file_path, removed_path)
+    try:
+        await db.commit()
+    except BaseException:
+        if moved:
+            await aiofiles.os.replace(removed_path, file_path)
+        raise
+
+    if moved:
+        await _remove_silently(removed_path)
+        logger.info(f"Conteúdo {content_hash[:12]} sem referências, arquivo removido")
+    return moved
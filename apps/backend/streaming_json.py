@@ -0,0 +1,143 @@
+"""
+Parser incremental de objetos JSON recebidos em pedaços (streaming do GPT)
+Emite cada campo de nível superior assim que o valor correspondente está completo
+"""
+import json
+from typing import Any, List, Tuple
+
+WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONFieldParser:
+    """
+    Recebe o texto de um objeto JSON aos poucos e devolve os campos já completos
+
+    Texto antes da primeira chave '{' (ex.: cerca de markdown ```json) é ignorado.
+    Cada chamada a feed() reexamina apenas o trecho após o último campo emitido.
+
+    Exemplo:
+        parser = IncrementalJSONFieldParser()
+        parser.feed('{"resumo": "Contrato de')   # []
+        parser.feed(' serviços", "nivel')       # [("resumo", "Contrato de serviços")]
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: dict = {}
+        self.done = False
+        self._cursor = -1  # posição após '{' ou após o último campo emitido
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Adiciona texto e retorna os novos campos completos (chave, valor)"""
+        self.buffer += chunk
+        completed = []
+
+        if self._cursor < 0:
+            start = self.buffer.find("{")
+            if start < 0:
+                return completed
+            self._cursor = start + 1
+
+        while not self.done:
+            field = self._next_field()
+            if field is None:
+                break
+            key, value, end = field
+            self.fields[key] = value
+            completed.append((key, value))
+            self._cursor = end
+
+        return completed
+
+    def _next_field(self):
+        buffer = self.buffer
+        pos = self._skip(buffer, self._cursor, WHITESPACE + ",")
+        if pos >= len(buffer):
+            return None
+
+        if buffer[pos] == "}":
+            self.done = True
+            self._cursor = pos + 1
+            return None
+
+        if buffer[pos] != '"':
+            return None
+
+        key_start = pos
+        key_end = self._string_end(buffer, key_start)
+        if key_end is None:
+            return None
+
+        pos = self._skip(buffer, key_end, WHITESPACE)
+        if pos >= len(buffer) or buffer[pos] != ":":
+            return None
+
+        value_start = self._skip(buffer, pos + 1, WHITESPACE)
+        value_end = self._value_end(buffer, value_start)
+        if value_end is None:
+            return None
+
+        try:
+            key = json.loads(buffer[key_start:key_end])
+            value = json.loads(buffer[value_start:value_end])
+        except ValueError:
+            return None
+
+        return key, value, value_end
+
+    @staticmethod
+    def _skip(buffer: str, pos: int, chars: str) -> int:
+        while pos < len(buffer) and buffer[pos] in chars:
+            pos += 1
+        return pos
+
+    @staticmethod
+    def _string_end(buffer: str, pos: int):
+        """Posição após a aspa final da string iniciada em pos (None se incompleta)"""
+        index = pos + 1
+        while index < len(buffer):
+            char = buffer[index]
+            if char == "\\":
+                index += 2
+                continue
+            if char == '"':
+                return index + 1
+            index += 1
+        return None
+
+    def _value_end(self, buffer: str, pos: int):
+        """Posição após o fim do valor iniciado em pos (None se ainda incompleto)"""
+        if pos >= len(buffer):
+            return None
+
+        first = buffer[pos]
+        if first == '"':
+            return self._string_end(buffer, pos)
+
+        if first in "[{":
+            depth = 0
+            index = pos
+            while index < len(buffer):
+                char = buffer[index]
+                if char == '"':
+                    end = self._string_end(buffer, index)
+                    if end is None:
+                        return None
+                    index = end
+                    continue
+                if char in "[{":
+                    depth += 1
+                elif char in "]}":
+                    depth -= 1
+                    if depth == 0:
+                        return index + 1
+                index += 1
+            return None
+
+        # Número, true, false, null: termina no próximo delimitador
+        index = pos
+        while index < len(buffer) and buffer[index] not in ",}" + WHITESPACE:
+            index += 1
+        if index >= len(buffer):
+            return None
+        return index
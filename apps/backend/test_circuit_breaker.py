@@ -0,0 +1,91 @@
+import time
+import asyncio
+import logging
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+def test_abre_com_taxa_de_falhas_e_recusa_chamadas():
+    """Testa abertura do circuito ao atingir a taxa de falhas e falha rápida"""
+    breaker = CircuitBreaker("teste", failure_rate_threshold=0.5, min_calls=4, open_seconds=60)
+
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    breaker.record_success(0.1)
+    assert breaker.state == "closed"
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after > 0
+    assert breaker.get_status()["rejected"] == 1
+
+
+def test_abre_com_chamadas_lentas():
+    """Testa abertura do circuito quando a maioria das chamadas é lenta"""
+    breaker = CircuitBreaker("teste", slow_call_seconds=1, slow_call_rate_threshold=0.8, min_calls=5)
+
+    for _ in range(5):
+        breaker.record_success(2.0)
+
+    assert breaker.state == "open"
+
+
+def test_half_open_fecha_apos_chamada_de_teste():
+    """Testa transição open → half_open → closed e notificação dos listeners"""
+    transitions = []
+    breaker = CircuitBreaker("teste", min_calls=1, open_seconds=0.05)
+    breaker.add_listener(lambda old, new: transitions.append((old, new)))
+
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+
+    breaker.before_call()
+    # Apenas uma chamada de teste simultânea
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success(0.1)
+    assert breaker.state == "closed"
+    assert transitions == [("closed", "open"), ("open", "half_open"), ("half_open", "closed")]
+
+
+def test_half_open_reabre_com_falha():
+    """Testa que falha na chamada de teste reabre o circuito"""
+    breaker = CircuitBreaker("teste", min_calls=1, open_seconds=0.05)
+
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert breaker.get_status()["opened"] == 2
+
+
+@pytest.mark.asyncio
+async def test_listeners_assincronos_sao_mantidos_e_erros_registrados(caplog):
+    """Testa que a tarefa do listener é mantida até terminar e que sua exceção vai para o log"""
+    breaker = CircuitBreaker("teste", min_calls=1, open_seconds=60)
+    calls = []
+
+    async def listener(old_state, new_state):
+        await asyncio.sleep(0)
+        calls.append((old_state, new_state))
+        raise RuntimeError("listener falhou")
+
+    breaker.add_listener(listener)
+    with caplog.at_level(logging.ERROR, logger="circuit_breaker"):
+        breaker.record_failure()
+        assert len(breaker._tasks) == 1
+        await asyncio.gather(*breaker._tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    assert calls == [("closed", "open")]
+    assert breaker._tasks == set()
+    assert "listener falhou" in caplog.text
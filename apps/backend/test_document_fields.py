@@ -0,0 +1,81 @@
+import uuid
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, Document, DocumentPayload, DocumentStats
+from document_fields import (
+    LIST_FIELDS, DETAIL_FIELDS, resolve_fields, fields_options, serialize_document
+)
+
+
+def test_resolve_fields():
+    """Testa padrão, substituição com fields, acréscimo com include e campo desconhecido"""
+    assert resolve_fields(None, None, LIST_FIELDS) == LIST_FIELDS
+    assert resolve_fields("status, original_filename", None, LIST_FIELDS) == ("id", "status", "original_filename")
+    assert resolve_fields(None, "extracted_data,status", LIST_FIELDS) == LIST_FIELDS + ("extracted_data",)
+    assert resolve_fields("id", "gpt_summary", DETAIL_FIELDS) == ("id", "gpt_summary")
+
+    with pytest.raises(ValueError, match="file_path"):
+        resolve_fields("status,file_path", None, LIST_FIELDS)
+
+
+@pytest_asyncio.fixture
+async def db():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[Document.__table__, DocumentPayload.__table__, DocumentStats.__table__])
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_colunas_pesadas_nao_sao_carregadas(db):
+    """Testa que a listagem padrão não lê document_payloads e que include traz só as colunas pedidas"""
+    document_id = str(uuid.uuid4())
+    db.add(Document(
+        id=document_id, user_id=1, document_type="invoice", original_filename="nota.pdf",
+        file_path="/tmp/nota.pdf", status="complete", confidence_score=0.9,
+        extracted_data={"valor_total": "R$ 10,00"}, gpt_insights={"resumo": "ok"}
+    ))
+    await db.commit()
+    db.expunge_all()
+
+    document = await db.scalar(select(Document).options(*fields_options(LIST_FIELDS)))
+    # document_payloads nem é consultada
+    assert {"payload", "file_path"} <= inspect(document).unloaded
+
+    serialized = serialize_document(document, LIST_FIELDS)
+    assert set(serialized) == set(LIST_FIELDS)
+    assert serialized["confidence_score"] == 0.9
+    db.expunge_all()
+
+    selected = resolve_fields("status", "extracted_data,gpt_insights", LIST_FIELDS)
+    document = await db.scalar(select(Document).options(*fields_options(selected)))
+    assert serialize_document(document, selected) == {
+        "id": document_id,
+        "status": "complete",
+        "extracted_data": {"valor_total": "R$ 10,00"},
+        "gpt_insights": {"resumo": "ok"}
+    }
+    assert "gpt_summary" in inspect(document.payload).unloaded
+
+
+@pytest.mark.asyncio
+async def test_remover_documento_remove_o_payload(db):
+    """Testa que o trigger criado junto com a tabela remove o payload do documento apagado"""
+    db.add(Document(
+        id="doc-removido", user_id=1, document_type="invoice", original_filename="nota.pdf",
+        file_path="/tmp/nota.pdf", status="complete", extracted_data={"valor_total": "R$ 10,00"}
+    ))
+    await db.commit()
+    db.expunge_all()
+
+    # Como em DELETE /api/documents/{id}: o payload não é carregado
+    await db.delete(await db.scalar(select(Document).where(Document.id == "doc-removido")))
+    await db.commit()
+
+    assert await db.scalar(select(DocumentPayload.document_id)) is None
@@ -0,0 +1,199 @@
+"""
+Particionamento mensal de documents
+
+O teste de criação/arquivamento é de integração: requer PostgreSQL em
+EXPLAIN_TEST_DATABASE_URL (URL síncrona) e usa schemas próprios, removidos ao final.
+"""
+import os
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from models import Base
+from document_partitions import (
+    DocumentPartitionManager, add_months, partition_name, partition_month, partition_bounds, create_partition_sql
+)
+
+EXPLAIN_TEST_DATABASE_URL = os.getenv("EXPLAIN_TEST_DATABASE_URL")
+SCHEMA = "orbit_partitions_test"
+ARCHIVE_SCHEMA = "orbit_partitions_test_archive"
+NOW = datetime(2026, 10, 15, 12, 0, tzinfo=timezone.utc)
+
+
+def test_meses_e_limites_das_particoes():
+    """Testa a aritmética de meses (virada de ano) e o intervalo [início, fim) em UTC"""
+    assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+
+    assert partition_name(date(2026, 2, 1)) == "documents_p2026_02"
+    assert partition_month("documents_p2026_02") == date(2026, 2, 1)
+    assert partition_month("documents_default") is None
+
+    assert partition_bounds(date(2026, 12, 1)) == (
+        datetime(2026, 12, 1, tzinfo=timezone.utc), datetime(2027, 1, 1, tzinfo=timezone.utc)
+    )
+    assert create_partition_sql(date(2026, 12, 1)) == (
+        "CREATE TABLE IF NOT EXISTS documents_p2026_12 PARTITION OF documents "
+        "FOR VALUES FROM ('2026-12-01T00:00:00+00:00') TO ('2027-01-01T00:00:00+00:00') "
+        "WITH (fillfactor = 80)"
+    )
+
+
+@pytest.mark.asyncio
+async def test_fora_do_postgresql_nao_faz_nada():
+    """Testa que sem tabela particionada (SQLite) criação e arquivamento são ignorados"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    manager = DocumentPartitionManager(engine=engine, archive_after_months=6)
+
+    assert await manager.ensure_partitions() == []
+    assert await manager.archive_partitions() == []
+    assert manager.get_stats()["created"] == 0
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_arquivamento_interrompido_e_retomado(monkeypatch):
+    """Testa que DETACH pendente é concluído com FINALIZE e partições já desanexadas são movidas"""
+    import document_stats
+
+    manager = DocumentPartitionManager(engine=object(), archive_after_months=0)
+    archived = []
+
+    async def partitions():
+        return ["documents_p2026_03", "documents_p2026_10"]
+
+    async def pending():
+        return ["documents_p2026_03"]
+
+    async def detached():
+        return ["documents_p2026_02"]
+
+    async def archive(name, attached=True, finalize=False):
+        archived.append((name, attached, finalize))
+
+    async def partitioned():
+        return True
+
+    async def repair(session_factory):
+        return None
+
+    monkeypatch.setattr(manager, "is_partitioned", partitioned)
+    monkeypatch.setattr(manager, "list_partitions", partitions)
+    monkeypatch.setattr(manager, "pending_detach_partitions", pending)
+    monkeypatch.setattr(manager, "detached_partitions", detached)
+    monkeypatch.setattr(manager, "_archive_partition", archive)
+    monkeypatch.setattr(document_stats, "repair_document_stats", repair)
+    monkeypatch.setattr("document_partitions.async_sessionmaker", lambda *args, **kwargs: None)
+
+    assert await manager.archive_partitions(now=NOW) == ["documents_p2026_02", "documents_p2026_03"]
+    assert archived == [("documents_p2026_02", False, False), ("documents_p2026_03", True, True)]
+
+
+@pytest.fixture
+def postgres_schema():
+    engine = create_engine(EXPLAIN_TEST_DATABASE_URL)
+    tables = [Base.metadata.tables[name] for name in ("documents", "document_payloads", "document_stats")]
+    with engine.connect() as conn:
+        for schema in (SCHEMA, ARCHIVE_SCHEMA):
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        Base.metadata.create_all(conn, tables=tables)
+        conn.commit()
+
+    yield engine
+
+    with engine.connect() as conn:
+        for schema in (SCHEMA, ARCHIVE_SCHEMA):
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        conn.commit()
+    engine.dispose()
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+@pytest.mark.skipif(not EXPLAIN_TEST_DATABASE_URL, reason="EXPLAIN_TEST_DATABASE_URL não configurada")
+async def test_cria_particoes_adiante_e_arquiva_as_frias(postgres_schema):
+    """Testa a criação das partições futuras e o DETACH das antigas (com payloads) para o schema de arquivo"""
+    engine = create_async_engine(
+        EXPLAIN_TEST_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1),
+        connect_args={"server_settings": {"search_path": SCHEMA}}
+    )
+    manager = DocumentPartitionManager(engine=engine, months_ahead=2, archive_schema=ARCHIVE_SCHEMA)
+    old_month = add_months(date(2026, 10, 1), -6)
+
+    try:
+        assert await manager.ensure_partitions(now=NOW) == ["documents_p2026_10", "documents_p2026_11", "documents_p2026_12"]
+        assert await manager.ensure_partitions(now=NOW) == []
+
+        async with engine.begin() as conn:
+            await conn.execute(text(create_partition_sql(old_month)))
+            await conn.execute(text("""
+                INSERT INTO documents (id, user_id, document_type, original_filename, file_path, status, wu3_poll_attempts, created_at)
+                VALUES ('antigo', 1, 'invoice', 'a.pdf', '/a.pdf', 'complete', 0, :old),
+                       ('atual', 1, 'invoice', 'b.pdf', '/b.pdf', 'complete', 0, :now)
+            """), {"old": partition_bounds(old_month)[0], "now": NOW})
+            await conn.execute(text("""
+                INSERT INTO document_payloads (document_id, extracted_data)
+                VALUES ('antigo', '{"total": 1}'), ('atual', '{"total": 2}')
+            """))
+
+        assert await manager.archive_partitions(older_than_months=3, now=NOW) == [partition_name(old_month)]
+
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("SELECT id FROM documents"))).scalars().all() == ["atual"]
+            assert (await conn.execute(text("SELECT document_id FROM document_payloads"))).scalars().all() == ["atual"]
+            assert await conn.scalar(text(f"SELECT id FROM {ARCHIVE_SCHEMA}.{partition_name(old_month)}")) == "antigo"
+            assert await conn.scalar(text(
+                f"SELECT document_id FROM {ARCHIVE_SCHEMA}.document_payloads_p{old_month:%Y_%m}"
+            )) == "antigo"
+            # Contadores refletem só o documento que ficou
+            assert await conn.scalar(text(
+                "SELECT count FROM document_stats WHERE user_id = 1 AND dimension = 'status' AND key = 'complete'"
+            )) == 1
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+@pytest.mark.skipif(not EXPLAIN_TEST_DATABASE_URL, reason="EXPLAIN_TEST_DATABASE_URL não configurada")
+async def test_retoma_arquivamento_interrompido_apos_detach(postgres_schema):
+    """Testa que uma partição desanexada mas não movida (execução interrompida) é arquivada na execução seguinte"""
+    engine = create_async_engine(
+        EXPLAIN_TEST_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1),
+        connect_args={"server_settings": {"search_path": SCHEMA}}
+    )
+    # Arquivamento automático desligado: a retomada não depende dele
+    manager = DocumentPartitionManager(engine=engine, archive_after_months=0, archive_schema=ARCHIVE_SCHEMA)
+    old_month = add_months(date(2026, 10, 1), -6)
+    name = partition_name(old_month)
+
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text(create_partition_sql(old_month)))
+            await conn.execute(text("""
+                INSERT INTO documents (id, user_id, document_type, original_filename, file_path, status, wu3_poll_attempts, created_at)
+                VALUES ('antigo', 1, 'invoice', 'a.pdf', '/a.pdf', 'complete', 0, :old)
+            """), {"old": partition_bounds(old_month)[0]})
+            await conn.execute(text("INSERT INTO document_payloads (document_id, extracted_data) VALUES ('antigo', '{}')"))
+            # Processo interrompido entre o DETACH e a transação que move a partição
+            await conn.execute(text(f"ALTER TABLE documents DETACH PARTITION {name}"))
+
+        assert await manager.list_partitions() == []
+        assert await manager.detached_partitions() == [name]
+
+        assert await manager.archive_partitions(now=NOW) == [name]
+        assert await manager.detached_partitions() == []
+        assert await manager.archive_partitions(now=NOW) == []
+
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("SELECT document_id FROM document_payloads"))).scalars().all() == []
+            assert await conn.scalar(text(f"SELECT id FROM {ARCHIVE_SCHEMA}.{name}")) == "antigo"
+            assert await conn.scalar(text(
+                f"SELECT document_id FROM {ARCHIVE_SCHEMA}.document_payloads_p{old_month:%Y_%m}"
+            )) == "antigo"
+    finally:
+        await engine.dispose()
@@ -0,0 +1,39 @@
+from document_pipeline import _reused_wu3_result, _reusable_insights
+from gpt_client import gpt_client
+from models import Document
+
+
+def _donor(**fields):
+    return Document(
+        id="doc-original",
+        user_id=1,
+        document_type="invoice",
+        original_filename="nota.pdf",
+        file_path="/tmp/nota.pdf",
+        status="complete",
+        extracted_data={"valor_total": "R$ 10,00"},
+        confidence_score=0.93,
+        wu3_version="2.1.0",
+        **fields
+    )
+
+
+def test_reaproveita_resultado_wu3_de_conteudo_identico():
+    """Testa que o resultado reaproveitado não carrega IDs da Wu3 do documento original"""
+    result = _reused_wu3_result(_donor())
+
+    assert result["extracted_data"] == {"valor_total": "R$ 10,00"}
+    assert result["confidence_score"] == 0.93
+    assert result["reused_from"] == "doc-original"
+    assert "wu3_document_id" not in result
+
+
+def test_insights_reaproveitados_apenas_do_modelo_atual():
+    """Testa que insights de outro modelo GPT não são reaproveitados"""
+    insights = {"resumo": "Nota fiscal", "modelo_usado": gpt_client.model}
+
+    current = _donor(insights_status="complete", gpt_insights=insights, gpt_model_used=gpt_client.model)
+    other_model = _donor(insights_status="complete", gpt_insights=insights, gpt_model_used="outro-modelo")
+
+    assert _reusable_insights(current) == insights
+    assert _reusable_insights(other_model) is None
@@ -0,0 +1,79 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, Document, DocumentStats
+from document_queries import user_documents_query, encode_cursor, decode_cursor
+
+
+@pytest_asyncio.fixture
+async def db():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[Document.__table__, DocumentStats.__table__])
+
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        session.add_all([
+            Document(
+                id=str(uuid.uuid4()),
+                user_id=1,
+                document_type="invoice" if i % 2 else "contract",
+                original_filename=f"arquivo_{i}.pdf",
+                file_path=f"/tmp/arquivo_{i}.pdf",
+                status="complete" if i % 3 else "failed",
+                # Pares de documentos com o mesmo created_at: o id desempata
+                created_at=base + timedelta(hours=i // 2)
+            )
+            for i in range(25)
+        ])
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+
+async def fetch_all_pages(db, page_size, **filters):
+    pages, cursor = [], None
+    while True:
+        documents = (await db.execute(
+            user_documents_query(1, cursor=cursor, **filters).limit(page_size + 1)
+        )).scalars().all()
+        pages.append([document.id for document in documents[:page_size]])
+        if len(documents) <= page_size:
+            return pages
+        last = documents[page_size - 1]
+        cursor = encode_cursor(last.created_at, last.id)
+
+
+@pytest.mark.asyncio
+async def test_paginacao_percorre_todos_sem_repetir(db):
+    """Testa que as páginas seguem (created_at, id) decrescente, sem repetir nem pular documentos"""
+    expected = (await db.execute(user_documents_query(1))).scalars().all()
+    pages = await fetch_all_pages(db, 10)
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [document_id for page in pages for document_id in page] == [document.id for document in expected]
+    assert [(d.created_at, d.id) for d in expected] == sorted(((d.created_at, d.id) for d in expected), reverse=True)
+
+
+@pytest.mark.asyncio
+async def test_filtros_e_cursor_invalido(db):
+    """Testa filtros por status, tipo e intervalo de criação e rejeição de cursor adulterado"""
+    pages = await fetch_all_pages(
+        db, 3, status="complete", document_type="invoice",
+        created_from=datetime(2026, 1, 1, 2, tzinfo=timezone.utc),
+        created_to=datetime(2026, 1, 1, 10, tzinfo=timezone.utc)
+    )
+    ids = [document_id for page in pages for document_id in page]
+    documents = [await db.get(Document, document_id) for document_id in ids]
+
+    # i ímpar (invoice), não múltiplo de 3 (complete), i // 2 entre 2 e 9
+    assert sorted(int(d.original_filename[8:-4]) for d in documents) == [5, 7, 11, 13, 17, 19]
+
+    created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(created_at, "abc")) == (created_at, "abc")
+    with pytest.raises(ValueError):
+        user_documents_query(1, cursor="nao-e-um-cursor")
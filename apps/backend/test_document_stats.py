@@ -0,0 +1,125 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, Document, DocumentPayload, DocumentStats
+from document_stats import (
+    get_user_stats, get_user_stats_between, record_transitions, repair_document_stats, today_key, INSIGHTS, STATUS
+)
+
+
+@pytest_asyncio.fixture
+async def session_factory():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[Document.__table__, DocumentPayload.__table__, DocumentStats.__table__])
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+def make_document(user_id: int, **fields) -> Document:
+    return Document(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        document_type=fields.pop("document_type", "invoice"),
+        original_filename="nota.pdf",
+        file_path="/tmp/nota.pdf",
+        created_at=fields.pop("created_at", datetime.now().astimezone()),
+        **fields
+    )
+
+
+@pytest.mark.asyncio
+async def test_transicoes_pelo_orm_atualizam_contadores(session_factory):
+    """Testa inserção, mudança de status/tipo e remoção refletidas na mesma transação"""
+    async with session_factory() as db:
+        first = make_document(1, status="processing")
+        second = make_document(1, status="processing", document_type="contract")
+        other_user = make_document(2, status="complete")
+        db.add_all([first, second, other_user])
+        await db.commit()
+
+        first.status = "complete"
+        first.insights_status = "complete"
+        second.document_type = "invoice"
+        await db.commit()
+
+        await db.delete(second)
+        await db.commit()
+
+        stats = await get_user_stats(db, 1)
+
+    assert stats == {
+        "total_documents": 1,
+        "today_documents": 1,
+        "by_status": {"complete": 1},
+        "by_type": {"invoice": 1},
+        "by_insights_status": {"complete": 1}
+    }
+
+    report = await repair_document_stats(session_factory)
+    assert report["drift_count"] == 0
+
+
+@pytest.mark.asyncio
+async def test_reparo_corrige_e_reporta_divergencias(session_factory):
+    """Testa UPDATE em massa registrado com record_transitions e divergência corrigida pelo reparo"""
+    async with session_factory() as db:
+        document = make_document(1, status="complete")
+        db.add(document)
+        await db.commit()
+
+        await db.execute(update(Document).values(insights_status="queued"))
+        await record_transitions(db, 1, INSIGHTS, [("pending", "queued")])
+        # Contador corrompido (ex.: UPDATE manual sem registrar a transição)
+        await db.execute(update(DocumentStats).where(
+            DocumentStats.dimension == STATUS, DocumentStats.key == "complete"
+        ).values(count=5))
+        await db.commit()
+
+    report = await repair_document_stats(session_factory)
+
+    assert report["drift"] == [
+        {"user_id": 1, "dimension": STATUS, "key": "complete", "expected": 1, "stored": 5}
+    ]
+    # Contador zerado de insights pending é removido
+    assert report["pruned"] == 1
+
+    async with session_factory() as db:
+        stats = await get_user_stats(db, 1)
+
+    assert stats["by_status"] == {"complete": 1}
+    assert stats["by_insights_status"] == {"queued": 1}
+    assert stats["today_documents"] == 1
+    assert today_key() == datetime.now().date().isoformat()
+
+
+@pytest.mark.asyncio
+async def test_estatisticas_por_intervalo_consideram_so_documentos_do_intervalo(session_factory):
+    """Testa que created_from/created_to recortam os contadores (e o "hoje") por data de criação"""
+    now = datetime.now().astimezone()
+    async with session_factory() as db:
+        db.add_all([
+            make_document(1, status="complete", created_at=now - timedelta(days=40)),
+            make_document(1, status="failed", document_type="contract", created_at=now - timedelta(days=10)),
+            make_document(1, status="complete"),
+            make_document(2, status="complete", created_at=now - timedelta(days=10)),
+        ])
+        await db.commit()
+
+        last_month = await get_user_stats_between(db, 1, now - timedelta(days=30), now - timedelta(days=1))
+        since_last_month = await get_user_stats_between(db, 1, now - timedelta(days=30), None)
+
+    assert last_month == {
+        "total_documents": 1,
+        "today_documents": 0,
+        "by_status": {"failed": 1},
+        "by_type": {"contract": 1},
+        "by_insights_status": {"pending": 1}
+    }
+    assert since_last_month["total_documents"] == 2
+    assert since_last_month["today_documents"] == 1
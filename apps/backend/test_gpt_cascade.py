@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from gpt_client import GPTClient
+from insights_cache import InsightsCache
+import gpt_client as gpt_client_module
+
+VALID = json.dumps({"resumo": "Nota fiscal", "pontos_principais": ["a"], "recomendacoes": ["b"], "nivel_atencao": "baixo"})
+
+
+@pytest.fixture
+def cascade_client(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-teste")
+    monkeypatch.setenv("GPT_CASCADE_ENABLED", "true")
+    monkeypatch.setenv("GPT_FAST_MODEL", "gpt-4o-mini")
+    monkeypatch.setenv("GPT_HIGH_STAKES_TYPES", "contract")
+    monkeypatch.setattr(gpt_client_module, "insights_cache", InsightsCache(backend="none"))
+    client = GPTClient()
+    client.calls = []
+
+    def use_responses(responses):
+        async def fake_call(prompt, priority=None, model=None):
+            client.calls.append(model)
+            return responses[model]
+        monkeypatch.setattr(client, "_call_openai_api", fake_call)
+
+    client.use_responses = use_responses
+    return client
+
+
+@pytest.mark.asyncio
+async def test_modelo_rapido_aceito_ou_escalado(cascade_client):
+    """Testa que o modelo rápido basta quando a resposta é boa e escala quando não é JSON"""
+    cascade_client.use_responses({"gpt-4o-mini": VALID, "gpt-4": VALID})
+    insights = await cascade_client.generate_document_insights({"valor": "10"}, "invoice", "nota.pdf", 0.95)
+
+    assert cascade_client.calls == ["gpt-4o-mini"]
+    assert insights["modelo_usado"] == "gpt-4o-mini"
+
+    cascade_client.calls.clear()
+    cascade_client.use_responses({"gpt-4o-mini": "não sei responder", "gpt-4": VALID})
+    insights = await cascade_client.generate_document_insights({"valor": "20"}, "invoice", "nota2.pdf", 0.95)
+
+    assert cascade_client.calls == ["gpt-4o-mini", "gpt-4"]
+    assert insights["modelo_usado"] == "gpt-4"
+
+    cascade = cascade_client.get_status()["cascade"]
+    assert cascade["fast_accepted"] == 1
+    assert cascade["escalations"] == {"unparseable_response": 1}
+    assert cascade["escalation_rate"] == 0.5
+    assert cascade_client.get_status()["model_latency"]["gpt-4o-mini"]["calls"] == 2
+
+
+@pytest.mark.asyncio
+async def test_alto_risco_e_baixa_confianca_vao_direto_ao_modelo_principal(cascade_client):
+    """Testa que tipos de alto risco e extrações de baixa confiança não passam pelo modelo rápido"""
+    cascade_client.use_responses({"gpt-4o-mini": VALID, "gpt-4": VALID})
+
+    await cascade_client.generate_document_insights({"parte": "A"}, "contract", "contrato.pdf", 0.99)
+    await cascade_client.generate_document_insights({"valor": "10"}, "invoice", "nota.pdf", 0.5)
+
+    assert cascade_client.calls == ["gpt-4", "gpt-4"]
+    assert cascade_client.get_status()["cascade"]["direct"] == {"high_stakes_type": 1, "low_confidence": 1}
+
+
+@pytest.mark.asyncio
+async def test_streaming_so_repassa_campos_do_modelo_final(cascade_client, monkeypatch):
+    """Testa que, ao escalar, o cliente não recebe campos do modelo rápido descartado"""
+    cascade_client.use_responses({"gpt-4o-mini": "não sei responder", "gpt-4": VALID})
+
+    async def fake_stream(prompt, on_progress, priority=None, model=None):
+        cascade_client.calls.append(f"stream:{model}")
+        for field, value in json.loads(VALID).items():
+            await on_progress(field, value)
+        return VALID
+
+    monkeypatch.setattr(cascade_client, "_stream_openai_api", fake_stream)
+    received = []
+
+    async def on_progress(field, value):
+        received.append(field)
+
+    insights = await cascade_client.generate_document_insights(
+        {"valor": "30"}, "invoice", "nota3.pdf", 0.95, on_progress=on_progress
+    )
+
+    assert cascade_client.calls == ["gpt-4o-mini", "stream:gpt-4"]
+    assert insights["modelo_usado"] == "gpt-4"
+    assert received == list(json.loads(VALID))
@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+import gpt_client as gpt_client_module
+from gpt_client import GPTClient
+from http_pool import http_pool
+from insights_cache import InsightsCache
+from streaming_json import IncrementalJSONFieldParser
+
+INSIGHTS = {
+    "resumo": "Contrato de prestação de serviços com \"multa\" de 10%",
+    "pontos_principais": ["Vigência de 12 meses", "Reajuste anual, IPCA"],
+    "nivel_atencao": "medio",
+    "observacoes": {"clausulas": [1, 2]}
+}
+
+
+def test_parser_emite_campos_completos_em_pedacos():
+    """Testa que cada campo é emitido uma única vez, apenas quando completo"""
+    text = "```json\n" + json.dumps(INSIGHTS, ensure_ascii=False, indent=2) + "\n```"
+    parser = IncrementalJSONFieldParser()
+    emitted = []
+
+    for index in range(0, len(text), 5):
+        emitted.extend(parser.feed(text[index:index + 5]))
+
+    assert emitted == list(INSIGHTS.items())
+    assert parser.done
+
+
+@pytest_asyncio.fixture
+async def openai_sse_server():
+    """Servidor local que simula o streaming SSE de chat completions da OpenAI"""
+    requests = []
+    content = json.dumps(INSIGHTS, ensure_ascii=False)
+
+    async def handler(request):
+        requests.append(await request.json())
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        for index in range(0, len(content), 8):
+            event = {"choices": [{"delta": {"content": content[index:index + 8]}}]}
+            await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            await asyncio.sleep(0)
+
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    yield f"http://127.0.0.1:{port}/v1/chat/completions", requests
+
+    await http_pool.close()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_streaming_repassa_campos_e_retorna_insights_completos(openai_sse_server, monkeypatch):
+    """Testa consumo do SSE, progresso por campo e resultado final"""
+    url, requests = openai_sse_server
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-teste")
+    monkeypatch.setenv("OPENAI_API_URL", url)
+    monkeypatch.setattr(gpt_client_module, "insights_cache", InsightsCache(backend="none"))
+    client = GPTClient()
+    progress = []
+
+    async def on_progress(field, value):
+        progress.append((field, value))
+
+    insights = await client.generate_document_insights(
+        {"valor": "R$ 1.000,00"}, "contract", "contrato.pdf", on_progress=on_progress
+    )
+
+    assert requests[0]["stream"] is True
+    assert progress == list(INSIGHTS.items())
+    assert insights["resumo"] == INSIGHTS["resumo"]
+    assert insights["fonte"] == "openai_gpt4"
@@ -0,0 +1,43 @@
+import pytest
+from aiohttp import web
+
+from http_pool import HTTPClientPool
+
+
+@pytest.mark.asyncio
+async def test_pool_reutiliza_conexoes_e_expoe_estatisticas():
+    """Testa reutilização de conexões keep-alive e contadores do pool"""
+    async def handler(request):
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    pool = HTTPClientPool()
+    pool.register("teste", limit=5, limit_per_host=2, timeout_seconds=5)
+
+    try:
+        await pool.start()
+        session = pool.get_session("teste")
+        assert pool.get_session("teste") is session
+
+        for _ in range(3):
+            async with session.get(f"http://127.0.0.1:{port}/") as response:
+                assert (await response.json()) == {"ok": True}
+
+        stats = pool.get_stats()["teste"]
+        assert stats["requests_total"] == 3
+        assert stats["connections_created"] == 1
+        assert stats["connections_reused"] == 2
+        assert stats["idle"] == 1
+        assert stats["waiting"] == 0
+    finally:
+        await pool.close()
+        await runner.cleanup()
+
+    assert pool.get_stats()["teste"]["active"] is False
@@ -0,0 +1,75 @@
+import json
+import time
+
+import pytest
+
+from gpt_client import GPTClient
+from insights_cache import InsightsCache, LRUTTLCache, build_cache_key
+import gpt_client as gpt_client_module
+
+
+def test_chave_canonica_independe_da_ordem_dos_campos():
+    """Testa que a chave depende do conteúdo, não da ordem dos campos extraídos"""
+    a = build_cache_key("gpt-4", 0.4, 1000, "invoice", {"valor": "10", "cnpj": "1"})
+    b = build_cache_key("gpt-4", 0.4, 1000, "invoice", {"cnpj": "1", "valor": "10"})
+
+    assert a == b
+    assert a != build_cache_key("gpt-4", 0.5, 1000, "invoice", {"cnpj": "1", "valor": "10"})
+    assert a != build_cache_key("gpt-4", 0.4, 1000, "contract", {"cnpj": "1", "valor": "10"})
+
+
+def test_lru_descarta_menos_usado_e_expira_por_ttl():
+    """Testa limite de entradas (LRU) e expiração por TTL"""
+    cache = LRUTTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    cache.get("a")
+    cache.set("c", {"v": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+    assert cache.evictions == 1
+
+    cache.set("d", {"v": 4}, ttl_seconds=0.01)
+    time.sleep(0.02)
+    assert cache.get("d") is None
+
+
+@pytest.mark.asyncio
+async def test_dois_niveis_repopula_l1_e_invalida():
+    """Testa hit no L2 após perda do L1 e invalidação nos dois níveis"""
+    cache = InsightsCache(backend="memory", max_entries=10, ttl_seconds=60)
+
+    assert await cache.get("k") is None
+    await cache.set("k", {"resumo": "ok"}, "gpt-4", "invoice")
+
+    cache.local.delete("k")
+    assert await cache.get("k") == {"resumo": "ok"}
+    assert await cache.get("k") == {"resumo": "ok"}
+
+    await cache.invalidate("k")
+    assert await cache.get("k") is None
+
+    stats = cache.get_stats()
+    assert (stats["l1_hits"], stats["l2_hits"], stats["misses"]) == (1, 1, 2)
+
+
+@pytest.mark.asyncio
+async def test_gpt_client_nao_chama_openai_para_dados_repetidos(monkeypatch):
+    """Testa que insights repetidos vêm do cache sem nova chamada à OpenAI"""
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-teste")
+    monkeypatch.setattr(gpt_client_module, "insights_cache", InsightsCache(backend="memory"))
+    client = GPTClient()
+    calls = []
+
+    async def fake_call(prompt, priority=None, model=None):
+        calls.append(prompt)
+        return json.dumps({"resumo": "Nota fiscal", "pontos_principais": [], "recomendacoes": [], "nivel_atencao": "baixo"})
+
+    monkeypatch.setattr(client, "_call_openai_api", fake_call)
+
+    first = await client.generate_document_insights({"valor": "10"}, "invoice", "nota.pdf")
+    second = await client.generate_document_insights({"valor": "10"}, "invoice", "copia.pdf")
+
+    assert len(calls) == 1
+    assert second["resumo"] == first["resumo"] == "Nota fiscal"
@@ -0,0 +1,133 @@
+import re
+import json
+import asyncio
+
+import pytest
+
+from gpt_client import GPTClient
+from insights_cache import InsightsCache
+from insights_microbatch import InsightsMicroBatcher, parse_batch_response
+import gpt_client as gpt_client_module
+
+
+def _insights(resumo):
+    return {"resumo": resumo, "pontos_principais": ["a"], "recomendacoes": ["b"], "nivel_atencao": "baixo"}
+
+
+@pytest.fixture
+def batch_client(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-teste")
+    monkeypatch.setattr(gpt_client_module, "insights_cache", InsightsCache(backend="none"))
+    client = GPTClient()
+    client.microbatcher = InsightsMicroBatcher(client, enabled=True, max_documents=3, window_seconds=0.05)
+    client.calls = []
+    return client
+
+
+def _generate(client, count):
+    return asyncio.gather(*(
+        client.generate_document_insights(
+            {"nome": f"Pessoa {i}"}, "identity", f"rg-{i}.jpg", 0.95, priority="post_upload", document_id=f"doc-{i}"
+        )
+        for i in range(count)
+    ))
+
+
+@pytest.mark.asyncio
+async def test_documentos_pequenos_numa_unica_chamada(batch_client, monkeypatch):
+    """Testa agrupamento em uma chamada e distribuição dos resultados por document_id"""
+    async def fake_call(prompt, priority=None, model=None, max_tokens=None):
+        batch_client.calls.append(prompt)
+        ids = re.findall(r"DOCUMENT_ID: (\S+)", prompt)
+        # Resposta fora de ordem: a associação é pelo document_id
+        return json.dumps([{"document_id": doc_id, **_insights(f"Resumo {doc_id}")} for doc_id in reversed(ids)])
+
+    monkeypatch.setattr(batch_client, "_call_openai_api", fake_call)
+    results = await _generate(batch_client, 3)
+
+    assert len(batch_client.calls) == 1
+    assert [result["resumo"] for result in results] == ["Resumo doc-0", "Resumo doc-1", "Resumo doc-2"]
+    assert batch_client.microbatcher.get_stats()["documents"] == 3
+
+
+@pytest.mark.asyncio
+async def test_lote_invalido_volta_para_chamadas_individuais(batch_client, monkeypatch):
+    """Testa fallback por documento quando a resposta do lote não é um array JSON"""
+    async def fake_call(prompt, priority=None, model=None, max_tokens=None):
+        batch_client.calls.append(prompt)
+        if "DOCUMENT_ID:" in prompt:
+            return "Não consegui analisar os documentos"
+        return json.dumps(_insights("individual"))
+
+    monkeypatch.setattr(batch_client, "_call_openai_api", fake_call)
+    results = await _generate(batch_client, 2)
+
+    assert len(batch_client.calls) == 3
+    assert all(result["resumo"] == "individual" for result in results)
+    stats = batch_client.microbatcher.get_stats()
+    assert stats["parse_failures"] == 1 and stats["fallbacks"] == 2
+
+
+@pytest.mark.asyncio
+async def test_stop_envia_grupos_pendentes_e_aguarda_lotes(batch_client, monkeypatch):
+    """Testa que stop() não espera a janela e só retorna com os lotes concluídos"""
+    batch_client.microbatcher.window_seconds = 60
+
+    async def fake_call(prompt, priority=None, model=None, max_tokens=None):
+        batch_client.calls.append(prompt)
+        await asyncio.sleep(0.01)
+        ids = re.findall(r"DOCUMENT_ID: (\S+)", prompt)
+        return json.dumps([{"document_id": doc_id, **_insights(f"Resumo {doc_id}")} for doc_id in ids])
+
+    monkeypatch.setattr(batch_client, "_call_openai_api", fake_call)
+    pending = asyncio.ensure_future(_generate(batch_client, 2))
+    while batch_client.microbatcher.get_stats()["pending"] < 2:
+        await asyncio.sleep(0)
+
+    await asyncio.wait_for(batch_client.microbatcher.stop(), timeout=1)
+
+    assert batch_client.microbatcher.get_stats()["running"] == 0
+    assert [result["resumo"] for result in await pending] == ["Resumo doc-0", "Resumo doc-1"]
+    assert len(batch_client.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_cascata_alto_risco_e_baixa_confianca_fora_do_lote(monkeypatch):
+    """Testa que documentos que a cascata manda direto ao modelo principal não vão em lote ao modelo rápido"""
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-teste")
+    monkeypatch.setenv("GPT_CASCADE_ENABLED", "true")
+    monkeypatch.setenv("GPT_FAST_MODEL", "gpt-4o-mini")
+    monkeypatch.setenv("GPT_HIGH_STAKES_TYPES", "contract")
+    monkeypatch.setattr(gpt_client_module, "insights_cache", InsightsCache(backend="none"))
+    client = GPTClient()
+    client.microbatcher = InsightsMicroBatcher(client, enabled=True, max_documents=2, window_seconds=0.05)
+    models = []
+
+    async def fake_call(prompt, priority=None, model=None, max_tokens=None):
+        models.append(("lote" if "DOCUMENT_ID:" in prompt else "individual", model))
+        ids = re.findall(r"DOCUMENT_ID: (\S+)", prompt)
+        if ids:
+            return json.dumps([{"document_id": doc_id, **_insights("lote")} for doc_id in ids])
+        return json.dumps(_insights("individual"))
+
+    monkeypatch.setattr(client, "_call_openai_api", fake_call)
+    results = await asyncio.gather(
+        client.generate_document_insights({"parte": "A"}, "contract", "contrato-1.pdf", 0.99, priority="post_upload", document_id="c-1"),
+        client.generate_document_insights({"parte": "B"}, "contract", "contrato-2.pdf", 0.99, priority="post_upload", document_id="c-2"),
+        client.generate_document_insights({"nome": "A"}, "identity", "rg-1.jpg", 0.3, priority="post_upload", document_id="i-1"),
+        client.generate_document_insights({"nome": "B"}, "identity", "rg-2.jpg", 0.3, priority="post_upload", document_id="i-2"),
+    )
+
+    assert models == [("individual", "gpt-4")] * 4
+    assert [result["resumo"] for result in results] == ["individual"] * 4
+    assert client.microbatcher.get_stats()["batches"] == 0
+    assert client.get_status()["cascade"]["direct"] == {"high_stakes_type": 2, "low_confidence": 2}
+
+
+def test_formatos_de_resposta_do_lote():
+    """Testa array puro, cerca de markdown e objeto com o array"""
+    assert parse_batch_response('[{"document_id": "a"}]') == [{"document_id": "a"}]
+    assert parse_batch_response('```json\n[{"document_id": "a"}, 1]\n```') == [{"document_id": "a"}]
+    assert parse_batch_response('{"documentos": [{"document_id": "a"}]}') == [{"document_id": "a"}]
+    with pytest.raises(ValueError):
+        parse_batch_response('{"resumo": "x"}')
@@ -0,0 +1,177 @@
+import pytest
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import document_pipeline
+from document_pipeline import DocumentWorkerPool
+from job_queue import JobQueue, InMemoryJobQueue, PostgresJobQueue
+from models import Base, Document, DocumentStats, ProcessingJob
+
+
+@pytest.mark.asyncio
+async def test_in_memory_queue_entrega_job_uma_unica_vez():
+    """Testa que um job reservado não é entregue a outro worker"""
+    queue = InMemoryJobQueue()
+    job_id = await queue.enqueue("doc-1")
+
+    job = await queue.claim("worker-a")
+    assert job["id"] == job_id
+    assert job["attempts"] == 1
+    assert await queue.claim("worker-b") is None
+
+    await queue.complete(job_id)
+    assert queue.jobs[job_id]["status"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_in_memory_queue_reagenda_ate_esgotar_tentativas():
+    """Testa reagendamento de jobs com falha até o limite de tentativas"""
+    queue = InMemoryJobQueue()
+    job_id = await queue.enqueue("doc-1")
+    queue.jobs[job_id]["max_attempts"] = 2
+
+    await queue.claim("worker")
+    assert await queue.fail(job_id, "erro") is True
+    await queue.claim("worker")
+    assert await queue.fail(job_id, "erro") is False
+    assert queue.jobs[job_id]["status"] == "failed"
+
+
+def test_fila_incompleta_falha_na_criacao():
+    """Testa que uma fila sem todos os métodos da interface não pode ser instanciada"""
+    class IncompleteQueue(JobQueue):
+        async def enqueue(self, document_id, *args, **kwargs):
+            return 1
+
+    with pytest.raises(TypeError, match="claim"):
+        IncompleteQueue()
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_executa_handler(monkeypatch):
+    """Testa que o pool executa o handler do job e conclui o job"""
+    processed = []
+
+    async def fake_handler(document_id):
+        processed.append(document_id)
+
+    monkeypatch.setitem(document_pipeline.JOB_HANDLERS, "process_document", fake_handler)
+
+    queue = InMemoryJobQueue()
+    pool = DocumentWorkerPool(queue, concurrency=1)
+    job_id = await queue.enqueue("doc-1")
+
+    assert await pool.run_once() is True
+    assert await pool.run_once() is False
+    assert processed == ["doc-1"]
+    assert queue.jobs[job_id]["status"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_job_estacionado_com_circuito_aberto_nao_consome_tentativa(monkeypatch):
+    """Testa que CircuitOpenError estaciona o job até release_parked"""
+    from circuit_breaker import CircuitOpenError
+
+    queued = []
+
+    async def unavailable_handler(document_id):
+        raise CircuitOpenError("wu3", 30)
+
+    async def fake_mark_queued(document_id, retry_after):
+        queued.append(document_id)
+
+    monkeypatch.setitem(document_pipeline.JOB_HANDLERS, "process_document", unavailable_handler)
+    monkeypatch.setattr(document_pipeline, "mark_document_queued", fake_mark_queued)
+
+    queue = InMemoryJobQueue()
+    pool = DocumentWorkerPool(queue, concurrency=1)
+    job_id = await queue.enqueue("doc-1")
+
+    assert await pool.run_once() is True
+    assert queue.jobs[job_id]["status"] == "parked"
+    assert queue.jobs[job_id]["attempts"] == 0
+    assert queued == ["doc-1"]
+    assert await pool.run_once() is False
+
+    assert await queue.release_parked() == 1
+    job = await queue.claim("worker")
+    assert job["id"] == job_id
+
+
+@pytest.mark.asyncio
+async def test_job_de_teste_sem_chamada_a_wu3_libera_o_proximo(monkeypatch):
+    """Testa que o circuito em half_open não fica parado quando o job de teste não chama a Wu3"""
+    from circuit_breaker import CircuitBreaker, HALF_OPEN
+    from wu3_client import wu3_client
+
+    breaker = CircuitBreaker("wu3", min_calls=1, open_seconds=0)
+    breaker.record_failure()
+    assert breaker.state == HALF_OPEN
+    monkeypatch.setattr(wu3_client, "circuit_breaker", breaker)
+
+    async def reused_handler(document_id):
+        pass  # resultado reaproveitado: nenhuma chamada à Wu3
+
+    monkeypatch.setitem(document_pipeline.JOB_HANDLERS, "process_document", reused_handler)
+
+    queue = InMemoryJobQueue()
+    pool = DocumentWorkerPool(queue, concurrency=1)
+    probe_id = await queue.enqueue("doc-1", parked=True)
+    next_id = await queue.enqueue("doc-2", parked=True)
+    assert await queue.release_parked(1) == 1
+
+    assert await pool.run_once() is True
+    assert queue.jobs[probe_id]["status"] == "done"
+    assert queue.jobs[next_id]["status"] == "pending"
+
+
+@pytest.mark.asyncio
+async def test_claim_divide_vagas_entre_usuarios():
+    """Testa que um usuário com backlog grande não monopoliza os workers"""
+    queue = InMemoryJobQueue()
+    for index in range(5):
+        await queue.enqueue(f"doc-a{index}", job_type="generate_insights", user_id=1)
+    await queue.enqueue("doc-b0", job_type="generate_insights", user_id=2)
+    await queue.enqueue("doc-upload", job_type="process_document", user_id=2)
+
+    first = await queue.claim("w1", ["generate_insights"], max_per_user=2)
+    second = await queue.claim("w2", ["generate_insights"], max_per_user=2)
+    third = await queue.claim("w3", ["generate_insights"], max_per_user=2)
+    fourth = await queue.claim("w4", ["generate_insights"], max_per_user=2)
+
+    assert [job["user_id"] for job in (first, second, third)] == [1, 2, 1]
+    # Usuário 1 atingiu o limite e o usuário 2 não tem mais jobs de insights
+    assert fourth is None
+
+
+@pytest.mark.asyncio
+async def test_job_enfileirado_na_transacao_do_chamador():
+    """Testa que com db o job só existe se a transação do documento for confirmada"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[
+            Document.__table__, DocumentStats.__table__, ProcessingJob.__table__
+        ])
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    queue = PostgresJobQueue(session_factory)
+
+    def document(document_id):
+        return Document(id=document_id, user_id=1, document_type="invoice", original_filename="a.pdf", file_path="/a.pdf")
+
+    try:
+        async with session_factory() as db:
+            db.add(document("doc-desfeito"))
+            await queue.enqueue("doc-desfeito", user_id=1, db=db)
+            await db.rollback()
+
+            db.add(document("doc-1"))
+            job_id = await queue.enqueue("doc-1", user_id=1, db=db)
+            assert not queue._new_job_event.is_set()  # workers só acordam no commit
+            await db.commit()
+            assert queue._new_job_event.is_set()
+
+        async with session_factory() as db:
+            assert (await db.execute(select(ProcessingJob.id, ProcessingJob.document_id))).all() == [(job_id, "doc-1")]
+            assert await db.scalar(select(func.count()).select_from(Document)) == 1
+    finally:
+        await engine.dispose()
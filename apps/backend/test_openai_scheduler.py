@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from openai_scheduler import OpenAIScheduler, LANE_INTERACTIVE, LANE_POST_UPLOAD, LANE_BATCH
+
+
+@pytest.mark.asyncio
+async def test_fila_interativa_passa_na_frente_do_lote():
+    """Testa que, sem orçamento livre, a chamada interativa é liberada antes das de lote"""
+    scheduler = OpenAIScheduler(rpm=600, tpm=100000, aging_seconds=60)
+    scheduler.requests.drain()
+    order = []
+
+    async def call(lane, name):
+        await scheduler.acquire(lane, 100)
+        order.append(name)
+
+    tasks = [asyncio.create_task(call(LANE_BATCH, f"lote-{i}")) for i in range(2)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(call(LANE_POST_UPLOAD, "upload")))
+    tasks.append(asyncio.create_task(call(LANE_INTERACTIVE, "interativo")))
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=2)
+
+    assert order == ["interativo", "upload", "lote-0", "lote-1"]
+    assert scheduler.get_stats()["granted"] == {"interactive": 1, "post_upload": 1, "batch": 2}
+
+
+@pytest.mark.asyncio
+async def test_envelhecimento_promove_chamada_antiga():
+    """Testa que uma chamada de lote que esperou além do aging passa à frente"""
+    scheduler = OpenAIScheduler(rpm=600, tpm=100000, aging_seconds=0.05)
+    scheduler.requests.drain()
+    order = []
+
+    async def call(lane, name):
+        await scheduler.acquire(lane, 100)
+        order.append(name)
+
+    batch = asyncio.create_task(call(LANE_BATCH, "lote"))
+    await asyncio.sleep(0.15)
+    interactive = asyncio.create_task(call(LANE_INTERACTIVE, "interativo"))
+    await asyncio.wait_for(asyncio.gather(batch, interactive), timeout=2)
+
+    assert order == ["lote", "interativo"]
+
+
+@pytest.mark.asyncio
+async def test_reconciliacao_pelo_uso_real():
+    """Testa devolução e cobrança de tokens conforme o `usage` da resposta"""
+    scheduler = OpenAIScheduler(rpm=60, tpm=1000)
+
+    ticket = await scheduler.acquire(LANE_INTERACTIVE, 600)
+    assert scheduler.tokens.tokens == pytest.approx(400, abs=1)
+
+    scheduler.reconcile(ticket, 200)
+    assert scheduler.tokens.tokens == pytest.approx(800, abs=1)
+
+    ticket = await scheduler.acquire(LANE_BATCH, 500)
+    scheduler.reconcile(ticket, 900)
+    assert scheduler.tokens.tokens < 0
+    assert scheduler.get_stats()["used_tokens"] == 1100
@@ -0,0 +1,58 @@
+import json
+
+from prompt_compaction import compact_extracted_data, estimate_tokens, parse_money, summarize_list
+
+
+def _extrato(quantidade):
+    movimentacoes = [
+        {"data": f"2024-01-{(i % 28) + 1:02d}", "descricao": f"Lançamento {i}", "valor": f"R$ {i},00" if i % 2 else f"-R$ {i},50"}
+        for i in range(1, quantidade + 1)
+    ]
+    return {
+        "banco": "Banco do Brasil",
+        "agencia": "1234-5",
+        "conta": "67890-1",
+        "saldo_final": "R$ 15.750,00",
+        "movimentacoes": movimentacoes,
+        "metadata": {"document_id": "abc", "processed_at": "2024-01-01T00:00:00", "model_used": "wu3"}
+    }
+
+
+def test_valores_monetarios_e_estimativa_de_tokens():
+    """Testa conversão de valores em reais e a estimativa local de tokens"""
+    assert parse_money("R$ 1.234,56") == 1234.56
+    assert parse_money("-R$ 12.500,00") == -12500.0
+    assert parse_money(42) == 42.0
+    assert parse_money("Pagamento") is None
+
+    assert estimate_tokens("") == 0
+    assert estimate_tokens('{"a":1}') < estimate_tokens('{\n  "a": 1,\n  "descricao": "texto longo"\n}')
+
+
+def test_lista_longa_mantem_totais_e_extremos():
+    """Testa que o resumo preserva contagem, soma e maiores entrada/saída"""
+    items = _extrato(100)["movimentacoes"]
+    summary = summarize_list(items, max_items=10)
+
+    assert summary["total_itens"] == 100
+    assert summary["entradas"]["quantidade"] == 50
+    assert summary["saidas"]["quantidade"] == 50
+    assert summary["maior_entrada"]["valor"] == "R$ 99,00"
+    assert summary["maior_saida"]["valor"] == "-R$ 100,50"
+    assert summary["amostra"][0] == items[0] and summary["amostra"][-1] == items[-1]
+
+
+def test_compactacao_remove_metadados_e_respeita_orcamento():
+    """Testa remoção de campos irrelevantes e ajuste ao orçamento de tokens"""
+    data = _extrato(500)
+    result = compact_extracted_data(data, "financial", token_budget=600)
+
+    assert "metadata" not in result["data"]
+    assert "agencia" not in result["data"] and "conta" not in result["data"]
+    assert result["data"]["saldo_final"] == "R$ 15.750,00"
+    assert result["data"]["movimentacoes"]["total_itens"] == 500
+    assert result["tokens"] <= 600 < result["original_tokens"]
+    assert json.loads(result["text"]) == result["data"]
+    # Dados pequenos não são resumidos
+    small = compact_extracted_data(_extrato(3), "financial")
+    assert len(small["data"]["movimentacoes"]) == 3
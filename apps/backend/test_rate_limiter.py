@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+import pytest
+
+from rate_limiter import AdaptiveRateLimiter, parse_rate_limit_headers
+
+
+@pytest.mark.asyncio
+async def test_429_reduz_taxa_e_pausa_pelo_retry_after():
+    """Testa redução multiplicativa e pausa global após 429"""
+    limiter = AdaptiveRateLimiter("teste", initial_rate=10, min_rate=1, max_rate=20, burst=5)
+
+    await limiter.record_response(429, {"Retry-After": "0.3"})
+    # 429 simultâneos da mesma rajada não reduzem a taxa de novo
+    await limiter.record_response(429, {"Retry-After": "0.3"})
+
+    stats = await limiter.get_stats()
+    assert stats["rate_per_second"] == 5
+    assert stats["throttled"] == 2
+
+    start = time.monotonic()
+    await limiter.acquire()
+    assert time.monotonic() - start >= 0.25
+
+
+@pytest.mark.asyncio
+async def test_sucesso_aumenta_taxa_aditivamente():
+    """Testa aumento aditivo limitado a max_rate"""
+    limiter = AdaptiveRateLimiter("teste", initial_rate=1, min_rate=1, max_rate=1.2, increase_step=0.1)
+
+    for _ in range(5):
+        await limiter.record_response(200, {})
+
+    assert (await limiter.get_stats())["rate_per_second"] == 1.2
+
+
+@pytest.mark.asyncio
+async def test_chamadores_atendidos_em_ordem_fifo():
+    """Testa que chamadores aguardando são atendidos na ordem de chegada"""
+    limiter = AdaptiveRateLimiter("teste", initial_rate=50, min_rate=1, max_rate=50, burst=1)
+    order = []
+
+    async def caller(index):
+        await limiter.acquire()
+        order.append(index)
+
+    tasks = []
+    for index in range(5):
+        tasks.append(asyncio.create_task(caller(index)))
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_parse_headers_de_cota():
+    """Testa leitura de Retry-After e headers de cota"""
+    limits = parse_rate_limit_headers({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "12"})
+    assert limits == {"retry_after": None, "remaining": 0.0, "reset_after": 12.0}
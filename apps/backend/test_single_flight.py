@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight, advisory_lock_id, flight_key
+
+
+@pytest.mark.asyncio
+async def test_chamadas_concorrentes_compartilham_o_resultado():
+    """Testa que a operação executa uma vez e todos recebem o mesmo resultado"""
+    flights = SingleFlight(backend="local")
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"resumo": "ok"}
+
+    key = flight_key("doc-1", "generate_insights")
+    results = await asyncio.gather(*(flights.do(key, generate) for _ in range(5)))
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flights.get_stats() == {"backend": "local", "in_flight": 0, "executed": 1, "shared": 4}
+
+    # Terminada a execução, uma nova chamada executa de novo
+    await flights.do(key, generate)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_excecao_propaga_e_cancelamento_nao_interrompe():
+    """Testa propagação de erro aos chamadores e execução que sobrevive ao cancelamento"""
+    flights = SingleFlight(backend="local")
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("Wu3 indisponível")
+
+    results = await asyncio.gather(
+        flights.do("process_document:doc-2", failing),
+        flights.do("process_document:doc-2", failing),
+        return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    finished = asyncio.Event()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        finished.set()
+        return "ok"
+
+    first = asyncio.create_task(flights.do("process_document:doc-3", slow))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await flights.do("process_document:doc-3", slow) == "ok"
+    assert finished.is_set()
+
+
+@pytest.mark.asyncio
+async def test_lock_de_reivindicacao_apenas_na_transacao_do_chamador():
+    """Testa que o backend postgres trava só a transação do chamador (e o local não trava)"""
+    class FakeSession:
+        def __init__(self):
+            self.statements = []
+
+        async def execute(self, statement, params=None):
+            self.statements.append((str(statement), params))
+
+    db = FakeSession()
+    await SingleFlight(backend="local").lock_claim(db, "process_document:doc-4")
+    assert db.statements == []
+
+    await SingleFlight(backend="postgres").lock_claim(db, "process_document:doc-4")
+    assert db.statements == [
+        ("SELECT pg_advisory_xact_lock(:lock_id)", {"lock_id": advisory_lock_id("process_document:doc-4")})
+    ]
+
+
+def test_chave_do_advisory_lock_cabe_em_bigint():
+    """Testa que a chave do advisory lock é estável e cabe em bigint com sinal"""
+    lock_id = advisory_lock_id("generate_insights:doc-1")
+
+    assert lock_id == advisory_lock_id("generate_insights:doc-1")
+    assert lock_id != advisory_lock_id("process_document:doc-1")
+    assert -2 ** 63 <= lock_id < 2 ** 63
@@ -0,0 +1,88 @@
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import storage_service
+from models import StoredFile
+from storage_service import save_upload_stream, content_path, store_content_addressed, release_stored_file
+
+
+@pytest.mark.asyncio
+async def test_save_upload_stream_calcula_tamanho_e_hash(tmp_path):
+    """Testa cópia em blocos com cálculo de tamanho e SHA-256"""
+    content = os.urandom(300_000)
+    upload = UploadFile(file=io.BytesIO(content), filename="contrato.pdf")
+    destination = str(tmp_path / "contrato.pdf")
+
+    result = await save_upload_stream(upload, destination, max_size_bytes=1_000_000, chunk_size=64 * 1024)
+
+    assert result["size_bytes"] == len(content)
+    assert result["sha256"] == hashlib.sha256(content).hexdigest()
+    with open(destination, "rb") as saved:
+        assert saved.read() == content
+
+
+@pytest.mark.asyncio
+async def test_save_upload_stream_rejeita_arquivo_grande(tmp_path):
+    """Testa que uploads acima do limite retornam 413 e não deixam arquivo parcial"""
+    upload = UploadFile(file=io.BytesIO(b"x" * 5000), filename="grande.pdf")
+    destination = str(tmp_path / "grande.pdf")
+
+    with pytest.raises(HTTPException) as exc_info:
+        await save_upload_stream(upload, destination, max_size_bytes=4096, chunk_size=1024)
+
+    assert exc_info.value.status_code == 413
+    assert not os.path.exists(destination)
+
+
+def test_content_path_agrupa_por_prefixo_do_hash():
+    """Testa que o caminho do conteúdo depende apenas do hash e da extensão"""
+    content_hash = hashlib.sha256(b"nota fiscal").hexdigest()
+
+    path = content_path(content_hash, ".PDF")
+
+    assert path.endswith(os.path.join(content_hash[:2], content_hash[2:4], f"{content_hash}.pdf"))
+    assert content_path(content_hash, ".pdf") == path
+
+
+@pytest.mark.asyncio
+async def test_arquivo_removido_apenas_na_ultima_referencia(tmp_path, monkeypatch):
+    """Testa a contagem de referências e que o arquivo volta ao lugar se o commit falhar"""
+    monkeypatch.setattr(storage_service, "CONTENT_DIR", str(tmp_path / "objects"))
+    engine = create_async_engine("sqlite+aiosqlite://")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(StoredFile.__table__.create)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        content_hash = hashlib.sha256(b"extrato").hexdigest()
+
+        async with session_factory() as db:
+            for name in ("a.tmp", "b.tmp"):
+                (tmp_path / name).write_bytes(b"extrato")
+                file_path = await store_content_addressed(db, str(tmp_path / name), content_hash, 7, ".pdf")
+            await db.commit()
+
+        async with session_factory() as db:
+            assert await release_stored_file(db, content_hash) is False
+        assert os.path.exists(file_path)
+
+        async with session_factory() as db:
+            async def failing_commit():
+                raise RuntimeError("commit falhou")
+
+            monkeypatch.setattr(db, "commit", failing_commit)
+            with pytest.raises(RuntimeError):
+                await release_stored_file(db, content_hash)
+            await db.rollback()
+        assert os.path.exists(file_path)
+
+        async with session_factory() as db:
+            assert await release_stored_file(db, content_hash) is True
+            assert await db.get(StoredFile, content_hash) is None
+        assert os.listdir(os.path.dirname(file_path)) == []
+    finally:
+        await engine.dispose()
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from http_pool import http_pool
+from circuit_breaker import CLOSED
+from wu3_client import Wu3Client, Wu3RateLimitedError
+
+
+@pytest_asyncio.fixture
+async def wu3_server():
+    """Servidor local que simula a API Wu3 (primeira chamada 429, depois 200)"""
+    received = []
+
+    async def handler(request):
+        form = await request.post()
+        upload = form["file"]
+        received.append(upload.file.read())
+        if len(received) == 1:
+            return web.json_response({"error": "rate limit"}, status=429)
+        return web.json_response({
+            "status": "complete",
+            "document_id": "wu3-123",
+            "extracted_data": {"campo": "valor"},
+            "confidence_score": 0.93,
+            "model_version": "wu3-test"
+        })
+
+    app = web.Application(client_max_size=10 * 1024 * 1024)
+    app.router.add_post("/process", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    yield f"http://127.0.0.1:{port}/process", received
+
+    await http_pool.close()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_upload_em_streaming_recriado_a_cada_tentativa(wu3_server, tmp_path, monkeypatch):
+    """Testa que o arquivo completo é reenviado do disco em cada tentativa"""
+    url, received = wu3_server
+    content = os.urandom(512 * 1024)
+    file_path = tmp_path / "extrato.pdf"
+    file_path.write_bytes(content)
+
+    monkeypatch.setenv("WU3_API_KEY", "token-teste")
+    monkeypatch.setenv("WU3_API_URL", url)
+    monkeypatch.setenv("WU3_RETRY_DELAY", "0")
+    client = Wu3Client()
+
+    result, request_time = await client._process_document_real(str(file_path), "financial", "doc-1")
+
+    assert result["wu3_document_id"] == "wu3-123"
+    assert request_time >= 0
+    assert received == [content, content]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_esgotado_nao_conta_como_falha_no_circuito(monkeypatch):
+    """Testa que 429 em todas as tentativas não abre o circuit breaker"""
+    monkeypatch.setenv("WU3_API_KEY", "token-teste")
+    monkeypatch.setenv("WU3_BREAKER_MIN_CALLS", "1")
+    client = Wu3Client()
+
+    async def rate_limited(*args):
+        raise Wu3RateLimitedError("Rate limit excedido após múltiplas tentativas")
+
+    monkeypatch.setattr(client, "_process_document_real", rate_limited)
+
+    result = await client.process_document("/tmp/inexistente.pdf", "financial", "doc-1")
+
+    assert result["status"] == "failed"
+    assert client.circuit_breaker.state == CLOSED
@@ -0,0 +1,64 @@
+import contextlib
+
+import pytest
+
+import webhook_service
+from wu3_client import wu3_client
+from wu3_reconciler import Wu3StatusReconciler, normalize_status_response, poll_delay
+
+
+def test_normaliza_resposta_de_status_no_formato_do_webhook():
+    """Testa conversão da resposta de status para o payload do webhook"""
+    payload = normalize_status_response("doc-1", {
+        "status": "completed",
+        "extracted_data": {"valor": "10"},
+        "confidence_score": 0.9,
+        "model_version": "wu3-2"
+    })
+
+    assert payload == {
+        "document_id": "doc-1",
+        "status": "complete",
+        "extracted_data": {"valor": "10"},
+        "confidence_score": 0.9,
+        "wu3_version": "wu3-2"
+    }
+    # Falha da consulta não é falha do documento
+    assert normalize_status_response("doc-1", {"status": "error", "message": "HTTP 503"}) is None
+
+
+def test_backoff_exponencial_limitado_com_jitter():
+    """Testa que o atraso cresce exponencialmente até o limite, com jitter"""
+    assert 5 <= poll_delay(0, base=10, cap=100) <= 15
+    assert 10 <= poll_delay(1, base=10, cap=100) <= 30
+    assert 50 <= poll_delay(10, base=10, cap=100) <= 150
+
+
+@pytest.mark.asyncio
+async def test_documento_sem_resultado_falha_apos_esgotar_consultas(monkeypatch):
+    """Testa que consultas esgotadas aplicam falha pelo caminho do webhook"""
+    applied = []
+
+    async def fake_status(wu3_document_id):
+        return {"status": "processing"}
+
+    async def fake_apply(self, payload, from_webhook=True):
+        applied.append((payload, from_webhook))
+
+    @contextlib.asynccontextmanager
+    async def fake_session():
+        yield None
+
+    monkeypatch.setattr(wu3_client, "get_document_status", fake_status)
+    monkeypatch.setattr(webhook_service.WebhookProcessor, "apply_status_update", fake_apply)
+
+    reconciler = Wu3StatusReconciler(session_factory=fake_session, max_attempts=3)
+
+    await reconciler._reconcile_document({"id": "doc-1", "wu3_document_id": "wu3-1", "attempts": 2})
+    assert applied == []
+    assert reconciler.stats["still_processing"] == 1
+
+    await reconciler._reconcile_document({"id": "doc-1", "wu3_document_id": "wu3-1", "attempts": 3})
+    assert applied[0][0]["status"] == "failed"
+    assert applied[0][1] is False
+    assert reconciler.stats["timed_out"] == 1
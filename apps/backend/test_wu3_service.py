@@ -0,0 +1,52 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from wu3_service import (
+    Wu3FallbackEngine, ReplayLatency, LognormalLatency, SimulatedWu3Failure, build_latency_model
+)
+
+
+@pytest.mark.asyncio
+async def test_fallback_engine_nao_bloqueia_event_loop():
+    """Testa que simulações concorrentes se sobrepõem em vez de serializar"""
+    engine = Wu3FallbackEngine({"default": {"latency": {"model": "fixed", "seconds": 0.2}}})
+
+    start = time.monotonic()
+    results = await asyncio.gather(*[
+        engine.process("/tmp/doc.pdf", "invoice", f"doc-{index}") for index in range(10)
+    ])
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 1.0
+    assert all(result["status"] == "complete" for result in results)
+    assert results[0]["processing_time_seconds"] == 0.2
+
+
+@pytest.mark.asyncio
+async def test_fallback_engine_perfil_por_tipo_com_falhas():
+    """Testa perfis por tipo de documento e taxa de falha"""
+    engine = Wu3FallbackEngine({
+        "default": {"latency": {"model": "fixed", "seconds": 0}},
+        "contract": {"failure_rate": 1.0}
+    }, seed=42)
+
+    result = await engine.process("/tmp/doc.pdf", "invoice", "doc-1")
+    assert result["wu3_version"] == "fallback-mock-2.1.0"
+
+    with pytest.raises(SimulatedWu3Failure):
+        await engine.process("/tmp/doc.pdf", "contract", "doc-2")
+
+
+def test_modelos_de_latencia():
+    """Testa amostragem dos modelos lognormal e replay"""
+    rng = random.Random(7)
+
+    lognormal = LognormalLatency(median=1.0, sigma=0.5, max_seconds=3.0)
+    assert all(0 < lognormal.sample(rng) <= 3.0 for _ in range(100))
+
+    replay = build_latency_model({"model": "replay", "samples": [1.5, 2.5]})
+    assert isinstance(replay, ReplayLatency)
+    assert {replay.sample(rng) for _ in range(50)} == {1.5, 2.5}
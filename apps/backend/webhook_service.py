@@ -9,6 +9,11 @@ import logging
 from datetime import datetime
 from typing import Dict, Any, Optional
 from fastapi import HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from single_flight import single_flight, flight_key
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -111,7 +116,7 @@ class WebhookValidator:
 class WebhookProcessor:
     """Processador de webhooks da Wu3"""
     
-    def __init__(self, db_session):
+    def __init__(self, db_session: AsyncSession):
         self.db = db_session
         self.validator = WebhookValidator()
     
@@ -151,54 +156,90 @@ class WebhookProcessor:
             raise HTTPException(status_code=400, detail="Payload inválido")
         
         # Processar webhook
-        return await self._update_document(payload)
+        return await self.apply_status_update(payload)
     
-    async def _update_document(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+    async def apply_status_update(self, payload: Dict[str, Any], from_webhook: bool = True) -> Dict[str, Any]:
         """
-        Atualiza documento no banco de dados
+        Atualiza documento no banco de dados com o status informado pela Wu3
+        
+        Caminho único de atualização, usado pelo webhook e pelo reconciliador
+        de status (consulta ativa quando o webhook não chega).
         
         Args:
-            payload: Dados do webhook
+            payload: Dados do webhook (ou resposta de status normalizada no mesmo formato)
+            from_webhook: False quando o status veio de consulta ativa à Wu3
         
         Returns:
             Resultado da atualização
         """
+        # Entregas duplicadas simultâneas (mesmo payload) compartilham uma única atualização
+        digest = hashlib.sha256(
+            json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()[:16]
+        key = flight_key(payload['document_id'], f"wu3_status:{digest}")
+        return await single_flight.do(key, lambda: self._apply_status_update(payload, from_webhook))
+    
+    async def _apply_status_update(self, payload: Dict[str, Any], from_webhook: bool) -> Dict[str, Any]:
         from models import Document
-        from sqlalchemy import func
         
         document_id = payload['document_id']
         status = payload['status']
         
         logger.info(f"Processando webhook para documento {document_id} com status {status}")
         
+        # Verificação de duplicidade e atualização serializadas entre processos (até o commit)
+        await single_flight.lock_claim(self.db, flight_key(document_id, "wu3_status"))
+        
         # Buscar documento
-        document = self.db.query(Document).filter(Document.id == document_id).first()
+        document = await self.db.scalar(
+            select(Document).options(joinedload(Document.payload)).where(Document.id == document_id)
+        )
         
         if not document:
             logger.warning(f"Documento não encontrado: {document_id}")
             raise HTTPException(status_code=404, detail="Documento não encontrado")
         
+        # Reentrega de um resultado final já aplicado: nada a fazer
+        if self._is_duplicate(document, payload):
+            logger.info(f"Status {status} do documento {document_id} já aplicado, ignorando entrega duplicada")
+            return {
+                'success': True,
+                'document_id': document_id,
+                'status': status,
+                'duplicate': True,
+                'message': f'Documento {document_id} já estava com status {status}'
+            }
+        
         # Atualizar campos baseado no status
         update_data = {
             'status': status,
-            'updated_at': datetime.utcnow(),
-            'webhook_received': True,
-            'webhook_received_at': datetime.utcnow()
+            'updated_at': datetime.utcnow()
         }
         
+        if from_webhook:
+            update_data['webhook_received'] = True
+            update_data['webhook_received_at'] = datetime.utcnow()
+        
+        if status != 'processing':
+            # Estado final: reconciliador não precisa mais consultar a Wu3
+            update_data['wu3_next_poll_at'] = None
+        
         if status == 'complete':
             # Documento processado com sucesso
             if 'extracted_data' in payload:
-                update_data['extracted_data'] = json.dumps(payload['extracted_data'])
+                update_data['extracted_data'] = payload['extracted_data']
+                
+                if document.extracted_data and document.extracted_data != update_data['extracted_data']:
+                    await self._invalidate_insights_cache(document)
             
             if 'confidence_score' in payload:
-                update_data['confidence_score'] = str(payload['confidence_score'])
+                update_data['confidence_score'] = float(payload['confidence_score'])
             
             if 'wu3_document_id' in payload:
                 update_data['wu3_document_id'] = payload['wu3_document_id']
             
             if 'processing_time' in payload:
-                update_data['processing_time_seconds'] = str(payload['processing_time'])
+                update_data['processing_time_seconds'] = float(payload['processing_time'])
             
             if 'wu3_version' in payload:
                 update_data['wu3_version'] = payload['wu3_version']
@@ -208,9 +249,10 @@ class WebhookProcessor:
             if 'error_message' in payload:
                 update_data['error_message'] = payload['error_message']
         
-        # Atualizar documento
-        self.db.query(Document).filter(Document.id == document_id).update(update_data)
-        self.db.commit()
+        # Atualizar documento (pelo ORM: as estatísticas acompanham a transição no mesmo flush)
+        for field, value in update_data.items():
+            setattr(document, field, value)
+        await self.db.commit()
         
         logger.info(f"Documento {document_id} atualizado com sucesso")
         
@@ -235,6 +277,29 @@ class WebhookProcessor:
             'message': f'Documento {document_id} atualizado com status {status}'
         }
     
+    @staticmethod
+    def _is_duplicate(document, payload: Dict[str, Any]) -> bool:
+        """Status final igual ao atual (e mesmos dados extraídos, se completo)"""
+        status = payload['status']
+        if status not in ('complete', 'failed') or document.status != status:
+            return False
+        
+        if status == 'complete' and 'extracted_data' in payload:
+            return document.extracted_data == payload['extracted_data']
+        
+        return True
+    
+    async def _invalidate_insights_cache(self, document):
+        """Dados extraídos mudaram: descarta os insights em cache dos dados anteriores"""
+        try:
+            from gpt_client import gpt_client
+            from insights_cache import insights_cache
+            
+            await insights_cache.invalidate(gpt_client.cache_key(document.extracted_data, document.document_type))
+            logger.info(f"Cache de insights invalidado para documento {document.id}")
+        except Exception as e:
+            logger.error(f"Erro ao invalidar cache de insights: {str(e)}")
+    
     async def _send_websocket_notification(self, notification_data: Dict[str, Any]):
         """
         Envia notificação via WebSocket
@@ -122,6 +122,7 @@ class ConnectionManager:
                 'status': document_data.get('status'),
                 'confidence_score': document_data.get('confidence_score'),
                 'processing_time': document_data.get('processing_time'),
+                'reused': document_data.get('reused', False),
                 'timestamp': document_data.get('timestamp', datetime.utcnow().isoformat())
             },
             'message': self._get_notification_message(document_data),
@@ -6,11 +6,14 @@ import json
 import time
 import asyncio
 import aiohttp
-import aiofiles
 from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 import logging
 
+from http_pool import http_pool
+from rate_limiter import AdaptiveRateLimiter
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,6 +22,14 @@ class Wu3ClientError(Exception):
     """Exceção personalizada para erros do cliente Wu3"""
     pass
 
+class Wu3DocumentRejectedError(Wu3ClientError):
+    """Erro causado pelo próprio documento (não indica indisponibilidade da Wu3)"""
+    pass
+
+class Wu3RateLimitedError(Wu3ClientError):
+    """Tentativas esgotadas por rate limit (a Wu3 respondeu; não indica indisponibilidade)"""
+    pass
+
 class Wu3Client:
     """Cliente para comunicação com a API da IA Wu3"""
     
@@ -28,6 +39,40 @@ class Wu3Client:
         self.timeout = int(os.getenv("WU3_TIMEOUT_SECONDS", "30"))
         self.max_retries = int(os.getenv("WU3_MAX_RETRIES", "3"))
         self.retry_delay = int(os.getenv("WU3_RETRY_DELAY", "2"))
+        # Versão do modelo Wu3 (se não configurada, usa a última informada pela API)
+        self.model_version = os.getenv("WU3_MODEL_VERSION")
+        self._last_seen_version: Optional[str] = None
+        
+        # Sessão HTTP compartilhada (keep-alive, limite por host, cache de DNS)
+        http_pool.register(
+            "wu3",
+            limit=int(os.getenv("WU3_HTTP_POOL_LIMIT", "50")),
+            limit_per_host=int(os.getenv("WU3_HTTP_POOL_LIMIT_PER_HOST", "20")),
+            timeout_seconds=self.timeout
+        )
+        
+        # Limitador de taxa compartilhado por todas as chamadas à Wu3
+        self.rate_limiter = AdaptiveRateLimiter(
+            "wu3",
+            initial_rate=float(os.getenv("WU3_RATE_LIMIT_RPS", "5")),
+            min_rate=float(os.getenv("WU3_RATE_LIMIT_MIN_RPS", "0.2")),
+            max_rate=float(os.getenv("WU3_RATE_LIMIT_MAX_RPS", "20")),
+            burst=float(os.getenv("WU3_RATE_LIMIT_BURST", "5")),
+            default_retry_after=self.retry_delay,
+            backend=os.getenv("WU3_RATE_LIMIT_BACKEND", "local")
+        )
+        
+        # Circuit breaker: com a Wu3 fora do ar, falha rápido em vez de esgotar timeouts
+        self.circuit_breaker = CircuitBreaker(
+            "wu3",
+            failure_rate_threshold=float(os.getenv("WU3_BREAKER_FAILURE_RATE", "0.5")),
+            slow_call_seconds=float(os.getenv("WU3_BREAKER_SLOW_CALL_SECONDS", str(self.timeout * 0.8))),
+            slow_call_rate_threshold=float(os.getenv("WU3_BREAKER_SLOW_CALL_RATE", "0.8")),
+            min_calls=int(os.getenv("WU3_BREAKER_MIN_CALLS", "5")),
+            window_size=int(os.getenv("WU3_BREAKER_WINDOW", "20")),
+            open_seconds=float(os.getenv("WU3_BREAKER_OPEN_SECONDS", "30")),
+            half_open_max_calls=int(os.getenv("WU3_BREAKER_HALF_OPEN_CALLS", "1"))
+        )
         
         if not self.api_key:
             logger.warning("WU3_API_KEY não configurada. Usando modo de fallback.")
@@ -45,25 +90,39 @@ class Wu3Client:
             Dict com dados extraídos e metadados
         
         Raises:
-            Wu3ClientError: Em caso de erro na API
+            CircuitOpenError: Se o circuit breaker da Wu3 estiver aberto (documento deve aguardar)
         """
         start_time = time.time()
         
         try:
             # Se não há API key, usar fallback mockado
-            if not self.api_key or self.api_key == "seu_token_real_wu3_aqui":
+            if not self.is_fallback_mode:
+                # Falha rápida com circuito aberto (propaga CircuitOpenError)
+                self.circuit_breaker.before_call()
+            else:
                 logger.info(f"Usando processamento mockado para documento {document_id}")
                 return await self._process_document_fallback(file_path, document_type, document_id)
             
             # Processar com API real
             logger.info(f"Processando documento {document_id} via API Wu3")
-            result = await self._process_document_real(file_path, document_type, document_id)
+            try:
+                result, request_time = await self._process_document_real(file_path, document_type, document_id)
+            except (Wu3DocumentRejectedError, Wu3RateLimitedError):
+                self.circuit_breaker.release()
+                raise
+            except Exception:
+                self.circuit_breaker.record_failure()
+                raise
             
-            processing_time = time.time() - start_time
-            result["processing_time_seconds"] = round(processing_time, 2)
+            # Chamada lenta = tempo da requisição HTTP, sem a espera no limitador de taxa
+            self.circuit_breaker.record_success(request_time)
+            result["processing_time_seconds"] = round(time.time() - start_time, 2)
             
             return result
             
+        except CircuitOpenError:
+            raise
+        
         except Exception as e:
             processing_time = time.time() - start_time
             logger.error(f"Erro ao processar documento {document_id}: {str(e)}")
@@ -79,62 +138,57 @@ class Wu3Client:
                 "confidence_score": 0.0
             }
     
-    async def _process_document_real(self, file_path: str, document_type: str, document_id: str) -> Dict[str, Any]:
-        """Processa documento via API real da Wu3"""
+    async def _process_document_real(self, file_path: str, document_type: str, document_id: str) -> Tuple[Dict[str, Any], float]:
+        """
+        Processa documento via API real da Wu3
+        
+        Returns:
+            Resultado normalizado e duração (segundos) da tentativa HTTP bem-sucedida
+        """
         
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "User-Agent": "ORBIT-IA/1.0"
         }
         
-        # Preparar dados do formulário
-        data = aiohttp.FormData()
-        
-        # Adicionar arquivo
-        async with aiofiles.open(file_path, 'rb') as file:
-            file_content = await file.read()
-            data.add_field(
-                'file', 
-                file_content,
-                filename=os.path.basename(file_path),
-                content_type=self._get_content_type(file_path)
-            )
-        
-        # Adicionar metadados
-        data.add_field('document_type', document_type)
-        data.add_field('document_id', document_id)
-        data.add_field('client_id', 'orbit-ia')
-        
         # Fazer requisição com retry
         for attempt in range(self.max_retries):
+            # Aguardar a vez no limitador global (fila justa entre uploads concorrentes)
+            await self.rate_limiter.acquire()
+            attempt_start = time.time()
+            
+            # Multipart recriado a cada tentativa: o arquivo é enviado do disco em blocos
+            # (open fora do event loop, como as leituras feitas pelo aiohttp)
+            file_handle = await asyncio.to_thread(open, file_path, 'rb')
             try:
                 timeout = aiohttp.ClientTimeout(total=self.timeout)
+                session = http_pool.get_session("wu3")
+                data = self._build_form_data(file_handle, file_path, document_type, document_id)
                 
-                async with aiohttp.ClientSession(timeout=timeout) as session:
-                    async with session.post(self.base_url, headers=headers, data=data) as response:
-                        
-                        if response.status == 200:
-                            result = await response.json()
-                            return self._normalize_wu3_response(result, document_id)
-                        
-                        elif response.status == 429:  # Rate limit
-                            if attempt < self.max_retries - 1:
-                                wait_time = self.retry_delay * (2 ** attempt)  # Backoff exponencial
-                                logger.warning(f"Rate limit atingido. Aguardando {wait_time}s...")
-                                await asyncio.sleep(wait_time)
-                                continue
-                            else:
-                                raise Wu3ClientError("Rate limit excedido após múltiplas tentativas")
-                        
-                        elif response.status == 401:
-                            raise Wu3ClientError("Token de autenticação inválido")
-                        
-                        elif response.status == 413:
-                            raise Wu3ClientError("Arquivo muito grande para processamento")
-                        
+                async with session.post(self.base_url, headers=headers, data=data, timeout=timeout) as response:
+                    await self.rate_limiter.record_response(response.status, response.headers)
+                    
+                    if response.status == 200:
+                        result = await response.json()
+                        return self._normalize_wu3_response(result, document_id), time.time() - attempt_start
+                    
+                    elif response.status == 429:  # Rate limit
+                        if attempt < self.max_retries - 1:
+                            # O limitador já aplicou Retry-After/backoff; a próxima tentativa aguarda em acquire()
+                            logger.warning(f"Rate limit atingido para documento {document_id} (tentativa {attempt + 1})")
+                            continue
                         else:
-                            error_text = await response.text()
-                            raise Wu3ClientError(f"Erro HTTP {response.status}: {error_text}")
+                            raise Wu3RateLimitedError("Rate limit excedido após múltiplas tentativas")
+                    
+                    elif response.status == 401:
+                        raise Wu3ClientError("Token de autenticação inválido")
+                    
+                    elif response.status == 413:
+                        raise Wu3DocumentRejectedError("Arquivo muito grande para processamento")
+                    
+                    else:
+                        error_text = await response.text()
+                        raise Wu3ClientError(f"Erro HTTP {response.status}: {error_text}")
             
             except aiohttp.ClientError as e:
                 if attempt < self.max_retries - 1:
@@ -143,35 +197,47 @@ class Wu3Client:
                     continue
                 else:
                     raise Wu3ClientError(f"Erro de conexão após {self.max_retries} tentativas: {str(e)}")
+            
+            finally:
+                file_handle.close()
         
         raise Wu3ClientError("Número máximo de tentativas excedido")
     
-    async def _process_document_fallback(self, file_path: str, document_type: str, document_id: str) -> Dict[str, Any]:
-        """Processamento mockado como fallback"""
-        # Importar o serviço mockado existente
-        from wu3_service import process_document_with_wu3
+    def _build_form_data(self, file_handle, file_path: str, document_type: str, document_id: str) -> aiohttp.FormData:
+        """
+        Monta o multipart da requisição sem ler o arquivo para a memória
         
-        # Simular delay de rede
-        await asyncio.sleep(1.0)
+        O aiohttp envia objetos de arquivo em blocos de 64 KB lidos fora do event loop,
+        com Content-Length calculado a partir do tamanho do arquivo.
+        """
+        data = aiohttp.FormData()
         
-        # Usar processamento mockado
-        mock_result = process_document_with_wu3(document_id, file_path, document_type)
+        data.add_field(
+            'file',
+            file_handle,
+            filename=os.path.basename(file_path),
+            content_type=self._get_content_type(file_path)
+        )
         
-        # Normalizar resposta para formato Wu3
-        return {
-            "status": "complete",
-            "wu3_document_id": f"wu3_{document_id}",
-            "wu3_request_id": f"req_{int(time.time())}",
-            "extracted_data": mock_result["extracted_data"],
-            "confidence_score": mock_result["confidence_score"],
-            "wu3_version": "fallback-mock-2.1.0",
-            "processing_time_seconds": mock_result["extracted_data"]["metadata"]["processing_time_seconds"],
-            "error_message": None
-        }
+        # Adicionar metadados
+        data.add_field('document_type', document_type)
+        data.add_field('document_id', document_id)
+        data.add_field('client_id', 'orbit-ia')
+        
+        return data
+    
+    async def _process_document_fallback(self, file_path: str, document_type: str, document_id: str) -> Dict[str, Any]:
+        """Processamento simulado como fallback (não bloqueia o event loop)"""
+        from wu3_service import wu3_fallback_engine
+        
+        return await wu3_fallback_engine.process(file_path, document_type, document_id)
     
     def _normalize_wu3_response(self, wu3_response: Dict[str, Any], document_id: str) -> Dict[str, Any]:
         """Normaliza resposta da API Wu3 para formato interno"""
         
+        if wu3_response.get("model_version"):
+            self._last_seen_version = wu3_response["model_version"]
+        
         return {
             "status": wu3_response.get("status", "complete"),
             "wu3_document_id": wu3_response.get("document_id", f"wu3_{document_id}"),
@@ -217,21 +283,37 @@ class Wu3Client:
         }
         
         try:
+            await self.rate_limiter.acquire()
+            
             timeout = aiohttp.ClientTimeout(total=10)
+            session = http_pool.get_session("wu3")
             
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                url = f"{self.base_url}/status/{wu3_document_id}"
-                async with session.get(url, headers=headers) as response:
-                    
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        return {"status": "error", "message": f"HTTP {response.status}"}
+            url = f"{self.base_url}/status/{wu3_document_id}"
+            async with session.get(url, headers=headers, timeout=timeout) as response:
+                await self.rate_limiter.record_response(response.status, response.headers)
+                
+                if response.status == 200:
+                    return await response.json()
+                else:
+                    return {"status": "error", "message": f"HTTP {response.status}"}
         
         except Exception as e:
             logger.error(f"Erro ao consultar status do documento {wu3_document_id}: {str(e)}")
             return {"status": "error", "message": str(e)}
     
+    @property
+    def is_fallback_mode(self) -> bool:
+        """Indica se a API real não está configurada (processamento simulado)"""
+        return not self.api_key or self.api_key == "seu_token_real_wu3_aqui"
+    
+    @property
+    def current_version(self) -> Optional[str]:
+        """Versão do modelo que processaria um documento agora (None se ainda desconhecida)"""
+        if self.is_fallback_mode:
+            from wu3_service import WU3_FALLBACK_VERSION
+            return WU3_FALLBACK_VERSION
+        return self.model_version or self._last_seen_version
+    
     def validate_configuration(self) -> Tuple[bool, str]:
         """
         Valida se a configuração do cliente está correta
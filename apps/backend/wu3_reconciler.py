@@ -0,0 +1,240 @@
+"""
+Reconciliador de status de documentos assíncronos da Wu3
+Consulta periodicamente a Wu3 pelos documentos cujo webhook não chegou e aplica o
+resultado pelo mesmo caminho de atualização do webhook
+"""
+import os
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, List
+
+from sqlalchemy import select, update
+
+from database import AsyncSessionLocal
+from models import Document
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações
+WU3_POLL_ENABLED = os.getenv("WU3_POLL_ENABLED", "true").lower() == "true"
+WU3_POLL_INTERVAL_SECONDS = float(os.getenv("WU3_POLL_INTERVAL_SECONDS", "30"))
+WU3_POLL_INITIAL_DELAY_SECONDS = float(os.getenv("WU3_POLL_INITIAL_DELAY_SECONDS", "120"))
+WU3_POLL_MAX_DELAY_SECONDS = float(os.getenv("WU3_POLL_MAX_DELAY_SECONDS", "3600"))
+WU3_POLL_MAX_ATTEMPTS = int(os.getenv("WU3_POLL_MAX_ATTEMPTS", "12"))
+WU3_POLL_BATCH_SIZE = int(os.getenv("WU3_POLL_BATCH_SIZE", "50"))
+WU3_POLL_CONCURRENCY = int(os.getenv("WU3_POLL_CONCURRENCY", "5"))
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def poll_delay(attempts: int, base: float = WU3_POLL_INITIAL_DELAY_SECONDS, cap: float = WU3_POLL_MAX_DELAY_SECONDS) -> float:
+    """Atraso até a próxima consulta: exponencial limitado, com jitter (0.5x a 1.5x)"""
+    delay = min(cap, base * (2 ** max(0, attempts)))
+    return delay * random.uniform(0.5, 1.5)
+
+
+def first_poll_at() -> datetime:
+    """Momento da primeira consulta de um documento que ficou aguardando webhook"""
+    return _utcnow() + timedelta(seconds=poll_delay(0))
+
+
+def normalize_status_response(document_id: str, response: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Converte a resposta de status da Wu3 no formato de payload do webhook
+
+    Returns:
+        Payload para WebhookProcessor.apply_status_update, ou None se a consulta falhou
+    """
+    status = response.get("status")
+    if status in ("completed", "success"):
+        status = "complete"
+    # 'error' é falha da própria consulta (HTTP/rede) devolvida pelo cliente, não do documento
+    if status not in ("complete", "failed", "processing"):
+        return None
+
+    payload = {"document_id": document_id, "status": status}
+
+    for source, target in (
+        ("extracted_data", "extracted_data"),
+        ("confidence_score", "confidence_score"),
+        ("processing_time", "processing_time"),
+        ("error_message", "error_message"),
+        ("model_version", "wu3_version"),
+        ("wu3_version", "wu3_version")
+    ):
+        if source in response:
+            payload[target] = response[source]
+
+    return payload
+
+
+class Wu3StatusReconciler:
+    """
+    Consulta ativa de status para documentos 'processing' sem webhook
+
+    A cada rodada reserva um lote de documentos vencidos (índice parcial em
+    wu3_next_poll_at, FOR UPDATE SKIP LOCKED entre instâncias), já reagendando a
+    próxima consulta com backoff exponencial e jitter por documento. As consultas
+    rodam com concorrência limitada e passam pelo rate limiter do cliente Wu3.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        interval: float = WU3_POLL_INTERVAL_SECONDS,
+        batch_size: int = WU3_POLL_BATCH_SIZE,
+        concurrency: int = WU3_POLL_CONCURRENCY,
+        max_attempts: int = WU3_POLL_MAX_ATTEMPTS
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"rounds": 0, "polled": 0, "updated": 0, "still_processing": 0, "errors": 0, "timed_out": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Inicia o loop do reconciliador no event loop atual"""
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info("Reconciliador de status Wu3 iniciado")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                while await self.run_once() == self.batch_size:
+                    # Lote cheio: há mais documentos vencidos
+                    pass
+            except Exception as e:
+                logger.error(f"Erro no reconciliador de status Wu3: {str(e)}")
+
+            await asyncio.sleep(self.interval * random.uniform(0.8, 1.2))
+
+    async def claim_due_documents(self) -> List[Dict[str, Any]]:
+        """Reserva os documentos com consulta vencida, reagendando a próxima consulta"""
+        now = _utcnow()
+
+        async with self.session_factory() as db:
+            documents = (await db.execute(
+                select(Document).where(
+                    Document.status == 'processing',
+                    Document.webhook_received == False,  # noqa: E712 (predicado do índice parcial)
+                    Document.wu3_next_poll_at <= now
+                ).order_by(
+                    Document.wu3_next_poll_at
+                ).limit(self.batch_size).with_for_update(skip_locked=True)
+            )).scalars().all()
+
+            claimed = []
+            for document in documents:
+                attempts = document.wu3_poll_attempts + 1
+                document.wu3_poll_attempts = attempts
+                document.wu3_next_poll_at = now + timedelta(seconds=poll_delay(attempts))
+                claimed.append({
+                    "id": document.id,
+                    "wu3_document_id": document.wu3_document_id,
+                    "attempts": attempts
+                })
+
+            await db.commit()
+
+        return claimed
+
+    async def run_once(self) -> int:
+        """
+        Executa uma rodada de reconciliação
+
+        Returns:
+            Quantidade de documentos consultados
+        """
+        from wu3_client import wu3_client
+
+        if wu3_client.is_fallback_mode:
+            return 0
+
+        claimed = await self.claim_due_documents()
+        self.stats["rounds"] += 1
+        if not claimed:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def reconcile(entry: Dict[str, Any]):
+            async with semaphore:
+                await self._reconcile_document(entry)
+
+        await asyncio.gather(*(reconcile(entry) for entry in claimed))
+        logger.info(f"Reconciliador Wu3: {len(claimed)} documentos consultados")
+        return len(claimed)
+
+    async def _reconcile_document(self, entry: Dict[str, Any]):
+        from wu3_client import wu3_client
+        from webhook_service import WebhookProcessor
+
+        document_id = entry["id"]
+        payload = None
+
+        if entry["wu3_document_id"]:
+            self.stats["polled"] += 1
+            response = await wu3_client.get_document_status(entry["wu3_document_id"])
+            payload = normalize_status_response(document_id, response)
+
+        if payload is None:
+            self.stats["errors"] += 1
+        elif payload["status"] == 'processing':
+            self.stats["still_processing"] += 1
+
+        # Sem resultado final após o limite de consultas: marcar como falha
+        if (payload is None or payload["status"] == 'processing') and entry["attempts"] >= self.max_attempts:
+            self.stats["timed_out"] += 1
+            payload = {
+                "document_id": document_id,
+                "status": "failed",
+                "error_message": "Resultado da Wu3 não recebido (webhook ausente e consultas esgotadas)"
+            }
+
+        if payload is None or payload["status"] == 'processing':
+            return
+
+        try:
+            async with self.session_factory() as db:
+                await WebhookProcessor(db).apply_status_update(payload, from_webhook=False)
+            self.stats["updated"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Erro ao aplicar status reconciliado do documento {document_id}: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+            "concurrency": self.concurrency,
+            "max_attempts": self.max_attempts,
+            **self.stats
+        }
+
+
+# Instância global do reconciliador
+wu3_reconciler = Wu3StatusReconciler()
@@ -2,25 +2,43 @@
 Serviço de integração com IA Wu3 (mockado)
 Este módulo simula o processamento de documentos pela IA Wu3
 """
+import os
+import json
+import math
 import random
 import time
-from typing import Dict, Any
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional, List
 
-def process_document_with_wu3(document_id: str, file_path: str, document_type: str) -> Dict[str, Any]:
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def process_document_with_wu3(
+    document_id: str,
+    file_path: str,
+    document_type: str,
+    processing_time_seconds: Optional[float] = None
+) -> Dict[str, Any]:
     """
     Simula o processamento de um documento pela IA Wu3
     
+    Não aguarda nenhum tempo: a latência simulada é responsabilidade do
+    Wu3FallbackEngine, que usa asyncio.sleep e não bloqueia o event loop.
+    
     Args:
         document_id: ID único do documento
         file_path: Caminho do arquivo no sistema
         document_type: Tipo do documento (contract, invoice, etc.)
+        processing_time_seconds: Tempo de processamento a registrar nos metadados
     
     Returns:
         Dict com dados extraídos e score de confiança
     """
-    
-    # Simular tempo de processamento
-    time.sleep(random.uniform(0.5, 2.0))
+    if processing_time_seconds is None:
+        processing_time_seconds = random.uniform(0.5, 2.0)
     
     # Dados mockados baseados no tipo de documento
     mock_data = {
@@ -114,7 +132,7 @@ def process_document_with_wu3(document_id: str, file_path: str, document_type: s
     result["extracted_data"]["metadata"] = {
         "document_id": document_id,
         "processed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "processing_time_seconds": round(random.uniform(0.5, 2.0), 2),
+        "processing_time_seconds": round(processing_time_seconds, 2),
         "wu3_version": "2.1.0",
         "model_used": "wu3-document-analyzer-v2"
     }
@@ -190,3 +208,248 @@ def estimate_processing_time(file_path: str, document_type: str) -> float:
     
     return base_time + size_factor
 
+
+
+# Configurações do motor de simulação (fallback)
+WU3_FALLBACK_PROFILES = os.getenv("WU3_FALLBACK_PROFILES", "")  # JSON inline ou caminho de arquivo JSON
+WU3_FALLBACK_SEED = os.getenv("WU3_FALLBACK_SEED")
+WU3_FALLBACK_VERSION = "fallback-mock-2.1.0"
+
+# Perfil padrão: latência log-normal com mediana de 1.5s, sem falhas
+DEFAULT_FALLBACK_PROFILE = {
+    "latency": {"model": "lognormal", "median": 1.5, "sigma": 0.3},
+    "failure_rate": 0.0
+}
+
+
+class SimulatedWu3Failure(Exception):
+    """Falha sorteada pelo motor de simulação"""
+    pass
+
+
+class LatencyModel(ABC):
+    """Distribuição de latência simulada"""
+    
+    @abstractmethod
+    def sample(self, rng: random.Random) -> float:
+        """Sorteia uma latência em segundos"""
+    
+    @abstractmethod
+    def describe(self) -> Dict[str, Any]:
+        """Parâmetros da distribuição (para o status do motor de simulação)"""
+
+
+class FixedLatency(LatencyModel):
+    """Latência constante"""
+    
+    def __init__(self, seconds: float):
+        self.seconds = max(0.0, float(seconds))
+    
+    def sample(self, rng: random.Random) -> float:
+        return self.seconds
+    
+    def describe(self) -> Dict[str, Any]:
+        return {"model": "fixed", "seconds": self.seconds}
+
+
+class LognormalLatency(LatencyModel):
+    """Latência log-normal parametrizada pela mediana (cauda longa, como APIs reais)"""
+    
+    def __init__(self, median: float, sigma: float, max_seconds: Optional[float] = None):
+        self.median = float(median)
+        self.sigma = float(sigma)
+        self.max_seconds = max_seconds
+    
+    def sample(self, rng: random.Random) -> float:
+        value = rng.lognormvariate(math.log(self.median), self.sigma)
+        if self.max_seconds is not None:
+            value = min(value, self.max_seconds)
+        return value
+    
+    def describe(self) -> Dict[str, Any]:
+        return {"model": "lognormal", "median": self.median, "sigma": self.sigma, "max_seconds": self.max_seconds}
+
+
+class ReplayLatency(LatencyModel):
+    """
+    Reproduz tempos de processamento gravados (processing_time_seconds)
+    
+    As amostras podem vir da configuração ou ser carregadas do banco com
+    Wu3FallbackEngine.load_replay_samples. Sem amostras, usa o modelo de reserva.
+    """
+    
+    def __init__(self, samples: Optional[List[float]] = None, fallback: Optional[LatencyModel] = None):
+        self.samples = [float(sample) for sample in (samples or [])]
+        self.fallback = fallback or FixedLatency(1.0)
+    
+    def sample(self, rng: random.Random) -> float:
+        if not self.samples:
+            return self.fallback.sample(rng)
+        return rng.choice(self.samples)
+    
+    def describe(self) -> Dict[str, Any]:
+        return {"model": "replay", "samples": len(self.samples), "fallback": self.fallback.describe()}
+
+
+def build_latency_model(config: Dict[str, Any]) -> LatencyModel:
+    """
+    Cria modelo de latência a partir da configuração
+    
+    Exemplos:
+        {"model": "fixed", "seconds": 0.8}
+        {"model": "lognormal", "median": 1.2, "sigma": 0.5, "max_seconds": 10}
+        {"model": "replay", "samples": [1.1, 2.3]}  # ou sem samples: carregadas do banco
+    """
+    model = config.get("model", "lognormal")
+    
+    if model == "fixed":
+        return FixedLatency(config.get("seconds", 1.0))
+    
+    if model == "lognormal":
+        return LognormalLatency(config.get("median", 1.5), config.get("sigma", 0.3), config.get("max_seconds"))
+    
+    if model == "replay":
+        fallback_config = config.get("fallback", DEFAULT_FALLBACK_PROFILE["latency"])
+        return ReplayLatency(config.get("samples"), build_latency_model(fallback_config))
+    
+    raise ValueError(f"Modelo de latência desconhecido: {model}")
+
+
+class Wu3FallbackEngine:
+    """
+    Motor de simulação da Wu3 usado quando a API real não está configurada
+    
+    Latência e taxa de falha são configuráveis por tipo de documento através de
+    WU3_FALLBACK_PROFILES, por exemplo:
+    
+        {
+          "default": {"latency": {"model": "lognormal", "median": 1.5, "sigma": 0.3}},
+          "invoice": {"latency": {"model": "fixed", "seconds": 0.8}, "failure_rate": 0.02},
+          "financial": {"latency": {"model": "replay"}}
+        }
+    
+    A espera usa asyncio.sleep, portanto o event loop nunca é bloqueado.
+    """
+    
+    def __init__(self, profiles: Optional[Dict[str, Any]] = None, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self.profiles: Dict[str, Dict[str, Any]] = {}
+        
+        profiles = profiles or {}
+        default_config = {**DEFAULT_FALLBACK_PROFILE, **profiles.get("default", {})}
+        self.profiles["default"] = self._build_profile(default_config)
+        
+        for document_type, config in profiles.items():
+            if document_type != "default":
+                self.profiles[document_type] = self._build_profile({**default_config, **config})
+    
+    @staticmethod
+    def _build_profile(config: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "latency": build_latency_model(config.get("latency", DEFAULT_FALLBACK_PROFILE["latency"])),
+            "failure_rate": float(config.get("failure_rate", 0.0))
+        }
+    
+    def get_profile(self, document_type: str) -> Dict[str, Any]:
+        return self.profiles.get(document_type, self.profiles["default"])
+    
+    def needs_replay_samples(self) -> bool:
+        """Indica se algum perfil replay está sem amostras"""
+        return any(
+            isinstance(profile["latency"], ReplayLatency) and not profile["latency"].samples
+            for profile in self.profiles.values()
+        )
+    
+    async def load_replay_samples(self, db, limit_per_type: int = 1000):
+        """
+        Carrega tempos de processamento reais (documentos processados pela API Wu3)
+        para os perfis replay sem amostras configuradas
+        """
+        from sqlalchemy import select
+        from models import Document
+        
+        for document_type, profile in self.profiles.items():
+            latency = profile["latency"]
+            if not isinstance(latency, ReplayLatency) or latency.samples:
+                continue
+            
+            query = select(Document.processing_time_seconds).where(
+                Document.status == 'complete',
+                Document.processing_time_seconds.isnot(None),
+                Document.wu3_version != WU3_FALLBACK_VERSION
+            ).order_by(Document.created_at.desc()).limit(limit_per_type)
+            
+            if document_type != "default":
+                query = query.where(Document.document_type == document_type)
+            
+            rows = (await db.execute(query)).scalars().all()
+            
+            samples = []
+            for value in rows:
+                try:
+                    samples.append(float(value))
+                except (TypeError, ValueError):
+                    continue
+            
+            latency.samples = [sample for sample in samples if sample > 0]
+            logger.info(f"Replay Wu3 ({document_type}): {len(latency.samples)} amostras carregadas")
+    
+    async def process(self, file_path: str, document_type: str, document_id: str) -> Dict[str, Any]:
+        """
+        Simula o processamento de um documento sem bloquear o event loop
+        
+        Raises:
+            SimulatedWu3Failure: Quando a falha é sorteada pela taxa configurada
+        """
+        profile = self.get_profile(document_type)
+        latency = profile["latency"].sample(self.rng)
+        
+        await asyncio.sleep(latency)
+        
+        if profile["failure_rate"] > 0 and self.rng.random() < profile["failure_rate"]:
+            raise SimulatedWu3Failure(f"Falha simulada da Wu3 para documento tipo '{document_type}'")
+        
+        mock_result = process_document_with_wu3(document_id, file_path, document_type, latency)
+        
+        return {
+            "status": "complete",
+            "wu3_document_id": f"wu3_{document_id}",
+            "wu3_request_id": f"req_{int(time.time())}",
+            "extracted_data": mock_result["extracted_data"],
+            "confidence_score": mock_result["confidence_score"],
+            "wu3_version": WU3_FALLBACK_VERSION,
+            "processing_time_seconds": round(latency, 2),
+            "error_message": None
+        }
+    
+    def describe(self) -> Dict[str, Any]:
+        """Configuração efetiva de cada perfil (para diagnóstico)"""
+        return {
+            document_type: {
+                "latency": profile["latency"].describe(),
+                "failure_rate": profile["failure_rate"]
+            }
+            for document_type, profile in self.profiles.items()
+        }
+
+
+def load_fallback_profiles(raw: str = WU3_FALLBACK_PROFILES) -> Dict[str, Any]:
+    """Lê os perfis de simulação de JSON inline ou de um arquivo JSON"""
+    if not raw:
+        return {}
+    
+    try:
+        if os.path.isfile(raw):
+            with open(raw, "r", encoding="utf-8") as profiles_file:
+                return json.load(profiles_file)
+        return json.loads(raw)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"WU3_FALLBACK_PROFILES inválido, usando perfil padrão: {str(e)}")
+        return {}
+
+
+# Instância global do motor de simulação
+wu3_fallback_engine = Wu3FallbackEngine(
+    load_fallback_profiles(),
+    seed=int(WU3_FALLBACK_SEED) if WU3_FALLBACK_SEED else None
+)
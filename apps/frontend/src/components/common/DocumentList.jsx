@@ -6,6 +6,8 @@ const DocumentList = ({ refreshTrigger }) => {
   const { authenticatedFetch } = useAuth();
   const [documents, setDocuments] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedDocument, setSelectedDocument] = useState(null);
   const [showInsightsModal, setShowInsightsModal] = useState(false);
 
@@ -93,6 +95,7 @@ const DocumentList = ({ refreshTrigger }) => {
 
       const data = await response.json();
       setDocuments(data.documents || []);
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       console.error('Erro ao carregar documentos:', error);
     } finally {
@@ -100,6 +103,27 @@ const DocumentList = ({ refreshTrigger }) => {
     }
   };
 
+  const fetchMoreDocuments = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await authenticatedFetch(
+        `http://localhost:8000/api/documents?cursor=${encodeURIComponent(nextCursor)}`
+      );
+      
+      if (!response.ok) {
+        throw new Error('Erro ao carregar documentos');
+      }
+
+      const data = await response.json();
+      setDocuments((current) => [...current, ...(data.documents || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error('Erro ao carregar mais documentos:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleViewDetails = async (documentId) => {
     try {
       const response = await authenticatedFetch(`http://localhost:8000/api/documents/${documentId}`);
@@ -204,7 +228,7 @@ const DocumentList = ({ refreshTrigger }) => {
         <div className="px-6 py-4 border-b border-gray-200">
           <h3 className="text-lg font-medium text-gray-900">Documentos Processados</h3>
           <p className="text-sm text-gray-500">
-            {documents.length} documento(s) encontrado(s)
+            {documents.length}{nextCursor ? '+' : ''} documento(s) encontrado(s)
           </p>
         </div>
 
@@ -301,6 +325,17 @@ const DocumentList = ({ refreshTrigger }) => {
                 ))}
               </tbody>
             </table>
+            {nextCursor && (
+              <div className="px-6 py-4 border-t border-gray-200 text-center">
+                <button
+                  onClick={fetchMoreDocuments}
+                  disabled={loadingMore}
+                  className="text-sm font-medium text-blue-600 hover:text-blue-900 disabled:opacity-50"
+                >
+                  {loadingMore ? 'Carregando...' : 'Carregar mais'}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>